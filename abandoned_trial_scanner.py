@@ -4,7 +4,8 @@ import requests
 from datetime import date
 from dotenv import load_dotenv
 
-from db import execute
+import aggregates
+from db import execute, get_conn
 
 load_dotenv()
 
@@ -188,6 +189,10 @@ def main():
 
     print(f"\nDone. Upserted {inserted_or_updated} trials. Abandoned statuses found: {abandoned_count}")
 
+    with get_conn() as conn:
+        aggregates.refresh(conn, ["sponsor_status_counts", "drug_trial_counts"])
+    print("Refreshed sponsor/drug aggregates.")
+
 if __name__ == "__main__":
     main()
 
@@ -11,6 +11,8 @@ Env:
   OPENAI_API_KEY
   SIGNAL_BATCH (default 25)
   SIGNAL_MODEL (default gpt-4.1-mini)
+  SIGNAL_PROMPT_BATCH (default PROMPT_BATCH_MAX; articles per request, 1 = off)
+  SIGNAL_MODE (default sync; batch = submit/ingest via the OpenAI Batch API)
 """
 
 import os
@@ -22,13 +24,23 @@ import psycopg
 from dotenv import load_dotenv
 from openai import OpenAI
 
+from agents import batch_api, schemas
+from agents.batching import PROMPT_BATCH_MAX, run_batched
+from agents.llm_cache import Scope, prompt_version
+from agents.prompting import compact_abstract, compact_json
+import page_cache
+import paper_docs
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "").strip()  # e.g. mock_llm_server.py
 
 BATCH = int(os.getenv("SIGNAL_BATCH", "25"))
 MODEL = os.getenv("SIGNAL_MODEL", "gpt-4.1-mini").strip()
+SIGNAL_MODE = os.getenv("SIGNAL_MODE", "sync").strip()
+PROMPT_BATCH = int(os.getenv("SIGNAL_PROMPT_BATCH", str(PROMPT_BATCH_MAX)))
 AGENT_VERSION = "signals-v1"
 CLAWBOT_NAME = "signals"
 
@@ -37,7 +49,7 @@ if not DATABASE_URL:
 if not OPENAI_API_KEY:
     raise SystemExit("Missing OPENAI_API_KEY")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None)
 
 SYSTEM = (
     "You are a biomedical research triage agent. "
@@ -57,16 +69,17 @@ SCHEMA = {
     "tags": "array of short strings (3-12)"
 }
 
+CACHE = Scope(MODEL, prompt_version(SYSTEM, json.dumps(SCHEMA, sort_keys=True), json.dumps(schemas.SIGNALS, sort_keys=True)))
+
 def stable_hash(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
 
-def prompt_for(title: str, abstract: str | None) -> str:
-    abstract = (abstract or "").strip()
+def instructions() -> str:
     return f"""
 Extract structured signals from this article for a Parkinson's/Alzheimer's discovery dashboard.
 
 JSON schema (must match exactly):
-{json.dumps(SCHEMA, indent=2)}
+{compact_json(SCHEMA)}
 
 Rules:
 - summary_1_sentence: one sentence, plain English, <= 240 characters.
@@ -76,6 +89,12 @@ Rules:
 - abandoned_trial_flag: true if indicates halted/terminated/withdrawn/failed trial or sponsor abandonment.
 - novelty_score: 0-100 (higher = more novel claim/mechanism/approach).
 - neglected_score: 0-100 (higher = overlooked/under-discussed "hidden gem" potential).
+""".strip()
+
+def prompt_for(title: str, abstract: str | None) -> str:
+    abstract = compact_abstract(abstract)
+    return f"""
+{instructions()}
 
 Article:
 Title: {title}
@@ -160,23 +179,157 @@ SET finished_at = now(), status='error', items_processed=%s, error=%s
 WHERE id=%s;
 """
 
-def parse_json_strict(content: str) -> dict:
-    content = content.strip()
-    try:
-        return json.loads(content)
-    except Exception:
-        # salvage if wrapped
-        start = content.find("{")
-        end = content.rfind("}")
-        if start == -1 or end == -1:
+def validate_signals(data: dict) -> dict:
+    return schemas.validate(schemas.SIGNALS, data)
+
+def messages_for(user_prompt: str) -> list[dict]:
+    return [
+        {"role": "system", "content": SYSTEM},
+        {"role": "user", "content": user_prompt},
+    ]
+
+def request_body(user_prompt: str) -> dict:
+    return schemas.request_body("chat", MODEL, messages_for(user_prompt), schemas.SIGNALS, temperature=0.2)
+
+def call_batch_model(user_prompt: str) -> str:
+    body = schemas.request_body(
+        "chat", MODEL, messages_for(user_prompt), schemas.batch_schema(schemas.SIGNALS), temperature=0.2,
+    )
+    return schemas.send(client, "chat", body)
+
+def signals_for(title: str, abstract: str | None) -> dict:
+    user_prompt = prompt_for(title, abstract)
+    return CACHE.call(user_prompt, lambda: schemas.complete(
+        client,
+        api="chat",
+        model=MODEL,
+        schema=schemas.SIGNALS,
+        system=SYSTEM,
+        user=user_prompt,
+        temperature=0.2,
+    ))
+
+def signals_batch(rows: list[tuple]) -> tuple[dict, dict]:
+    """
+    Extract signals for several (article_id, title, abstract) rows per request.
+    Returns (results, errors) keyed by str(article_id).
+    """
+    def render(row):
+        _, title, abstract = row
+        abstract = compact_abstract(abstract)
+        return {"title": title or "", "abstract": abstract if abstract else "(no abstract provided)"}
+
+    return run_batched(
+        rows,
+        key=lambda row: str(row[0]),
+        render=render,
+        call=call_batch_model,
+        validate=validate_signals,
+        single=lambda row: signals_for(row[1], row[2]),
+        header=instructions(),
+        max_items=PROMPT_BATCH,
+        cache=CACHE,
+        cache_text=lambda row: prompt_for(row[1], row[2]),
+    )
+
+def build_payload(article_id: int, data: dict, phash: str) -> dict:
+    # data is already validated + clamped against schemas.SIGNALS
+    return {
+        "article_id": article_id,
+        "summary_1_sentence": data["summary_1_sentence"],
+        "mechanism_of_action": data["mechanism_of_action"],
+        "sponsor_name": data["sponsor_name"],
+        "repurpose_flag": data["repurpose_flag"],
+        "natural_compound_flag": data["natural_compound_flag"],
+        "abandoned_trial_flag": data["abandoned_trial_flag"],
+        "novelty_score": data["novelty_score"],
+        "neglected_score": data["neglected_score"],
+        "tags": json.dumps(data["tags"]),
+        "agent_version": AGENT_VERSION,
+        "model_name": MODEL,
+        "prompt_hash": phash,
+        "confidence": 0.75,  # v1 constant; later compute
+    }
+
+def save_signals(cur, article_id: int, payload: dict) -> list[int]:
+    """
+    Upsert one article's signals and rebuild its paper document; returns
+    the pmids to drop from the page cache after commit.
+    """
+    cur.execute(UPSERT_SIGNALS, payload)
+    return paper_docs.rebuild(cur, ids=[article_id])
+
+BATCH_KIND = "signals"
+
+FETCH_BATCH_UNQUEUED = f"""
+SELECT a.id, a.title, a.abstract
+FROM articles a
+LEFT JOIN paper_signals ps ON ps.article_id = a.id
+WHERE ps.article_id IS NULL
+  AND {batch_api.in_flight_sql("a.id")}
+ORDER BY a.id DESC
+LIMIT %s;
+"""
+
+def ingest_batch_result(cur, custom_id: str, text: str):
+    """
+    Upsert one Batch API result (ON CONFLICT makes re-ingesting harmless).
+    """
+    article_id = int(custom_id)
+    data = validate_signals(schemas.parse_json(text))
+    cur.execute("SELECT title, abstract FROM articles WHERE id = %s", (article_id,))
+    row = cur.fetchone()
+    if not row:
+        raise LookupError(f"article {article_id} no longer exists")
+    phash = stable_hash(prompt_for(row[0], row[1]))
+    return save_signals(cur, article_id, build_payload(article_id, data, phash))
+
+def main_batch():
+    """
+    Ingest finished Batch API jobs, then submit the next slice of articles
+    missing signals. Results arrive on a later run.
+    """
+    backend = batch_api.get_backend(client)
+    pmids = []
+
+    with psycopg.connect(DATABASE_URL) as conn:
+        paper_docs.ensure_schema(conn)
+        run_id = conn.execute(INSERT_RUN, (CLAWBOT_NAME,)).fetchone()[0]
+        conn.commit()
+
+        def ingest(cur, custom_id: str, text: str):
+            pmids.extend(ingest_batch_result(cur, custom_id, text))
+
+        def build_requests():
+            rows = conn.execute(FETCH_BATCH_UNQUEUED, (BATCH_KIND, BATCH)).fetchall()
+            return [(str(aid), request_body(prompt_for(title, abstract))) for (aid, title, abstract) in rows]
+
+        try:
+            counts = batch_api.run_cycle(
+                conn, backend, BATCH_KIND, "/v1/chat/completions", ingest, build_requests,
+            )
+            conn.execute(FINISH_RUN_OK, (counts["ingested"], run_id))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            err = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+            conn.execute(FINISH_RUN_ERR, (0, err[:8000], run_id))
+            conn.commit()
             raise
-        return json.loads(content[start:end+1])
+    page_cache.invalidate(pmids)
+
+    print(
+        f"signals batch: ingested {counts['ingested']}, failed {counts['failed']}, "
+        f"open jobs {counts['open']}, submitted {counts['submitted']} (batch_id={counts['batch_id']})"
+    )
 
 def main():
     processed = 0
     run_id = None
+    pmids = []
 
     with psycopg.connect(DATABASE_URL) as conn:
+        paper_docs.ensure_schema(conn)
         # start run log
         run_id = conn.execute(INSERT_RUN, (CLAWBOT_NAME,)).fetchone()[0]
         conn.commit()
@@ -191,48 +344,29 @@ def main():
 
             print(f"Found {len(rows)} articles missing signals. Processing...")
 
-            for (article_id, title, abstract) in rows:
-                user_prompt = prompt_for(title, abstract)
-                phash = stable_hash(user_prompt)
-
-                resp = client.chat.completions.create(
-                    model=MODEL,
-                    messages=[
-                        {"role": "system", "content": SYSTEM},
-                        {"role": "user", "content": user_prompt},
-                    ],
-                    temperature=0.2,
-                )
-
-                content = resp.choices[0].message.content or ""
-                data = parse_json_strict(content)
-
-                # normalize
-                tags = data.get("tags", [])
-                if not isinstance(tags, list):
-                    tags = []
-
-                payload = {
-                    "article_id": article_id,
-                    "summary_1_sentence": data.get("summary_1_sentence"),
-                    "mechanism_of_action": data.get("mechanism_of_action"),
-                    "sponsor_name": data.get("sponsor_name"),
-                    "repurpose_flag": bool(data.get("repurpose_flag", False)),
-                    "natural_compound_flag": bool(data.get("natural_compound_flag", False)),
-                    "abandoned_trial_flag": bool(data.get("abandoned_trial_flag", False)),
-                    "novelty_score": int(max(0, min(100, data.get("novelty_score", 0) or 0))),
-                    "neglected_score": int(max(0, min(100, data.get("neglected_score", 0) or 0))),
-                    "tags": json.dumps(tags[:20]),
-                    "agent_version": AGENT_VERSION,
-                    "model_name": MODEL,
-                    "prompt_hash": phash,
-                    "confidence": 0.75,  # v1 constant; later compute
-                }
-
-                conn.execute(UPSERT_SIGNALS, payload)
-                conn.commit()
-                processed += 1
-                print(f"✅ signals saved for article_id={article_id}")
+            if PROMPT_BATCH > 1:
+                results, errors = signals_batch(rows)
+                for (article_id, title, abstract) in rows:
+                    data = results.get(str(article_id))
+                    if data is None:
+                        print(f"❌ signals failed for article_id={article_id}: {errors.get(str(article_id))}")
+                        continue
+                    phash = stable_hash(prompt_for(title, abstract))
+                    with conn.cursor() as cur:
+                        pmids += save_signals(cur, article_id, build_payload(article_id, data, phash))
+                    conn.commit()
+                    processed += 1
+                    print(f"✅ signals saved for article_id={article_id}")
+            else:
+                for (article_id, title, abstract) in rows:
+                    phash = stable_hash(prompt_for(title, abstract))
+                    data = signals_for(title, abstract)
+
+                    with conn.cursor() as cur:
+                        pmids += save_signals(cur, article_id, build_payload(article_id, data, phash))
+                    conn.commit()
+                    processed += 1
+                    print(f"✅ signals saved for article_id={article_id}")
 
             conn.execute(FINISH_RUN_OK, (processed, run_id))
             conn.commit()
@@ -242,7 +376,10 @@ def main():
             conn.execute(FINISH_RUN_ERR, (processed, err[:8000], run_id))
             conn.commit()
             raise
+    page_cache.invalidate(pmids)
 
 if __name__ == "__main__":
-    main()
-
+    if SIGNAL_MODE == "batch":
+        main_batch()
+    else:
+        main()
@@ -1,49 +1,59 @@
 #!/usr/bin/env python3
 import os
+import json
 import psycopg
 from dotenv import load_dotenv
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
 
-def run(limit: int = 200):
-    if not DATABASE_URL:
-        raise SystemExit("ERROR: DATABASE_URL not set")
-
-    processed = 0
-
-    with psycopg.connect(DATABASE_URL) as conn:
-        with conn.cursor() as cur:
-            while processed < limit:
-                # get next unprocessed row
-                cur.execute("""
-                    SELECT id, pmid, title
-                    FROM public.articles
-                    WHERE agent_status IS NULL
-                    ORDER BY created_at ASC, id ASC
-                    LIMIT 1
-                    FOR UPDATE SKIP LOCKED
-                """)
-                row = cur.fetchone()
-                if not row:
-                    print(f"Done. No more unprocessed rows. processed={processed}")
-                    break
-
-                article_id, pmid, title = row
-
-                # mark as checked
-                cur.execute("""
-                    UPDATE public.articles
-                    SET agent_status = 'checked',
-                        agent_checked_at = NOW(),
-                        updated_at = NOW()
-                    WHERE id = %s
-                """, (article_id,))
-                conn.commit()
-
-                processed += 1
-                print(f"[{processed}] checked id={article_id} pmid={pmid} title={(title or '')[:120]}")
+# Claim and mark up to N unprocessed rows in one statement.
+SWEEP_SQL = """
+UPDATE public.articles
+SET agent_status = 'checked',
+    agent_checked_at = NOW(),
+    updated_at = NOW()
+WHERE id IN (
+    SELECT id
+    FROM public.articles
+    WHERE agent_status IS NULL
+    ORDER BY created_at ASC, id ASC
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id, pmid, title
+"""
+
+def run(limit: int = 200, conn: psycopg.Connection | None = None, verbose: bool = True) -> dict:
+    """
+    Mark up to `limit` unprocessed rows as checked.
+
+    Pass an open `conn` to reuse a long-lived connection (alz_agent_runner);
+    otherwise a connection is opened for this run only.
+    Returns {"processed": n, "limit": limit, "drained": bool} where drained
+    means fewer than `limit` rows were waiting.
+    """
+    if conn is None:
+        if not DATABASE_URL:
+            raise SystemExit("ERROR: DATABASE_URL not set")
+        with psycopg.connect(DATABASE_URL) as own_conn:
+            return run(limit=limit, conn=own_conn, verbose=verbose)
+
+    with conn.cursor() as cur:
+        cur.execute(SWEEP_SQL, (limit,))
+        rows = cur.fetchall()
+    conn.commit()
+
+    if verbose:
+        for i, (article_id, pmid, title) in enumerate(rows, 1):
+            print(f"[{i}] checked id={article_id} pmid={pmid} title={(title or '')[:120]}")
+
+    return {"processed": len(rows), "limit": limit, "drained": len(rows) < limit}
 
 if __name__ == "__main__":
-    run(limit=int(os.getenv("AGENT_LIMIT", "200")))
-
+    result = run(
+        limit=int(os.getenv("AGENT_LIMIT", "200")),
+        verbose=os.getenv("SWEEP_VERBOSE", "0") == "1",
+    )
+    # one JSON line so cron wrappers can parse the counts
+    print(json.dumps({"step": "sweep", **result}))
@@ -1,29 +1,35 @@
 #!/usr/bin/env python3
-import os, json, time, sys
+import os, sys
+from concurrent.futures import ThreadPoolExecutor
 import psycopg
 from dotenv import load_dotenv
 from openai import OpenAI
 
+from agents import schemas
+from agents.prompting import compact_abstract, compact_json
+import llm_gate
+import page_cache
+import paper_docs
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "").strip()  # e.g. mock_llm_server.py
 MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1-mini").strip()
 
 # Safety knobs
 AGENT_LIMIT = int(os.getenv("AGENT_LIMIT", "10"))          # how many rows per run
-SLEEP_SECONDS = float(os.getenv("AGENT_SLEEP", "0.2"))     # small pause between calls
 MIN_TEXT = int(os.getenv("AGENT_MIN_TEXT", "40"))          # skip rows with too-little content
+AGENT_MODE = os.getenv("AGENT_MODE", "serial").strip()     # serial | batch
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "4"))       # concurrent LLM calls in batch mode
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None)
 
 def die(msg: str, code: int = 1):
     print(msg, file=sys.stderr)
     raise SystemExit(code)
 
-def clamp(x: float, lo: float = 0.0, hi: float = 100.0) -> float:
-    return max(lo, min(hi, x))
-
 def llm_score_and_summary(title: str, abstract: str, ingest_score):
     """
     Returns (agent_score: float, summary_1s: str)
@@ -37,7 +43,7 @@ def llm_score_and_summary(title: str, abstract: str, ingest_score):
         "task": "Score the paper's importance for ALZ/PD drug discovery and write a single-sentence summary.",
         "inputs": {
             "title": title or "",
-            "abstract": abstract or "",
+            "abstract": compact_abstract(abstract),
             "ingest_score": ingest_score,
         },
         "scoring_rubric": [
@@ -48,19 +54,17 @@ def llm_score_and_summary(title: str, abstract: str, ingest_score):
         "output_format": {"agent_score": 0, "summary_1s": "..." }
     }
 
-    resp = client.chat.completions.create(
+    data = schemas.complete(
+        client,
+        api="chat",
         model=MODEL,
+        schema=schemas.STEP4_SCORE,
+        system=system,
+        user=compact_json(user_obj),
         temperature=0.2,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": json.dumps(user_obj)},
-        ],
-        response_format={"type": "json_object"},
     )
-
-    data = json.loads(resp.choices[0].message.content)
-    agent_score = clamp(float(data.get("agent_score", 0)))
-    summary_1s = (data.get("summary_1s", "") or "").strip()
+    agent_score = float(data["agent_score"])
+    summary_1s = data["summary_1s"]
 
     # Keep summary short-ish
     if len(summary_1s) > 240:
@@ -68,12 +72,28 @@ def llm_score_and_summary(title: str, abstract: str, ingest_score):
 
     return agent_score, summary_1s
 
+# Columns returned by the fetch/claim queries, in order
+ROW_FIELDS = ("id", "title", "abstract", "score", "base_score", "journal", "publication_date", "publication_types", "gate_released_at")
+
+def text_length(row) -> int:
+    return len((row[1] or "").strip()) + len((row[2] or "").strip())
+
+def split_gated(rows: list[tuple]) -> tuple[list[tuple], list[tuple]]:
+    """
+    llm_gate.split() for fetched/claimed tuples: (rows for the LLM, gated
+    tuples for llm_gate.mark_gated()). Rows with too little text are left
+    to the caller, which marks them as errors.
+    """
+    _, gated = llm_gate.split([dict(zip(ROW_FIELDS, r)) for r in rows if text_length(r) >= MIN_TEXT])
+    gated_ids = {g[0] for g in gated}
+    return [r for r in rows if r[0] not in gated_ids], gated
+
 def fetch_one_to_score(cur):
     """
     Grab 1 row ready for LLM scoring.
     """
     cur.execute("""
-        SELECT id, title, abstract, score
+        SELECT id, title, abstract, score, base_score, journal, publication_date, publication_types, gate_released_at
         FROM public.articles
         WHERE agent_status = 'checked'
           AND agent_score IS NULL
@@ -101,6 +121,7 @@ def mark_scored(cur, article_id: int, agent_score: float, summary_1s: str):
             updated_at = NOW()
         WHERE id = %s
     """, (agent_score, summary_1s, article_id))
+    return paper_docs.rebuild(cur, ids=[article_id])
 
 def mark_error(cur, article_id: int, err: str):
     cur.execute("""
@@ -111,56 +132,212 @@ def mark_error(cur, article_id: int, err: str):
         WHERE id = %s
     """, (err[:2000], article_id))
 
-def main():
+CLAIM_BATCH = """
+UPDATE public.articles
+SET agent_status = 'processing',
+    agent_last_error = NULL,
+    updated_at = NOW()
+WHERE id IN (
+    SELECT id
+    FROM public.articles
+    WHERE agent_status = 'checked'
+      AND agent_score IS NULL
+    ORDER BY agent_checked_at ASC NULLS LAST, id ASC
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id, title, abstract, score, base_score, journal, publication_date, publication_types, gate_released_at
+"""
+
+# One statement for the whole batch: status is 'scored' or 'error' per row.
+WRITE_BATCH = """
+UPDATE public.articles a
+SET agent_score = v.agent_score,
+    summary_1s = COALESCE(v.summary_1s, a.summary_1s),
+    agent_status = v.agent_status,
+    agent_last_error = v.agent_last_error,
+    updated_at = NOW()
+FROM unnest(%s::bigint[], %s::float8[], %s::text[], %s::text[], %s::text[])
+    AS v(id, agent_score, summary_1s, agent_status, agent_last_error)
+WHERE a.id = v.id
+"""
+
+# Hands claimed rows back so the next run picks them up
+RELEASE_BATCH = """
+UPDATE public.articles
+SET agent_status = 'checked'
+WHERE id = ANY(%s)
+  AND agent_status = 'processing'
+"""
+
+def claim_batch(conn, limit: int) -> list[tuple]:
+    """
+    Claim up to `limit` checked rows and mark them processing in one transaction.
+    """
+    with conn.cursor() as cur:
+        cur.execute(CLAIM_BATCH, (limit,))
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+def score_claimed(row) -> tuple:
+    """
+    Returns (id, agent_score, summary_1s, status, error) for one claimed row.
+    """
+    article_id, title, abstract, ingest_score = row[:4]
+    title = title or ""
+    abstract = abstract or ""
+
+    text_len = text_length(row)
+    if text_len < MIN_TEXT:
+        return (article_id, None, None, "error", f"Too little text to score (len={text_len}).")
+
+    try:
+        agent_score, summary_1s = llm_score_and_summary(title, abstract, ingest_score)
+        return (article_id, agent_score, summary_1s, "scored", None)
+    except Exception as e:
+        return (article_id, None, None, "error", str(e)[:2000])
+
+def write_batch(conn, results: list[tuple], gated: list[tuple] = ()):
+    if not results and not gated:
+        return
+    with conn.cursor() as cur:
+        if results:
+            cur.execute(WRITE_BATCH, [list(c) for c in zip(*results)])
+        llm_gate.mark_gated(cur, gated)
+        ids = [r[0] for r in results if r[3] == "scored"] + [g[0] for g in gated]
+        pmids = paper_docs.rebuild(cur, ids=ids)
+    conn.commit()
+    page_cache.invalidate(pmids)
+
+def run_batched(conn, limit: int = AGENT_LIMIT, workers: int = AGENT_WORKERS, verbose: bool = True) -> dict:
+    """
+    Claim `limit` rows at once, score them concurrently and write every result
+    back in a single UPDATE. Same return shape as run().
+    """
+    rows = claim_batch(conn, limit)
+    if not rows:
+        if verbose:
+            print("Done. No more rows ready for scoring. processed=0")
+        return {"scored": 0, "skipped": 0, "errors": 0, "processed": 0}
+
+    try:
+        to_score, gated = split_gated(rows)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            results = list(pool.map(score_claimed, to_score))
+        write_batch(conn, results, gated)
+    except BaseException:
+        # Anything after the claim (LLM calls or the write itself) releases the rows
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(RELEASE_BATCH, ([r[0] for r in rows],))
+        conn.commit()
+        raise
+
+    result = {"scored": 0, "skipped": len(gated), "errors": 0, "processed": len(rows)}
+    if gated and verbose:
+        print(f"[skip] gated {len(gated)} ({llm_gate.summarize(gated)})")
+    for article_id, agent_score, summary_1s, status, err in results:
+        if status == "scored":
+            result["scored"] += 1
+            if verbose:
+                print(f"[batch] scored id={article_id} agent_score={agent_score}")
+                print(f"     summary_1s: {summary_1s}")
+        elif err and err.startswith("Too little text"):
+            result["skipped"] += 1
+            if verbose:
+                print(f"[skip] id={article_id} {err}")
+        else:
+            result["errors"] += 1
+            print(f"[error] id={article_id} {err}", file=sys.stderr)
+
+    return result
+
+def check_env():
     if not DATABASE_URL:
         die("ERROR: DATABASE_URL not set.")
     if not OPENAI_API_KEY:
         die("ERROR: OPENAI_API_KEY not set.")
 
-    processed = 0
+def run(conn, limit: int = AGENT_LIMIT, verbose: bool = True) -> dict:
+    """
+    Score up to `limit` checked rows on an open connection.
+    Returns {"scored": n, "skipped": n, "errors": n, "processed": n}.
+    """
+    result = {"scored": 0, "skipped": 0, "errors": 0, "processed": 0}
+
+    with conn.cursor() as cur:
+        while result["processed"] < limit:
+            row = fetch_one_to_score(cur)
+            if not row:
+                conn.commit()
+                if verbose:
+                    print(f"Done. No more rows ready for scoring. processed={result['processed']}")
+                break
 
-    with psycopg.connect(DATABASE_URL) as conn:
-        with conn.cursor() as cur:
-            while processed < AGENT_LIMIT:
-                row = fetch_one_to_score(cur)
-                if not row:
-                    print(f"Done. No more rows ready for scoring. processed={processed}")
-                    break
-
-                article_id, title, abstract, ingest_score = row
-                title = title or ""
-                abstract = abstract or ""
-
-                text_len = len(title.strip()) + len(abstract.strip())
-                if text_len < MIN_TEXT:
-                    # Not enough content to justify LLM cost; mark as error-like but non-fatal
-                    mark_error(cur, article_id, f"Too little text to score (len={text_len}).")
-                    conn.commit()
-                    processed += 1
+            article_id, title, abstract, ingest_score = row[:4]
+            title = title or ""
+            abstract = abstract or ""
+
+            text_len = text_length(row)
+            if text_len < MIN_TEXT:
+                # Not enough content to justify LLM cost; mark as error-like but non-fatal
+                mark_error(cur, article_id, f"Too little text to score (len={text_len}).")
+                conn.commit()
+                result["skipped"] += 1
+                result["processed"] += 1
+                if verbose:
                     print(f"[skip] id={article_id} len={text_len} (marked error)")
-                    continue
+                continue
+
+            _, gated = split_gated([row])
+            if gated:
+                llm_gate.mark_gated(cur, gated)
+                pmids = paper_docs.rebuild(cur, ids=[article_id])
+                conn.commit()
+                page_cache.invalidate(pmids)
+                result["skipped"] += 1
+                result["processed"] += 1
+                if verbose:
+                    print(f"[skip] id={article_id} {gated[0][1]}")
+                continue
 
-                try:
-                    mark_processing(cur, article_id)
-                    conn.commit()
+            try:
+                mark_processing(cur, article_id)
+                conn.commit()
 
-                    agent_score, summary_1s = llm_score_and_summary(title, abstract, ingest_score)
+                agent_score, summary_1s = llm_score_and_summary(title, abstract, ingest_score)
 
-                    mark_scored(cur, article_id, agent_score, summary_1s)
-                    conn.commit()
+                pmids = mark_scored(cur, article_id, agent_score, summary_1s)
+                conn.commit()
+                page_cache.invalidate(pmids)
 
-                    processed += 1
-                    print(f"[{processed}] scored id={article_id} ingest_score={ingest_score} agent_score={agent_score}")
+                result["scored"] += 1
+                result["processed"] += 1
+                if verbose:
+                    print(f"[{result['processed']}] scored id={article_id} ingest_score={ingest_score} agent_score={agent_score}")
                     print(f"     summary_1s: {summary_1s}")
 
-                    time.sleep(SLEEP_SECONDS)
+            except Exception as e:
+                conn.rollback()
+                mark_error(cur, article_id, str(e))
+                conn.commit()
+                result["errors"] += 1
+                result["processed"] += 1
+                print(f"[error] id={article_id} {e}", file=sys.stderr)
 
-                except Exception as e:
-                    mark_error(cur, article_id, str(e))
-                    conn.commit()
-                    processed += 1
-                    print(f"[error] id={article_id} {e}", file=sys.stderr)
+    return result
+
+def main():
+    check_env()
+
+    with psycopg.connect(DATABASE_URL) as conn:
+        llm_gate.ensure_schema(conn)
+        paper_docs.ensure_schema(conn)
+        if AGENT_MODE == "batch":
+            run_batched(conn, limit=AGENT_LIMIT)
+        else:
+            run(conn, limit=AGENT_LIMIT)
 
 if __name__ == "__main__":
     main()
-
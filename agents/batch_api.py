@@ -0,0 +1,330 @@
+"""
+OpenAI Batch API jobs for backlog scoring.
+
+Requests are written to a JSONL file, submitted as one batch job and tracked
+in public.llm_batch_jobs / public.llm_batch_items. When a job completes, its
+output file is handed to the owning pipeline's ingest function inside one
+transaction together with the job's ingested_at stamp, so a crashed ingest
+simply runs again.
+
+LocalBatchBackend mirrors the endpoint on the filesystem (LLM_BATCH_DIR) so
+the submit -> poll -> ingest cycle can be exercised offline.
+"""
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+
+from . import ratelimit
+
+LLM_BATCH_BACKEND = os.getenv("LLM_BATCH_BACKEND", "openai").strip()   # openai | local
+LLM_BATCH_DIR = os.getenv("LLM_BATCH_DIR", "batches").strip()
+LLM_BATCH_WINDOW = os.getenv("LLM_BATCH_WINDOW", "24h").strip()
+
+# Job states that will never produce an output file
+DEAD_STATES = ("failed", "expired", "cancelled")
+
+ENSURE_TABLES = """
+CREATE TABLE IF NOT EXISTS public.llm_batch_jobs (
+    id           BIGSERIAL PRIMARY KEY,
+    kind         TEXT NOT NULL,
+    backend      TEXT NOT NULL,
+    batch_id     TEXT NOT NULL UNIQUE,
+    endpoint     TEXT NOT NULL,
+    input_path   TEXT,
+    item_count   INTEGER NOT NULL DEFAULT 0,
+    status       TEXT NOT NULL DEFAULT 'submitted',
+    error        TEXT,
+    created_at   TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at   TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    ingested_at  TIMESTAMPTZ
+);
+
+CREATE TABLE IF NOT EXISTS public.llm_batch_items (
+    batch_id  TEXT NOT NULL REFERENCES public.llm_batch_jobs(batch_id) ON DELETE CASCADE,
+    item_key  TEXT NOT NULL,
+    PRIMARY KEY (batch_id, item_key)
+);
+
+CREATE INDEX IF NOT EXISTS llm_batch_items_key_idx ON public.llm_batch_items (item_key);
+"""
+
+INSERT_JOB = """
+INSERT INTO public.llm_batch_jobs (kind, backend, batch_id, endpoint, input_path, item_count)
+VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+INSERT_ITEMS = """
+INSERT INTO public.llm_batch_items (batch_id, item_key)
+SELECT %s, unnest(%s::text[])
+ON CONFLICT DO NOTHING
+"""
+
+OPEN_JOBS = """
+SELECT batch_id, backend, endpoint
+FROM public.llm_batch_jobs
+WHERE kind = %s
+  AND ingested_at IS NULL
+  AND status NOT IN ('failed', 'expired', 'cancelled')
+ORDER BY id
+"""
+
+SET_STATUS = """
+UPDATE public.llm_batch_jobs
+SET status = %s, error = %s, updated_at = NOW()
+WHERE batch_id = %s
+"""
+
+MARK_INGESTED = """
+UPDATE public.llm_batch_jobs
+SET status = 'ingested', ingested_at = NOW(), updated_at = NOW(), error = %s
+WHERE batch_id = %s
+"""
+
+
+def in_flight_sql(column: str) -> str:
+    """
+    SQL predicate that is true when `column` is NOT part of a pending job of
+    the kind bound to the single %s placeholder.
+    """
+    return f"""
+    NOT EXISTS (
+        SELECT 1
+        FROM public.llm_batch_items i
+        JOIN public.llm_batch_jobs j ON j.batch_id = i.batch_id
+        WHERE j.kind = %s
+          AND j.ingested_at IS NULL
+          AND j.status NOT IN ('failed', 'expired', 'cancelled')
+          AND i.item_key = ({column})::text
+    )"""
+
+
+def ensure_tables(conn):
+    with conn.cursor() as cur:
+        cur.execute(ENSURE_TABLES)
+    conn.commit()
+
+
+def request_line(custom_id: str, endpoint: str, body: dict) -> dict:
+    return {"custom_id": custom_id, "method": "POST", "url": endpoint, "body": body}
+
+
+def response_text(endpoint: str, body: dict) -> str:
+    """
+    Model text from a batch response body (chat completions or responses).
+    """
+    if endpoint.endswith("/chat/completions"):
+        return body["choices"][0]["message"]["content"] or ""
+
+    if body.get("output_text"):
+        return body["output_text"]
+    parts = []
+    for item in body.get("output") or []:
+        for part in item.get("content") or []:
+            if part.get("type") == "output_text":
+                parts.append(part.get("text") or "")
+    return "".join(parts)
+
+
+# =========================
+# Backends
+# =========================
+class OpenAIBatchBackend:
+    name = "openai"
+
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, path: str, endpoint: str) -> str:
+        with open(path, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=endpoint,
+            completion_window=LLM_BATCH_WINDOW,
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def output_lines(self, batch_id: str) -> list[dict]:
+        batch = self.client.batches.retrieve(batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            text = self.client.files.content(file_id).text
+            lines.extend(json.loads(ln) for ln in text.splitlines() if ln.strip())
+        return lines
+
+
+class LocalBatchBackend:
+    """
+    File-based stand-in for the Batch API.
+
+    submit() copies the request file into LLM_BATCH_DIR/<batch_id>/input.jsonl.
+    The job "runs" on the first status() call: each request body is passed to
+    `responder(endpoint, body) -> response body` and written to output.jsonl in
+    the Batch API output format. The default responder sends the body through
+    the given OpenAI client, so pointing that client at a local server keeps
+    the whole cycle offline.
+    """
+    name = "local"
+
+    def __init__(self, client=None, root: str = LLM_BATCH_DIR, responder=None):
+        self.client = client
+        self.root = root
+        self.responder = responder or self._forward
+
+    def _forward(self, endpoint: str, body: dict) -> dict:
+        api = "chat" if endpoint.endswith("/chat/completions") else "responses"
+        return ratelimit.request(self.client, api, body).model_dump()
+
+    def _dir(self, batch_id: str) -> str:
+        return os.path.join(self.root, batch_id)
+
+    def submit(self, path: str, endpoint: str) -> str:
+        batch_id = f"local_batch_{uuid.uuid4().hex[:16]}"
+        os.makedirs(self._dir(batch_id), exist_ok=True)
+        shutil.copyfile(path, os.path.join(self._dir(batch_id), "input.jsonl"))
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        out_path = os.path.join(self._dir(batch_id), "output.jsonl")
+        if not os.path.exists(out_path):
+            self._process(batch_id, out_path)
+        return "completed"
+
+    def _process(self, batch_id: str, out_path: str):
+        tmp_path = out_path + ".tmp"
+        with open(os.path.join(self._dir(batch_id), "input.jsonl"), encoding="utf-8") as src, \
+                open(tmp_path, "w", encoding="utf-8") as dst:
+            for ln in src:
+                if not ln.strip():
+                    continue
+                req = json.loads(ln)
+                line = {"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": req["custom_id"]}
+                try:
+                    body = self.responder(req["url"], req["body"])
+                    line["response"] = {"status_code": 200, "body": body}
+                    line["error"] = None
+                except Exception as e:
+                    line["response"] = None
+                    line["error"] = {"code": type(e).__name__, "message": str(e)}
+                dst.write(json.dumps(line) + "\n")
+        os.replace(tmp_path, out_path)
+
+    def output_lines(self, batch_id: str) -> list[dict]:
+        with open(os.path.join(self._dir(batch_id), "output.jsonl"), encoding="utf-8") as f:
+            return [json.loads(ln) for ln in f if ln.strip()]
+
+
+def get_backend(client, name: str | None = None):
+    name = name or LLM_BATCH_BACKEND
+    if name == "local":
+        return LocalBatchBackend(client)
+    return OpenAIBatchBackend(client)
+
+
+# =========================
+# Job lifecycle
+# =========================
+def submit(conn, backend, kind: str, endpoint: str, requests: list[tuple[str, dict]]) -> str | None:
+    """
+    Write (custom_id, body) pairs to JSONL, submit them as one job and record
+    the job + its item keys. Returns the batch id (None if nothing to send).
+    """
+    if not requests:
+        return None
+
+    os.makedirs(LLM_BATCH_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(LLM_BATCH_DIR, f"{kind}-{stamp}.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, body in requests:
+            f.write(json.dumps(request_line(custom_id, endpoint, body), ensure_ascii=False) + "\n")
+
+    batch_id = backend.submit(path, endpoint)
+
+    with conn.cursor() as cur:
+        cur.execute(INSERT_JOB, (kind, backend.name, batch_id, endpoint, path, len(requests)))
+        cur.execute(INSERT_ITEMS, (batch_id, [cid for cid, _ in requests]))
+    conn.commit()
+    return batch_id
+
+
+def poll_and_ingest(conn, backend, kind: str, ingest) -> dict:
+    """
+    Check every open job of `kind`; ingest finished ones.
+
+    ingest(cur, custom_id, text) writes one result and may raise to reject it.
+    Returns {"open": n, "ingested": n, "failed": n} counted per item.
+    """
+    with conn.cursor() as cur:
+        cur.execute(OPEN_JOBS, (kind,))
+        jobs = cur.fetchall()
+    conn.commit()
+
+    counts = {"open": 0, "ingested": 0, "failed": 0}
+
+    for batch_id, backend_name, endpoint in jobs:
+        if backend_name != backend.name:
+            counts["open"] += 1
+            continue
+
+        status = backend.status(batch_id)
+        if status in DEAD_STATES:
+            with conn.cursor() as cur:
+                cur.execute(SET_STATUS, (status, f"batch ended with status={status}", batch_id))
+            conn.commit()
+            continue
+        if status != "completed":
+            with conn.cursor() as cur:
+                cur.execute(SET_STATUS, (status, None, batch_id))
+            conn.commit()
+            counts["open"] += 1
+            continue
+
+        errors = []
+        with conn.cursor() as cur:
+            for line in backend.output_lines(batch_id):
+                custom_id = line.get("custom_id")
+                resp = line.get("response") or {}
+                if line.get("error") or resp.get("status_code") != 200:
+                    errors.append(f"{custom_id}: {line.get('error') or resp.get('status_code')}")
+                    counts["failed"] += 1
+                    continue
+                try:
+                    cur.execute("SAVEPOINT batch_item")
+                    ingest(cur, custom_id, response_text(endpoint, resp["body"]))
+                    cur.execute("RELEASE SAVEPOINT batch_item")
+                    counts["ingested"] += 1
+                except Exception as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT batch_item")
+                    errors.append(f"{custom_id}: {type(e).__name__}: {e}")
+                    counts["failed"] += 1
+
+            cur.execute(MARK_INGESTED, ("\n".join(errors)[:8000] or None, batch_id))
+        conn.commit()
+
+    return counts
+
+
+def run_cycle(conn, backend, kind: str, endpoint: str, ingest, build_requests) -> dict:
+    """
+    Cron-friendly step: ingest finished jobs, then submit a new job when none
+    of this kind is still in flight. build_requests() -> [(custom_id, body)].
+    """
+    ensure_tables(conn)
+    counts = poll_and_ingest(conn, backend, kind, ingest)
+
+    counts["submitted"] = 0
+    counts["batch_id"] = None
+    if counts["open"] == 0:
+        requests = build_requests()
+        counts["batch_id"] = submit(conn, backend, kind, endpoint, requests)
+        counts["submitted"] = len(requests)
+    return counts
+
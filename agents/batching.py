@@ -0,0 +1,150 @@
+"""
+Multi-article prompting: pack several abstracts into one LLM request.
+
+The long system prompt and schema text are paid once per request instead of
+once per article. The model answers with {"results": [{"key": ..., ...}]};
+every item is validated on its own and any item that is missing or fails
+validation is retried alone through the caller's single-article path.
+"""
+import json
+import os
+
+from .prompting import compact_json, count_tokens
+
+# 1 disables packing (one article per request)
+PROMPT_BATCH_MAX = int(os.getenv("PROMPT_BATCH_MAX", "1"))
+# rough input-token budget per packed request (abstracts only; prompt overhead excluded)
+PROMPT_BATCH_TOKENS = int(os.getenv("PROMPT_BATCH_TOKENS", "6000"))
+
+BATCH_INSTRUCTIONS = """
+You will receive several articles as JSON under "articles", each with a "key".
+Analyze every article independently using the instructions above.
+Return STRICT JSON only, as a single object:
+{"results": [{"key": "<the article key>", ...fields for that article...}, ...]}
+Return exactly one entry per key and copy each key verbatim.
+""".strip()
+
+
+def pack(items: list, render, max_items: int, token_budget: int) -> list[list]:
+    """
+    Greedily group items so each group has at most `max_items` entries and
+    its rendered inputs stay within `token_budget`. An item larger than the
+    budget gets a group of its own.
+    """
+    groups = []
+    current = []
+    used = 0
+    for item in items:
+        cost = count_tokens(json.dumps(render(item), ensure_ascii=False))
+        if current and (len(current) >= max_items or used + cost > token_budget):
+            groups.append(current)
+            current = []
+            used = 0
+        current.append(item)
+        used += cost
+    if current:
+        groups.append(current)
+    return groups
+
+
+def batch_user_prompt(articles: list[dict], header: str = "") -> str:
+    body = compact_json({"articles": articles})
+    parts = [header.strip(), BATCH_INSTRUCTIONS, body]
+    return "\n\n".join(p for p in parts if p)
+
+
+def parse_results(text: str) -> dict[str, dict]:
+    """
+    Map key -> raw result object from a batched reply. Entries without a
+    key are dropped (their articles get retried alone).
+    """
+    s = (text or "").strip()
+    start = s.find("{")
+    end = s.rfind("}")
+    if start == -1 or end == -1:
+        raise ValueError("batched reply contains no JSON object")
+    data = json.loads(s[start:end + 1])
+
+    results = data.get("results") if isinstance(data, dict) else data
+    if not isinstance(results, list):
+        raise ValueError("batched reply has no results array")
+
+    out = {}
+    for obj in results:
+        if isinstance(obj, dict) and obj.get("key") is not None:
+            out[str(obj["key"])] = obj
+    return out
+
+
+def run_batched(items: list, *, key, render, call, validate, single,
+                header: str = "", max_items: int | None = None,
+                token_budget: int | None = None,
+                cache=None, cache_text=None) -> tuple[dict, dict]:
+    """
+    Score `items` with packed requests.
+
+    key(item)      -> unique string key
+    render(item)   -> dict of per-article inputs embedded in the request
+    call(text)     -> raw model text for one packed user prompt
+    validate(obj)  -> normalized result; raises ValueError/TypeError if invalid
+    single(item)   -> normalized result via the one-article path
+
+    With an agents.llm_cache.Scope in `cache`, items whose cache_text(item)
+    is already cached skip the request, and validated batch results are
+    stored (single() is expected to cache its own results).
+
+    Returns (results, errors), both keyed by key(item).
+    """
+    max_items = max_items or PROMPT_BATCH_MAX
+    token_budget = token_budget or PROMPT_BATCH_TOKENS
+
+    results = {}
+    errors = {}
+    retry = []
+
+    if cache is not None:
+        misses = []
+        for it in items:
+            hit = cache.get(cache_text(it))
+            if hit is not None:
+                results[key(it)] = hit
+            else:
+                misses.append(it)
+        items = misses
+
+    for group in pack(items, render, max_items, token_budget):
+        if len(group) == 1:
+            retry.extend(group)
+            continue
+
+        articles = [{"key": key(it), **render(it)} for it in group]
+        try:
+            raw = parse_results(call(batch_user_prompt(articles, header)))
+        except Exception:
+            # whole reply unusable: fall back to one request per article
+            retry.extend(group)
+            continue
+
+        for it in group:
+            k = key(it)
+            obj = raw.get(k)
+            if obj is None:
+                retry.append(it)
+                continue
+            obj = {f: v for f, v in obj.items() if f != "key"}
+            try:
+                results[k] = validate(obj)
+            except (ValueError, TypeError, KeyError):
+                retry.append(it)
+                continue
+            if cache is not None:
+                cache.put(cache_text(it), results[k])
+
+    for it in retry:
+        k = key(it)
+        try:
+            results[k] = single(it)
+        except Exception as e:
+            errors[k] = e
+
+    return results, errors
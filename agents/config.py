@@ -8,6 +8,9 @@ load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
 
+# OpenAI-compatible endpoint override (e.g. mock_llm_server.py for load tests)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "").strip()
+
 # Model selection (safe default)
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5-mini").strip()
 
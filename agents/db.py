@@ -1,5 +1,7 @@
 from contextlib import contextmanager
 import psycopg
+import page_cache
+import paper_docs
 from .config import DATABASE_URL
 
 @contextmanager
@@ -7,6 +9,10 @@ def get_conn():
     with psycopg.connect(DATABASE_URL) as conn:
         yield conn
 
+def ensure_schema():
+    with get_conn() as conn:
+        paper_docs.ensure_schema(conn)
+
 def fetch_pending_articles(limit: int):
     """
     Atomically claims rows for processing using SKIP LOCKED.
@@ -51,6 +57,8 @@ def mark_done(article_id: int, agent_score: int, summary_1s: str, tags: dict, co
         with conn.cursor() as cur:
             cur.execute(q, (agent_score, summary_1s, psycopg.types.json.Json(tags),
                             psycopg.types.json.Json(components), article_id))
+            pmids = paper_docs.rebuild(cur, ids=[article_id])
+    page_cache.invalidate(pmids)
 
 def mark_error(article_id: int, err: str):
     q = """
@@ -62,4 +70,6 @@ def mark_error(article_id: int, err: str):
     with get_conn() as conn:
         with conn.cursor() as cur:
             cur.execute(q, (f"Agent error: {err}", article_id))
+            pmids = paper_docs.rebuild(cur, ids=[article_id])
+    page_cache.invalidate(pmids)
 
@@ -1,9 +1,12 @@
 import json
 from openai import OpenAI
-from tenacity import retry, stop_after_attempt, wait_exponential
-from .config import OPENAI_API_KEY, OPENAI_MODEL
+from .config import OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_MODEL
+from .batching import run_batched
+from .llm_cache import Scope, prompt_version
+from . import schemas
+from .prompting import compact_abstract, compact_json
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None)
 
 SYSTEM = """You are a biomedical research scoring agent for Parkinson's disease and Alzheimer's disease.
 You must output STRICT JSON only—no extra text.
@@ -18,11 +21,12 @@ Return JSON with keys:
 - score_components (object with integers 0-100: relevance, novelty, evidence, actionability)
 """
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(min=1, max=8))
-def score_article(title: str, abstract: str, journal: str = "", pub_date: str = "") -> dict:
+CACHE = Scope(OPENAI_MODEL, prompt_version(SYSTEM, json.dumps(schemas.AGENT_SCORE, sort_keys=True)))
+
+def user_payload(title: str, abstract: str, journal: str = "", pub_date: str = "") -> str:
     user = {
         "title": title or "",
-        "abstract": abstract or "",
+        "abstract": compact_abstract(abstract),
         "journal": journal or "",
         "publication_date": pub_date or "",
         "constraints": {
@@ -30,37 +34,57 @@ def score_article(title: str, abstract: str, journal: str = "", pub_date: str =
             "output": "json_only"
         }
     }
+    return compact_json(user)
 
-    # Responses API (recommended migration path)  [oai_citation:2‡OpenAI Developers](https://developers.openai.com/api/reference/resources/responses/?utm_source=chatgpt.com)
-    resp = client.responses.create(
+def score_article(title: str, abstract: str, journal: str = "", pub_date: str = "") -> dict:
+    text = user_payload(title, abstract, journal, pub_date)
+    return CACHE.call(text, lambda: schemas.complete(
+        client,
+        api="responses",
         model=OPENAI_MODEL,
-        input=[
-            {"role": "system", "content": SYSTEM},
-            {"role": "user", "content": json.dumps(user)}
-        ],
+        schema=schemas.AGENT_SCORE,
+        system=SYSTEM,
+        user=text,
         # Hint: keep temperature low for stable scoring
         temperature=0.2,
-    )
-
-    # The SDK returns output text; parse JSON
-    text = resp.output_text.strip()
-    data = json.loads(text)
+    ))
 
-    # Basic validation / clamps
-    data["agent_score"] = int(max(0, min(100, data.get("agent_score", 0))))
-    data["summary_1s"] = (data.get("summary_1s", "") or "")[:220]
-
-    tags = data.get("tags", {}) or {}
-    for k in ("compounds", "targets", "pathways", "models"):
-        if k not in tags or not isinstance(tags[k], list):
-            tags[k] = []
+def _call_batch_text(user_text: str) -> str:
+    messages = [
+        {"role": "system", "content": SYSTEM},
+        {"role": "user", "content": user_text},
+    ]
+    body = schemas.request_body(
+        "responses", OPENAI_MODEL, messages, schemas.batch_schema(schemas.AGENT_SCORE), temperature=0.2,
+    )
+    return schemas.send(client, "responses", body)
 
-    comps = data.get("score_components", {}) or {}
-    for k in ("relevance", "novelty", "evidence", "actionability"):
-        v = comps.get(k, 0)
-        comps[k] = int(max(0, min(100, v if isinstance(v, (int, float)) else 0)))
+def score_articles_batch(rows: list[tuple], max_items: int | None = None) -> tuple[dict, dict]:
+    """
+    Score several articles per request (see agents.batching).
+    rows: (id, pmid, title, abstract, journal, publication_date)
+    Returns (results, errors) keyed by str(id).
+    """
+    def render(row):
+        _, _, title, abstract, journal, pub_date = row
+        return {
+            "title": title or "",
+            "abstract": compact_abstract(abstract),
+            "journal": journal or "",
+            "pub_date": str(pub_date) if pub_date else "",
+        }
 
-    data["tags"] = tags
-    data["score_components"] = comps
-    return data
+    def single(row):
+        return score_article(**render(row))
 
+    return run_batched(
+        rows,
+        key=lambda row: str(row[0]),
+        render=render,
+        call=_call_batch_text,
+        validate=lambda obj: schemas.validate(schemas.AGENT_SCORE, obj),
+        single=single,
+        max_items=max_items,
+        cache=CACHE,
+        cache_text=lambda row: user_payload(**render(row)),
+    )
@@ -0,0 +1,169 @@
+"""
+Content-addressed cache for LLM results.
+
+Entries are keyed on (model, prompt version, normalized input) and stored in
+public.llm_cache, with a per-process LRU in front. Reruns, status resets and
+identical reprints (the same abstract under several PMIDs) are served from
+the cache instead of paying for a new completion.
+
+The cache never breaks scoring: if Postgres is unreachable it degrades to
+the local tier and the call goes through.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import psycopg
+from psycopg.types.json import Json
+
+from .config import DATABASE_URL
+
+LLM_CACHE = os.getenv("LLM_CACHE", "1") == "1"
+LLM_CACHE_LOCAL_SIZE = int(os.getenv("LLM_CACHE_LOCAL_SIZE", "4096"))
+
+ENSURE_TABLE = """
+CREATE TABLE IF NOT EXISTS public.llm_cache (
+    cache_key       TEXT PRIMARY KEY,
+    model           TEXT NOT NULL,
+    prompt_version  TEXT NOT NULL,
+    response        JSONB NOT NULL,
+    hits            INTEGER NOT NULL DEFAULT 0,
+    created_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_hit_at     TIMESTAMPTZ
+)
+"""
+
+GET_SQL = """
+UPDATE public.llm_cache
+SET hits = hits + 1, last_hit_at = NOW()
+WHERE cache_key = %s
+RETURNING response
+"""
+
+PUT_SQL = """
+INSERT INTO public.llm_cache (cache_key, model, prompt_version, response)
+VALUES (%s, %s, %s, %s)
+ON CONFLICT (cache_key) DO UPDATE SET response = EXCLUDED.response
+"""
+
+
+def normalize(text: str) -> str:
+    # whitespace-only differences (re-wrapped abstracts, trailing newlines) share a key
+    return " ".join((text or "").split())
+
+
+def prompt_version(*parts: str) -> str:
+    """
+    Short hash of the system prompt / schema text; editing either starts a
+    fresh cache namespace automatically.
+    """
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(model: str, version: str, text: str) -> str:
+    raw = f"{model}\x1f{version}\x1f{normalize(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, dsn: str = DATABASE_URL, local_size: int = LLM_CACHE_LOCAL_SIZE):
+        self.dsn = dsn
+        self.local_size = local_size
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+        self.conn = None
+        self.db_ok = bool(dsn)
+
+    def _db(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = psycopg.connect(self.dsn, autocommit=True)
+            self.conn.execute(ENSURE_TABLE)
+        return self.conn
+
+    def _remember(self, key: str, value):
+        self.local[key] = value
+        self.local.move_to_end(key)
+        while len(self.local) > self.local_size:
+            self.local.popitem(last=False)
+
+    def get(self, key: str):
+        with self.lock:
+            if key in self.local:
+                self.local.move_to_end(key)
+                return self.local[key]
+            if not self.db_ok:
+                return None
+            try:
+                row = self._db().execute(GET_SQL, (key,)).fetchone()
+            except psycopg.Error as e:
+                self._disable(e)
+                return None
+            if row is None:
+                return None
+            self._remember(key, row[0])
+            return row[0]
+
+    def put(self, key: str, model: str, version: str, value):
+        with self.lock:
+            self._remember(key, value)
+            if not self.db_ok:
+                return
+            try:
+                self._db().execute(PUT_SQL, (key, model, version, Json(value)))
+            except psycopg.Error as e:
+                self._disable(e)
+
+    def _disable(self, e: Exception):
+        print(f"[llm_cache] Postgres tier disabled: {e}", file=sys.stderr)
+        self.db_ok = False
+
+
+_shared = None
+
+
+def shared() -> LLMCache:
+    global _shared
+    if _shared is None:
+        _shared = LLMCache()
+    return _shared
+
+
+class Scope:
+    """
+    Cache view for one (model, prompt version) pair.
+    """
+    def __init__(self, model: str, version: str, cache: LLMCache | None = None):
+        self.model = model
+        self.version = version
+        self.cache = cache
+
+    def _cache(self):
+        return self.cache or shared()
+
+    def get(self, text: str):
+        if not LLM_CACHE:
+            return None
+        return self._cache().get(cache_key(self.model, self.version, text))
+
+    def put(self, text: str, value):
+        if not LLM_CACHE:
+            return
+        # round-trip through JSON so local hits match what Postgres returns
+        value = json.loads(json.dumps(value, default=str))
+        self._cache().put(cache_key(self.model, self.version, text), self.model, self.version, value)
+
+    def call(self, text: str, fn, cacheable=None):
+        """
+        Return the cached result for `text`, or fn() and cache it when
+        cacheable(result) is true (default: always).
+        """
+        hit = self.get(text)
+        if hit is not None:
+            return hit
+        value = fn()
+        if cacheable is None or cacheable(value):
+            self.put(text, value)
+        return value
@@ -0,0 +1,216 @@
+"""
+Prompt compaction: local token counting, section-aware abstract trimming
+and compact schema encoding.
+
+Structured PubMed abstracts arrive as "LABEL: text" sections separated by
+blank lines (see ingest_pubmed). When an abstract is over
+PROMPT_ABSTRACT_TOKENS, sections are kept in order of how much they tell a
+scorer (conclusions, results, objective, ...) until the budget is used;
+dropped spans are marked with "[...]". Unstructured abstracts keep their
+first sentence and as much of the ending as fits.
+
+Measure the effect on the fixture set:
+  python -m agents.prompting fixtures/abstracts.jsonl
+"""
+import json
+import os
+import re
+import sys
+
+PROMPT_ABSTRACT_TOKENS = int(os.getenv("PROMPT_ABSTRACT_TOKENS", "600"))  # 0 = no trimming
+PROMPT_TOKENIZER_MODEL = os.getenv("PROMPT_TOKENIZER_MODEL", "gpt-4.1-mini").strip()
+
+ELLIPSIS = "[...]"
+
+# Lower rank = kept first
+SECTION_RANKS = (
+    (("CONCLUSION", "INTERPRETATION", "IMPLICATION", "SIGNIFICANCE"), 0),
+    (("RESULT", "FINDING", "OUTCOME"), 1),
+    (("OBJECTIVE", "AIM", "PURPOSE", "GOAL", "HYPOTHES"), 2),
+    (("METHOD", "DESIGN", "PARTICIPANT", "PATIENT", "SETTING", "INTERVENTION", "MEASURE"), 3),
+    (("BACKGROUND", "INTRODUCTION", "CONTEXT", "RATIONALE"), 4),
+)
+DEFAULT_RANK = 3
+
+LABEL_RE = re.compile(r"^([A-Z][A-Za-z ,/&()-]{1,60}):\s+")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9(])")
+
+_encoder = None
+
+
+def _get_encoder():
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+        except ImportError:
+            _encoder = False
+        else:
+            try:
+                _encoder = tiktoken.encoding_for_model(PROMPT_TOKENIZER_MODEL)
+            except KeyError:
+                _encoder = tiktoken.get_encoding("o200k_base")
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """
+    Token count with tiktoken when installed, otherwise ~4 characters per
+    token (close for English biomedical prose).
+    """
+    text = text or ""
+    enc = _get_encoder()
+    if enc:
+        return len(enc.encode(text))
+    return len(text) // 4 + 1
+
+
+def compact_json(obj) -> str:
+    """
+    Schema / payload encoding without indentation or padding spaces.
+    """
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def section_rank(label: str | None) -> int:
+    if not label:
+        return DEFAULT_RANK
+    upper = label.upper()
+    for keys, rank in SECTION_RANKS:
+        if any(k in upper for k in keys):
+            return rank
+    return DEFAULT_RANK
+
+
+def split_sections(abstract: str) -> list[tuple[str | None, str]]:
+    """
+    [(label, full section text)] in original order. Unlabelled abstracts
+    come back as a single (None, text) section.
+    """
+    sections = []
+    for block in re.split(r"\n\s*\n", abstract.strip()):
+        block = block.strip()
+        if not block:
+            continue
+        m = LABEL_RE.match(block)
+        sections.append((m.group(1) if m else None, block))
+    return sections
+
+
+def _fit_sentences(text: str, budget: int, from_end: bool = False) -> str:
+    """
+    Longest run of whole sentences from the start (or end) within budget.
+    """
+    sentences = SENTENCE_RE.split(text)
+    if from_end:
+        sentences = sentences[::-1]
+    kept = []
+    used = 0
+    for s in sentences:
+        cost = count_tokens(s + " ")
+        if used + cost > budget:
+            break
+        kept.append(s)
+        used += cost
+    if from_end:
+        kept = kept[::-1]
+    return " ".join(kept)
+
+
+def _compact_unstructured(text: str, budget: int) -> str:
+    # the aim is usually stated first and the conclusion last
+    head = _fit_sentences(text, budget // 3)
+    rest = text[len(head):].strip()
+    tail = _fit_sentences(rest, budget - count_tokens(head) - count_tokens(ELLIPSIS), from_end=True)
+    return " ".join(p for p in (head, ELLIPSIS, tail) if p)
+
+
+def compact_abstract(abstract: str | None, budget: int | None = None) -> str:
+    """
+    Abstract trimmed to `budget` tokens (default PROMPT_ABSTRACT_TOKENS),
+    keeping the most informative sections. Short abstracts are unchanged.
+    """
+    abstract = (abstract or "").strip()
+    budget = PROMPT_ABSTRACT_TOKENS if budget is None else budget
+    if not abstract or budget <= 0 or count_tokens(abstract) <= budget:
+        return abstract
+
+    sections = split_sections(abstract)
+    if len(sections) == 1:
+        return _compact_unstructured(sections[0][1], budget)
+
+    order = sorted(range(len(sections)), key=lambda i: (section_rank(sections[i][0]), i))
+    kept = {}
+    used = 0
+    for i in order:
+        block = sections[i][1]
+        cost = count_tokens(block)
+        if used + cost <= budget:
+            kept[i] = block
+            used += cost
+            continue
+        # partial section: leading sentences, only if a useful amount fits
+        remaining = budget - used - count_tokens(ELLIPSIS)
+        if remaining >= 40:
+            part = _fit_sentences(block, remaining)
+            if part:
+                kept[i] = f"{part} {ELLIPSIS}"
+                used += count_tokens(kept[i])
+        break
+
+    out = []
+    for i in range(len(sections)):
+        if i in kept:
+            out.append(kept[i])
+        elif not out or out[-1] != ELLIPSIS:
+            out.append(ELLIPSIS)
+    return "\n\n".join(out)
+
+
+# =========================
+# Fixture measurement
+# =========================
+def measure(path: str, budget: int | None = None) -> dict:
+    """
+    For each fixture line {"id", "title", "abstract", "keep": [...]}:
+    prompt tokens with the full abstract + indented extraction schema vs.
+    the compacted abstract + compact schema, and whether every "keep"
+    phrase (the findings a scorer needs) survives compaction.
+    """
+    from .schemas import EXTRACTION, wire_schema
+    schema = wire_schema(EXTRACTION)
+
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for ln in f:
+            if ln.strip():
+                rows.append(json.loads(ln))
+
+    totals = {"before": 0, "after": 0, "keep": 0, "kept": 0}
+    for r in rows:
+        before = count_tokens(json.dumps(schema, indent=2)) + count_tokens(r["abstract"])
+        compacted = compact_abstract(r["abstract"], budget)
+        after = count_tokens(compact_json(schema)) + count_tokens(compacted)
+        keep = r.get("keep") or []
+        kept = sum(1 for k in keep if k in compacted)
+
+        totals["before"] += before
+        totals["after"] += after
+        totals["keep"] += len(keep)
+        totals["kept"] += kept
+        saved = 100.0 * (before - after) / before if before else 0.0
+        print(f"{r['id']:<24} {before:>6} -> {after:>6} tokens ({saved:5.1f}% saved)  key phrases {kept}/{len(keep)}")
+
+    saved = 100.0 * (totals["before"] - totals["after"]) / totals["before"] if totals["before"] else 0.0
+    print(
+        f"{'TOTAL':<24} {totals['before']:>6} -> {totals['after']:>6} tokens ({saved:5.1f}% saved)  "
+        f"key phrases {totals['kept']}/{totals['keep']}  "
+        f"[counter={'tiktoken' if _get_encoder() else 'heuristic'}, budget={PROMPT_ABSTRACT_TOKENS if budget is None else budget}]"
+    )
+    return totals
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise SystemExit("usage: python -m agents.prompting FIXTURES.jsonl [BUDGET]")
+    measure(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None)
@@ -0,0 +1,328 @@
+"""
+Shared rate limiter and circuit breaker for synchronous LLM requests.
+
+Every request made through request() first takes from two token buckets
+(requests and tokens per minute, per model). The buckets live in a small
+JSON state file guarded by an exclusive file lock, so every scorer running
+on the host (cron jobs, systemd runners, thread pools) draws on the same
+budget instead of each pacing itself with a fixed sleep.
+
+The buckets follow the account's real limits:
+- x-ratelimit-limit-* headers replace the configured capacity
+- x-ratelimit-remaining-* headers pull the bucket down to what the server
+  reports (other hosts may share the key)
+- a 429 with retry-after pauses every process until it has passed
+- actual usage from the response replaces the pre-request estimate
+
+Consecutive transport failures (429, 5xx, timeouts, connection errors)
+open the circuit breaker: callers wait out the cooldown, then a single
+probe request is let through; success closes the circuit, failure doubles
+the cooldown. Waits longer than RATE_LIMIT_MAX_WAIT raise CircuitOpen.
+
+Env:
+  RATE_LIMIT (default 1; 0 disables throttling, retries still apply)
+  RATE_LIMIT_RPM / RATE_LIMIT_TPM (starting capacity until headers are seen)
+  RATE_LIMIT_OUTPUT_TOKENS (output estimate when the body sets no maximum)
+  RATE_LIMIT_RETRIES (attempts per request, default 4)
+  RATE_LIMIT_STATE (state file, default <tmp>/neurocompute-ratelimit.json)
+  RATE_LIMIT_MAX_WAIT (seconds, default 300)
+  BREAKER_THRESHOLD (consecutive failures, default 5)
+  BREAKER_COOLDOWN / BREAKER_MAX_COOLDOWN (seconds, default 30 / 600)
+
+  python -m agents.ratelimit      # show shared state
+"""
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+
+import openai
+
+from .prompting import count_tokens
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: falls back to a per-process lock
+    fcntl = None
+    import threading
+    _thread_lock = threading.Lock()
+
+RATE_LIMIT = os.getenv("RATE_LIMIT", "1") == "1"
+RATE_LIMIT_RPM = float(os.getenv("RATE_LIMIT_RPM", "500"))
+RATE_LIMIT_TPM = float(os.getenv("RATE_LIMIT_TPM", "200000"))
+RATE_LIMIT_OUTPUT_TOKENS = int(os.getenv("RATE_LIMIT_OUTPUT_TOKENS", "800"))
+RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", "4"))
+RATE_LIMIT_STATE = os.getenv(
+    "RATE_LIMIT_STATE", os.path.join(tempfile.gettempdir(), "neurocompute-ratelimit.json")
+).strip()
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "300"))
+
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+BREAKER_MAX_COOLDOWN = float(os.getenv("BREAKER_MAX_COOLDOWN", "600"))
+PROBE_TIMEOUT = 60.0  # a probe that never reports back frees the slot after this
+
+TRANSPORT_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class CircuitOpen(RuntimeError):
+    """
+    The breaker is open (or the limiter is paused) for longer than
+    RATE_LIMIT_MAX_WAIT.
+    """
+
+
+# =========================
+# Shared state
+# =========================
+@contextmanager
+def _locked_state():
+    """
+    Yield the whole state dict under an exclusive lock; it is written
+    back on exit.
+    """
+    if fcntl is None:
+        with _thread_lock:
+            state = _read(RATE_LIMIT_STATE)
+            yield state
+            with open(RATE_LIMIT_STATE, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+        return
+
+    fd = os.open(RATE_LIMIT_STATE, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        with os.fdopen(os.dup(fd), "r+", encoding="utf-8") as f:
+            raw = f.read()
+            try:
+                state = json.loads(raw) if raw.strip() else {}
+            except ValueError:
+                state = {}
+            yield state
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+    finally:
+        os.close(fd)  # releases the flock
+
+
+def _read(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _bucket(state: dict, model: str, now: float) -> dict:
+    """
+    Per-model entry, refilled up to now.
+    """
+    b = state.setdefault(model, {
+        "rpm": RATE_LIMIT_RPM,
+        "tpm": RATE_LIMIT_TPM,
+        "requests": RATE_LIMIT_RPM,
+        "tokens": RATE_LIMIT_TPM,
+        "ts": now,
+        "paused_until": 0.0,
+        "failures": 0,
+        "open_until": 0.0,
+        "cooldown": BREAKER_COOLDOWN,
+        "probe_until": 0.0,
+    })
+    elapsed = max(0.0, now - b["ts"])
+    b["requests"] = min(b["rpm"], b["requests"] + elapsed * b["rpm"] / 60.0)
+    b["tokens"] = min(b["tpm"], b["tokens"] + elapsed * b["tpm"] / 60.0)
+    b["ts"] = now
+    return b
+
+
+def parse_duration(value) -> float | None:
+    """
+    Seconds from a reset header ("1s", "6m0s", "20ms") or retry-after ("2").
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(n) * DURATION_UNITS[unit] for n, unit in parts)
+
+
+def _header_float(headers, name: str) -> float | None:
+    try:
+        value = headers.get(name)
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+# =========================
+# Limiter
+# =========================
+def estimate_tokens(body: dict) -> int:
+    prompt = body.get("messages") or body.get("input") or ""
+    output = body.get("max_output_tokens") or body.get("max_completion_tokens") or body.get("max_tokens")
+    return count_tokens(json.dumps(prompt, ensure_ascii=False)) + int(output or RATE_LIMIT_OUTPUT_TOKENS)
+
+
+def acquire(model: str, tokens: int) -> bool:
+    """
+    Block until the model's buckets hold one request and `tokens` tokens
+    and the breaker lets a request through. Returns True when this request
+    is the breaker's half-open probe.
+    """
+    if not RATE_LIMIT:
+        return False
+
+    deadline = time.time() + RATE_LIMIT_MAX_WAIT
+    while True:
+        now = time.time()
+        with _locked_state() as state:
+            b = _bucket(state, model, now)
+            # a single request larger than the whole minute budget would never fit
+            need = min(tokens, b["tpm"])
+            probe = False
+
+            if now < b["paused_until"]:
+                wait = b["paused_until"] - now
+            elif now < b["open_until"]:
+                wait = b["open_until"] - now
+            elif b["failures"] >= BREAKER_THRESHOLD and now < b["probe_until"]:
+                wait = min(1.0, b["probe_until"] - now)
+            elif b["requests"] >= 1 and b["tokens"] >= need:
+                if b["failures"] >= BREAKER_THRESHOLD:
+                    b["probe_until"] = now + PROBE_TIMEOUT
+                    probe = True
+                b["requests"] -= 1
+                b["tokens"] -= need
+                return probe
+            else:
+                wait = max(
+                    (1 - b["requests"]) * 60.0 / b["rpm"] if b["requests"] < 1 else 0.0,
+                    (need - b["tokens"]) * 60.0 / b["tpm"] if b["tokens"] < need else 0.0,
+                )
+
+        if now + wait > deadline:
+            raise CircuitOpen(f"{model}: LLM calls paused for another {wait:.0f}s")
+        # small jitter so waiting processes don't wake in lockstep
+        time.sleep(min(wait, 5.0) + random.uniform(0, 0.05))
+
+
+def observe(model: str, headers=None, used_tokens: int | None = None, estimated: int = 0,
+            ok: bool = True, retry_after: float | None = None):
+    """
+    Feed a response (or failure) back into the shared state.
+    """
+    if not RATE_LIMIT:
+        return
+
+    headers = headers or {}
+    now = time.time()
+    with _locked_state() as state:
+        b = _bucket(state, model, now)
+
+        limit_requests = _header_float(headers, "x-ratelimit-limit-requests")
+        limit_tokens = _header_float(headers, "x-ratelimit-limit-tokens")
+        if limit_requests:
+            b["rpm"] = limit_requests
+        if limit_tokens:
+            b["tpm"] = limit_tokens
+
+        remaining_requests = _header_float(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _header_float(headers, "x-ratelimit-remaining-tokens")
+        if remaining_requests is not None:
+            b["requests"] = min(b["requests"], remaining_requests)
+        if remaining_tokens is not None:
+            b["tokens"] = min(b["tokens"], remaining_tokens)
+
+        if used_tokens is not None and estimated:
+            b["tokens"] = min(b["tpm"], b["tokens"] + estimated - used_tokens)
+
+        if retry_after:
+            b["paused_until"] = max(b["paused_until"], now + retry_after)
+
+        if ok:
+            b["failures"] = 0
+            b["open_until"] = 0.0
+            b["probe_until"] = 0.0
+            b["cooldown"] = BREAKER_COOLDOWN
+            return
+
+        b["failures"] += 1
+        if b["failures"] >= BREAKER_THRESHOLD:
+            if b["open_until"] or b["probe_until"]:
+                # failed again after a cooldown: back off harder
+                b["cooldown"] = min(BREAKER_MAX_COOLDOWN, b["cooldown"] * 2)
+            b["open_until"] = now + b["cooldown"]
+            b["probe_until"] = 0.0
+            print(f"[ratelimit] circuit open for {model}: {b['failures']} consecutive failures, cooling down {b['cooldown']:.0f}s")
+
+
+def _resource(client, api: str):
+    # the limiter owns retries; the SDK's own would hide 429s from it
+    client = client.with_options(max_retries=0)
+    return client.chat.completions if api == "chat" else client.responses
+
+
+def _usage_tokens(parsed) -> int | None:
+    usage = getattr(parsed, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+def request(client, api: str, body: dict):
+    """
+    One rate-limited create() call on chat.completions or responses, with
+    retries on transport failures. Returns the parsed SDK response.
+    """
+    model = body.get("model") or "default"
+    estimated = estimate_tokens(body)
+
+    for attempt in range(1, RATE_LIMIT_RETRIES + 1):
+        acquire(model, estimated)
+        try:
+            raw = _resource(client, api).with_raw_response.create(**body)
+        except TRANSPORT_ERRORS as e:
+            response = getattr(e, "response", None)
+            headers = response.headers if response is not None else {}
+            retry_after = parse_duration(headers.get("retry-after"))
+            if retry_after is None and isinstance(e, openai.RateLimitError):
+                retry_after = parse_duration(headers.get("x-ratelimit-reset-requests")) or 1.0
+            observe(model, headers, ok=False, retry_after=retry_after)
+            if attempt == RATE_LIMIT_RETRIES:
+                raise
+            if retry_after is None:
+                # 5xx / connection errors: back off locally
+                time.sleep(min(8.0, 2 ** (attempt - 1)) + random.uniform(0, 0.5))
+            elif not RATE_LIMIT:
+                time.sleep(retry_after)
+            # otherwise acquire() waits out the shared pause
+            continue
+
+        parsed = raw.parse()
+        observe(model, raw.headers, used_tokens=_usage_tokens(parsed), estimated=estimated)
+        return parsed
+
+
+if __name__ == "__main__":
+    for model, b in _read(RATE_LIMIT_STATE).items():
+        print(
+            f"{model}: requests {b['requests']:.1f}/{b['rpm']:g}  tokens {b['tokens']:.0f}/{b['tpm']:g}  "
+            f"failures {b['failures']}  open_until {b['open_until']:.0f}  paused_until {b['paused_until']:.0f}"
+        )
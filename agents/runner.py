@@ -1,11 +1,13 @@
 import time
 import traceback
 from .config import require_env, AGENT_BATCH, AGENT_SLEEP_SECS
-from .db import fetch_pending_articles, mark_error
-from .scorer_agent import run_one
+from .db import ensure_schema, fetch_pending_articles, mark_error
+from .scorer_agent import run_one, run_batch
+from .batching import PROMPT_BATCH_MAX
 
 def main():
     require_env()
+    ensure_schema()
     print("Agent runner started.")
 
     while True:
@@ -15,6 +17,16 @@ def main():
             time.sleep(AGENT_SLEEP_SECS)
             continue
 
+        if PROMPT_BATCH_MAX > 1:
+            results, errors = run_batch(rows)
+            for article_id, res in results.items():
+                print(f"scored id={article_id} score={res['agent_score']}")
+            for article_id, e in errors.items():
+                print(f"ERROR id={article_id}: {e}")
+                mark_error(article_id, str(e))
+            time.sleep(1)
+            continue
+
         for row in rows:
             article_id = row[0]
             try:
@@ -0,0 +1,461 @@
+"""
+JSON Schema definitions for every structured LLM output, and the one call
+path that requests, validates and repairs them.
+
+- Models that support it get strict structured output (chat
+  response_format / responses text.format of type json_schema); others
+  get plain JSON mode.
+- validate() checks and clamps in one pass. Fields with a "default" are
+  tolerant: a missing or malformed value falls back to the default.
+  Fields without one are essential.
+- complete() re-asks only for the essential fields that came back invalid,
+  instead of paying for the whole request again.
+- send() goes through agents.ratelimit, which paces requests and retries
+  transport failures (connection, timeout, 429, 5xx) only. A bad reply is
+  never retried as a whole.
+"""
+import json
+import os
+
+from . import ratelimit
+
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "1") == "1"
+SCHEMA_REPAIR_ROUNDS = int(os.getenv("SCHEMA_REPAIR_ROUNDS", "1"))
+
+# Model families that accept json_schema with strict=true
+STRICT_MODEL_PREFIXES = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+
+# Keywords enforced locally by validate(); not every model accepts them on the wire
+LOCAL_KEYWORDS = ("default", "minimum", "maximum", "maxLength", "maxItems", "title")
+
+class SchemaError(ValueError):
+    """
+    Reply still violates the schema after repair. `fields` lists the
+    invalid paths (e.g. "scores.agent_score").
+    """
+    def __init__(self, name: str, fields: list[str]):
+        super().__init__(f"{name}: invalid fields {', '.join(fields)}")
+        self.fields = fields
+
+
+# =========================
+# Schema builders
+# =========================
+def _spec(spec: dict, description: str | None, default, required: bool) -> dict:
+    if description:
+        spec["description"] = description
+    if not required:
+        spec["default"] = default
+    return spec
+
+def score(description: str | None = None, required: bool = False, lo: int = 0, hi: int = 100) -> dict:
+    return _spec({"type": "integer", "minimum": lo, "maximum": hi}, description, lo, required)
+
+def number(description: str | None = None, required: bool = False, lo: float = 0.0, hi: float = 1.0) -> dict:
+    return _spec({"type": "number", "minimum": lo, "maximum": hi}, description, lo, required)
+
+def text(description: str | None = None, required: bool = False, max_len: int | None = None,
+         nullable: bool = False) -> dict:
+    spec = {"type": ["string", "null"] if nullable else "string"}
+    if max_len:
+        spec["maxLength"] = max_len
+    return _spec(spec, description, None if nullable else "", required)
+
+def flag(description: str | None = None) -> dict:
+    return _spec({"type": "boolean"}, description, False, False)
+
+def choice(values: list[str], default: str, description: str | None = None) -> dict:
+    return _spec({"type": "string", "enum": values}, description, default, False)
+
+def str_list(description: str | None = None, required: bool = False, max_items: int = 20) -> dict:
+    spec = {"type": "array", "items": {"type": "string"}, "maxItems": max_items}
+    return _spec(spec, description, [], required)
+
+def obj_list(item: dict, description: str | None = None, max_items: int = 20) -> dict:
+    spec = {"type": "array", "items": item, "maxItems": max_items}
+    return _spec(spec, description, [], False)
+
+def obj(properties: dict, title: str | None = None, description: str | None = None) -> dict:
+    # strict mode requires every property listed and no extra keys
+    spec = {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+    if title:
+        spec["title"] = title
+    if description:
+        spec["description"] = description
+    return spec
+
+
+# =========================
+# Output schemas
+# =========================
+AGENT_SCORE = obj({
+    "agent_score": score("Therapeutic Signal Score", required=True),
+    "summary_1s": text("one sentence", max_len=220),
+    "tags": obj({k: str_list() for k in ("compounds", "targets", "pathways", "models")}),
+    "score_components": obj({k: score() for k in ("relevance", "novelty", "evidence", "actionability")}),
+}, title="agent_score")
+
+STEP4_SCORE = obj({
+    "agent_score": score(required=True),
+    "summary_1s": text("one sentence"),
+}, title="step4_score")
+
+AI_SCORE = obj({
+    "therapeutic_relevance": score(required=True),
+    "disease_modifying_potential": score(required=True),
+    "repurposing_signal": score(required=True),
+    "mechanistic_novelty": score(required=True),
+    "clinical_translation_potential": score(required=True),
+    "confidence": score(required=True),
+    "primary_mechanisms": str_list(max_items=5),
+    "candidate_interventions": str_list(max_items=5),
+    "red_flags": str_list(max_items=5),
+    "why_it_matters": text("short paragraph"),
+    "ai_summary": text("1-3 sentence summary"),
+}, title="ai_score")
+
+SIGNALS = obj({
+    "summary_1_sentence": text(max_len=240),
+    "mechanism_of_action": text(nullable=True),
+    "sponsor_name": text(nullable=True),
+    "repurpose_flag": flag(),
+    "natural_compound_flag": flag(),
+    "abandoned_trial_flag": flag(),
+    "novelty_score": score(required=True),
+    "neglected_score": score(required=True),
+    "tags": str_list(max_items=20),
+}, title="paper_signals")
+
+STUDY_TYPES = ["basic", "preclinical", "clinical", "review", "other"]
+TRIAL_PHASES = ["preclinical", "phase1", "phase2", "phase3", "phase4", "na"]
+NOVELTY_LEVELS = ["low", "medium", "high"]
+
+COMPOUND = obj({
+    "name": text(required=True),
+    "type": choice(["drug", "natural", "device", "behavioral", "other"], "other"),
+    "notes": text(),
+})
+
+SUMMARY_SIGNALS = obj({
+    "diseases": str_list(),
+    "study_type": choice(STUDY_TYPES, "other"),
+    "models": str_list(),
+    "mechanisms": str_list(),
+    "targets_pathways": str_list(),
+    "compounds_interventions": obj_list(COMPOUND),
+    "biomarkers": str_list(),
+    "outcomes": str_list(),
+    "trial_phase": choice(TRIAL_PHASES, "na"),
+    "repurposing_signal": flag(),
+    "novelty_signal": choice(NOVELTY_LEVELS, "low"),
+    "confidence": number(),
+    "notes": text(),
+})
+
+SUMMARY = obj({
+    "plain_summary": text("2-3 sentences for an educated non-specialist", required=True),
+    "technical_summary": str_list("4-6 bullets for a scientist", required=True, max_items=8),
+    "signals": SUMMARY_SIGNALS,
+}, title="article_summary")
+
+EXTRACTION = obj({
+    "summary_1s": text("one plain-English sentence", max_len=220),
+    "plain_summary": text("2-3 sentences for an educated non-specialist"),
+    "technical_summary": str_list("4-6 bullets for a scientist", max_items=8),
+    "ai_summary": text("1-3 sentence summary"),
+    "why_it_matters": text("short paragraph"),
+    "scores": obj({
+        "agent_score": score("overall therapeutic signal", required=True),
+        "relevance": score(),
+        "novelty": score(),
+        "evidence": score(),
+        "actionability": score(),
+        "therapeutic_relevance": score(required=True),
+        "disease_modifying_potential": score(required=True),
+        "repurposing_signal": score(required=True),
+        "mechanistic_novelty": score(required=True),
+        "clinical_translation_potential": score(required=True),
+        "confidence": score(required=True),
+        "neglected_score": score("overlooked 'hidden gem' potential"),
+    }),
+    "flags": obj({
+        "repurpose": flag("repurposing/repositioning/approved drug/off-label reuse"),
+        "natural_compound": flag("natural product/phytochemical/plant-derived compound is central"),
+        "abandoned_trial": flag("halted/terminated/withdrawn/failed trial or sponsor abandonment"),
+    }),
+    "entities": obj({
+        "diseases": str_list(),
+        "compounds": str_list(),
+        "targets": str_list(),
+        "pathways": str_list(),
+        "models": str_list("e.g. mouse, cell culture, human cohort"),
+        "mechanisms": str_list("primary mechanisms", max_items=5),
+        "candidate_interventions": str_list(max_items=5),
+        "biomarkers": str_list(),
+        "outcomes": str_list(),
+    }),
+    "compounds_interventions": obj_list(COMPOUND),
+    "mechanism_of_action": text(nullable=True),
+    "sponsor_name": text(nullable=True),
+    "red_flags": str_list(max_items=5),
+    "tags": str_list("3-12 short strings"),
+    "study_type": choice(STUDY_TYPES, "other"),
+    "trial_phase": choice(TRIAL_PHASES, "na"),
+    "novelty_signal": choice(NOVELTY_LEVELS, "low"),
+    "notes": text(),
+}, title="article_extraction")
+
+
+# =========================
+# Validation
+# =========================
+_INVALID = object()
+
+def _coerce(spec: dict, value, path: str, bad: list[str]):
+    """
+    Clean one value. On failure, record `path` in `bad` if the field is
+    essential and return the default (or _INVALID when there is none).
+    """
+    def fail():
+        if "default" in spec:
+            return spec["default"]
+        bad.append(path)
+        return _INVALID
+
+    types = spec.get("type")
+    types = types if isinstance(types, list) else [types]
+
+    if "object" in types:
+        if not isinstance(value, dict):
+            value = {}
+        out = {}
+        for k, sub in spec["properties"].items():
+            v = _coerce(sub, value.get(k), f"{path}.{k}" if path else k, bad)
+            if v is not _INVALID:
+                out[k] = v
+        return out
+
+    if value is None:
+        return None if "null" in types else fail()
+
+    if "array" in types:
+        if not isinstance(value, list):
+            return fail()
+        items = []
+        for v in value:
+            item_bad = []
+            v = _coerce(spec["items"], v, path, item_bad)
+            # a malformed item is dropped rather than failing the list
+            if v is _INVALID or item_bad or v in ("", None):
+                continue
+            items.append(v)
+        return items[:spec.get("maxItems", len(items))]
+
+    if "enum" in spec:
+        v = value.strip().lower() if isinstance(value, str) else value
+        return v if v in spec["enum"] else fail()
+
+    if "integer" in types or "number" in types:
+        if isinstance(value, bool):
+            return fail()
+        try:
+            v = float(value)
+        except (TypeError, ValueError):
+            return fail()
+        if v != v:  # NaN
+            return fail()
+        v = max(spec.get("minimum", v), min(spec.get("maximum", v), v))
+        return int(round(v)) if "integer" in types else v
+
+    if "boolean" in types:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+            return value.strip().lower() == "true"
+        return fail()
+
+    if "string" in types:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        if not isinstance(value, str):
+            return fail()
+        v = value.strip()
+        if not v and "default" not in spec:
+            return fail()
+        return v[:spec["maxLength"]] if "maxLength" in spec else v
+
+    return value
+
+def check(schema: dict, data) -> tuple[dict, list[str]]:
+    """
+    Validate + clamp in one pass. Returns (clean, invalid essential paths).
+    """
+    bad = []
+    clean = _coerce(schema, data if isinstance(data, dict) else {}, "", bad)
+    return clean, bad
+
+def validate(schema: dict, data) -> dict:
+    """
+    check() that raises SchemaError when an essential field is invalid.
+    """
+    clean, bad = check(schema, data)
+    if bad:
+        raise SchemaError(schema.get("title", "reply"), bad)
+    return clean
+
+def parse_json(content: str) -> dict:
+    """
+    Object from model text; tolerates code fences and prose around it.
+    """
+    s = (content or "").strip()
+    if s.startswith("```"):
+        s = s.strip("`").strip()
+        if s[:4].lower() == "json":
+            s = s[4:]
+    try:
+        data = json.loads(s)
+    except json.JSONDecodeError:
+        start = s.find("{")
+        end = s.rfind("}")
+        if start == -1 or end <= start:
+            raise
+        data = json.loads(s[start:end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("reply is not a JSON object")
+    return data
+
+def subschema(schema: dict, fields: list[str]) -> dict:
+    """
+    The schema restricted to the top-level properties named in `fields`.
+    """
+    keep = {f.split(".", 1)[0] for f in fields}
+    props = {k: v for k, v in schema["properties"].items() if k in keep}
+    return obj(props, title=schema.get("title"))
+
+def batch_schema(schema: dict) -> dict:
+    """
+    Schema for a packed multi-article reply (see agents.batching).
+    """
+    item = obj({"key": text(required=True), **schema["properties"]})
+    return obj({"results": {"type": "array", "items": item}}, title=f"{schema.get('title', 'reply')}_batch")
+
+
+# =========================
+# Wire format
+# =========================
+def supports_strict(model: str) -> bool:
+    return STRUCTURED_OUTPUT and model.startswith(STRICT_MODEL_PREFIXES)
+
+def wire_schema(schema):
+    """
+    Copy of the schema without the keywords validate() enforces locally.
+    """
+    out = {}
+    for k, v in schema.items():
+        if k == "properties":
+            out[k] = {name: wire_schema(sub) for name, sub in v.items()}
+        elif k == "items":
+            out[k] = wire_schema(v)
+        elif k not in LOCAL_KEYWORDS:
+            out[k] = v
+    return out
+
+def _name(schema: dict) -> str:
+    return schema.get("title") or "reply"
+
+def response_format(schema: dict, model: str) -> dict:
+    """
+    chat.completions response_format.
+    """
+    if not supports_strict(model):
+        return {"type": "json_object"}
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": _name(schema), "schema": wire_schema(schema), "strict": True},
+    }
+
+def text_format(schema: dict, model: str) -> dict:
+    """
+    responses text.format.
+    """
+    if not supports_strict(model):
+        return {"type": "json_object"}
+    return {"type": "json_schema", "name": _name(schema), "schema": wire_schema(schema), "strict": True}
+
+def request_body(api: str, model: str, messages: list[dict], schema: dict,
+                 temperature: float | None = None) -> dict:
+    """
+    Request body for `api` ("chat" or "responses"); also used for Batch API lines.
+    """
+    if api == "chat":
+        body = {"model": model, "messages": messages, "response_format": response_format(schema, model)}
+    else:
+        body = {"model": model, "input": messages, "text": {"format": text_format(schema, model)}}
+    if temperature is not None:
+        body["temperature"] = temperature
+    return body
+
+def endpoint(api: str) -> str:
+    return "/v1/chat/completions" if api == "chat" else "/v1/responses"
+
+
+# =========================
+# Calls
+# =========================
+def send(client, api: str, body: dict) -> str:
+    """
+    One request through the shared rate limiter; returns the model text.
+    """
+    resp = ratelimit.request(client, api, body)
+    if api == "chat":
+        return resp.choices[0].message.content or ""
+    return resp.output_text
+
+def complete(client, *, api: str, model: str, schema: dict, system: str, user: str,
+             temperature: float | None = None, repair_rounds: int | None = None) -> dict:
+    """
+    Ask, validate, and re-ask only for the essential fields that came back
+    invalid. Raises SchemaError if they are still invalid afterwards.
+    """
+    repair_rounds = SCHEMA_REPAIR_ROUNDS if repair_rounds is None else repair_rounds
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+
+    reply = send(client, api, request_body(api, model, messages, schema, temperature))
+    try:
+        data = parse_json(reply)
+    except ValueError:
+        data = {}
+    clean, bad = check(schema, data)
+
+    for _ in range(repair_rounds):
+        if not bad:
+            break
+        # unparseable reply: nothing to keep, ask for the whole object once more
+        sub = subschema(schema, bad) if data else schema
+        messages = messages + [
+            {"role": "assistant", "content": reply},
+            {"role": "user", "content": (
+                f"These fields were missing or invalid: {', '.join(bad)}. "
+                "Return JSON with only those fields, matching this schema:\n"
+                + json.dumps(wire_schema(sub), separators=(",", ":"))
+            )},
+        ]
+        reply = send(client, api, request_body(api, model, messages, sub, temperature))
+        try:
+            patch = parse_json(reply)
+        except ValueError:
+            continue
+        data = {**data, **patch}
+        clean, bad = check(schema, data)
+
+    if bad:
+        raise SchemaError(_name(schema), bad)
+    return clean
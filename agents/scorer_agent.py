@@ -1,5 +1,5 @@
 
-from .llm import score_article
+from .llm import score_article, score_articles_batch
 from .db import mark_done
 
 def run_one(article_row):
@@ -15,6 +15,25 @@ def run_one(article_row):
         pub_date=str(pub_date) if pub_date else ""
     )
 
+    _save(article_id, result)
+    return result
+
+def run_batch(article_rows):
+    """
+    Score several rows with packed prompts and save each success.
+    Returns (results, errors) keyed by article id.
+    """
+    results, errors = score_articles_batch(article_rows)
+
+    saved = {}
+    for article_id, *_ in article_rows:
+        result = results.get(str(article_id))
+        if result is not None:
+            _save(article_id, result)
+            saved[article_id] = result
+    return saved, {int(k): e for k, e in errors.items()}
+
+def _save(article_id, result):
     mark_done(
         article_id=article_id,
         agent_score=result["agent_score"],
@@ -22,6 +41,3 @@ def run_one(article_row):
         tags=result["tags"],
         components=result["score_components"],
     )
-
-    return result
-
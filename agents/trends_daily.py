@@ -2,9 +2,10 @@ import json
 from datetime import date, timedelta
 from openai import OpenAI
 import psycopg
-from .config import DATABASE_URL, OPENAI_API_KEY, OPENAI_MODEL, require_env
+from . import ratelimit
+from .config import DATABASE_URL, OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_MODEL, require_env
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None)
 
 SYSTEM = """You write a daily research briefing for Parkinson's and Alzheimer's.
 Input is JSON rows with: title, agent_score, summary_1s, tags.
@@ -57,14 +58,14 @@ def main():
             print("No scored items in last 24h; skipping.")
             return
 
-        resp = client.responses.create(
-            model=OPENAI_MODEL,
-            input=[
+        resp = ratelimit.request(client, "responses", {
+            "model": OPENAI_MODEL,
+            "input": [
                 {"role":"system","content": SYSTEM},
                 {"role":"user","content": json.dumps({"items": items})}
             ],
-            temperature=0.3,
-        )
+            "temperature": 0.3,
+        })
         out = json.loads(resp.output_text.strip())
         upsert_briefing(conn, today, out)
         conn.commit()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+aggregates.py
+Precomputed counts behind the dashboard pages (/sponsors, /drugs,
+/dashboard tag pills).
+
+Each aggregate is a materialized view with a unique index, refreshed
+CONCURRENTLY (readers are never blocked) by the scanner that changes its
+inputs, at the end of its run:
+
+- sponsor_status_counts  trials x status per sponsor   abandoned_trial_scanner.py
+- drug_trial_counts      trials per drug (trial_drugs) abandoned_trial_scanner.py, drug_extractor.py
+- tag_counts             papers per tag (paper_tags)   tagger.py
+
+Pages read these rows directly; no GROUP BY runs per request.
+
+Usage:
+  python aggregates.py                          # install + show sizes
+  python aggregates.py --refresh [view ...]     # refresh all or some
+"""
+
+import os
+import sys
+
+import psycopg
+from dotenv import load_dotenv
+from psycopg.rows import dict_row
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
+
+ABANDONED_STATUSES = ("TERMINATED", "WITHDRAWN", "SUSPENDED")
+
+VIEWS = {
+    "sponsor_status_counts": """
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.sponsor_status_counts AS
+SELECT
+    COALESCE(NULLIF(btrim(sponsor), ''), '') AS sponsor,
+    count(*) FILTER (WHERE status IN ('TERMINATED', 'WITHDRAWN', 'SUSPENDED')) AS abandoned_trials,
+    count(*) FILTER (WHERE status = 'TERMINATED') AS terminated,
+    count(*) FILTER (WHERE status = 'WITHDRAWN') AS withdrawn,
+    count(*) FILTER (WHERE status = 'SUSPENDED') AS suspended,
+    count(*) AS total_trials
+FROM trials
+GROUP BY 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS sponsor_status_counts_sponsor_key
+    ON public.sponsor_status_counts (sponsor);
+CREATE INDEX IF NOT EXISTS sponsor_status_counts_abandoned_idx
+    ON public.sponsor_status_counts (abandoned_trials DESC, total_trials DESC);
+""",
+    "drug_trial_counts": """
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.drug_trial_counts AS
+SELECT
+    d.id AS drug_id,
+    d.name,
+    count(DISTINCT td.trial_id) AS trial_count,
+    count(DISTINCT td.trial_id) FILTER (WHERE t.status IN ('TERMINATED', 'WITHDRAWN', 'SUSPENDED')) AS abandoned_trials
+FROM drugs d
+JOIN trial_drugs td ON td.drug_id = d.id
+JOIN trials t ON t.id = td.trial_id
+GROUP BY d.id, d.name;
+
+CREATE UNIQUE INDEX IF NOT EXISTS drug_trial_counts_drug_key
+    ON public.drug_trial_counts (drug_id);
+CREATE INDEX IF NOT EXISTS drug_trial_counts_trials_idx
+    ON public.drug_trial_counts (trial_count DESC, name);
+""",
+    "tag_counts": """
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.tag_counts AS
+SELECT
+    t.id AS tag_id,
+    t.name,
+    count(pt.paper_id) AS paper_count
+FROM tags t
+LEFT JOIN paper_tags pt ON pt.tag_id = t.id
+GROUP BY t.id, t.name;
+
+CREATE UNIQUE INDEX IF NOT EXISTS tag_counts_tag_key
+    ON public.tag_counts (tag_id);
+""",
+}
+
+SPONSORS = """
+SELECT sponsor, abandoned_trials, terminated, withdrawn, suspended, total_trials
+FROM public.sponsor_status_counts
+WHERE abandoned_trials > 0
+ORDER BY abandoned_trials DESC, total_trials DESC
+LIMIT %s
+"""
+
+DRUGS = """
+SELECT drug_id, name, trial_count, abandoned_trials
+FROM public.drug_trial_counts
+ORDER BY trial_count DESC, name
+LIMIT %s
+"""
+
+TAGS = """
+SELECT name, paper_count AS count
+FROM public.tag_counts
+ORDER BY paper_count DESC, name
+"""
+
+
+def ensure_schema(conn, names=None):
+    """
+    Create the views (populated) and their indexes if missing.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('aggregates.ensure_schema'))")
+        for name in names or VIEWS:
+            cur.execute(VIEWS[name])
+    conn.commit()
+
+
+def refresh(conn, names=None):
+    """
+    Refresh some (default all) views; call after the inputs changed.
+    CONCURRENTLY diffs against the unique index, so pages keep reading the
+    previous rows meanwhile.
+    """
+    names = list(names or VIEWS)
+    unknown = set(names) - set(VIEWS)
+    if unknown:
+        raise ValueError(f"unknown aggregates: {', '.join(sorted(unknown))}")
+
+    ensure_schema(conn, names)
+    with conn.cursor() as cur:
+        for name in names:
+            cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY public.{name}")
+    conn.commit()
+
+
+def _read(conn, sql: str, params=()) -> list[dict]:
+    """
+    Rows as dicts; [] if the view was never installed (no scanner run yet).
+    """
+    try:
+        with conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+    except psycopg.errors.UndefinedTable:
+        conn.rollback()
+        return []
+
+
+def sponsors(conn, limit: int = 200) -> list[dict]:
+    return _read(conn, SPONSORS, (limit,))
+
+
+def drugs(conn, limit: int = 200) -> list[dict]:
+    return _read(conn, DRUGS, (limit,))
+
+
+def tag_counts(conn) -> list[dict]:
+    return _read(conn, TAGS)
+
+
+def main():
+    if not DATABASE_URL:
+        raise SystemExit("Missing DATABASE_URL")
+
+    with psycopg.connect(DATABASE_URL) as conn:
+        if "--refresh" in sys.argv:
+            names = [a for a in sys.argv[sys.argv.index("--refresh") + 1:] if not a.startswith("--")]
+            refresh(conn, names or None)
+            print(f"[aggregates] refreshed {', '.join(names or VIEWS)}")
+        else:
+            ensure_schema(conn)
+
+        for name in VIEWS:
+            n = conn.execute(f"SELECT count(*) FROM public.{name}").fetchone()[0]
+            print(f"{name:<24} {n} rows")
+
+
+if __name__ == "__main__":
+    main()
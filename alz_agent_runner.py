@@ -1,43 +1,73 @@
 #!/usr/bin/env python3
-import os, time, subprocess, sys
+"""
+Long-lived scheduler for the sweep + LLM score steps.
+
+Both steps run in-process on one shared Postgres connection and the
+OpenAI client created by agent_step4_openai_score at import time, so a
+cycle costs only the SQL and LLM calls themselves.
+"""
+import os, time, sys, traceback
+
+import psycopg
+
+import agent_step3_sweep
+import agent_step4_openai_score
+import llm_gate
+import paper_docs
+import ranking
 
 SLEEP_IDLE = float(os.getenv("SLEEP_IDLE", "20"))     # when no work
 SLEEP_BUSY = float(os.getenv("SLEEP_BUSY", "0.5"))    # when work exists
-SWEEP_BATCH = int(os.getenv("SWEEP_BATCH", "200"))
+SWEEP_BATCH = int(os.getenv("SWEEP_BATCH", "5000"))  # one UPDATE per cycle
 SCORE_BATCH = int(os.getenv("SCORE_BATCH", "10"))
+SCORE_MODE = os.getenv("SCORE_MODE", "batch").strip()  # batch | serial
 
-def run(cmd: list[str]) -> tuple[int, str]:
-    p = subprocess.run(cmd, capture_output=True, text=True)
-    out = (p.stdout or "") + (p.stderr or "")
-    return p.returncode, out.strip()
+DATABASE_URL = agent_step4_openai_score.DATABASE_URL
+
+def run_cycle(conn) -> dict:
+    """
+    One sweep + score pass. Returns the structured result of each step.
+    """
+    sweep = agent_step3_sweep.run(limit=SWEEP_BATCH, conn=conn, verbose=False)
+    if SCORE_MODE == "batch":
+        score = agent_step4_openai_score.run_batched(conn, limit=SCORE_BATCH)
+    else:
+        score = agent_step4_openai_score.run(conn, limit=SCORE_BATCH)
+    return {"sweep": sweep, "score": score}
 
 def main():
+    agent_step4_openai_score.check_env()
     print("ALZ Agent Runner starting...")
+
+    conn = None
     while True:
         did_work = False
 
-        # 1) Sweep: mark rows as checked (queued)
-        code, out = run(["python3", "agent_step3_sweep.py"])
-        if code == 0:
-            # If your sweep script prints how many it updated, parse it later.
-            did_work = True
-        else:
-            print("SWEEP ERROR:\n", out, file=sys.stderr)
-
-        # 2) LLM score: score a small batch
-        env = os.environ.copy()
-        env["AGENT_LIMIT"] = str(SCORE_BATCH)
-        p = subprocess.run(["python3", "agent_step4_openai_score.py"], env=env, capture_output=True, text=True)
-        out2 = (p.stdout or "") + (p.stderr or "")
-        if p.returncode == 0:
-            if "scored" in out2:
-                did_work = True
-            print(out2.strip())
-        else:
-            print("SCORE ERROR:\n", out2, file=sys.stderr)
+        try:
+            if conn is None or conn.closed:
+                conn = psycopg.connect(DATABASE_URL)
+                llm_gate.ensure_schema(conn)
+                ranking.ensure_schema(conn)
+                paper_docs.ensure_schema(conn)
+
+            result = run_cycle(conn)
+            did_work = result["sweep"]["processed"] > 0 or result["score"]["processed"] > 0
+            if did_work:
+                print(f"cycle sweep={result['sweep']} score={result['score']}")
+
+        except psycopg.OperationalError as e:
+            # Connection dropped; reconnect on the next cycle
+            print(f"DB ERROR: {e}", file=sys.stderr)
+            if conn is not None:
+                conn.close()
+            conn = None
+
+        except Exception:
+            print("CYCLE ERROR:\n", traceback.format_exc(), file=sys.stderr)
+            if conn is not None and not conn.closed:
+                conn.rollback()
 
         time.sleep(SLEEP_BUSY if did_work else SLEEP_IDLE)
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,344 @@
+"""
+api.py
+Read-only JSON API (Flask blueprint, mounted at /api by app.py).
+
+  GET /api/articles         listing; ?sort= ?after= ?before= ?page= ?limit=
+  GET /api/search?q=        search; ?sort= ?page= ?limit=
+  GET /api/papers/<pmid>    one paper
+  GET /api/insights         agent insights; ?agent= ?page= ?limit=
+  GET /api/trials           trials; ?status=TERMINATED,WITHDRAWN ?page= ?limit=
+
+Every endpoint takes ?fields=a,b,c (whitelisted columns) so clients can skip
+large columns such as abstract; the defaults leave those out of lists.
+
+Responses carry an ETag, and a Last-Modified where the rows have
+timestamps. Article validators come from GREATEST(updated_at, scored_at,
+created_at) of the rows served plus the rank_weights change time (a
+weight change re-ranks without touching row timestamps). Trials have no
+timestamps and are validated by content. A matching If-None-Match /
+If-Modified-Since gets an empty 304: a paper is checked before its columns
+are read, a list before it is serialized.
+"""
+
+import hashlib
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+import psycopg
+from flask import Blueprint, Response, abort, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+import instrumentation
+import listing
+import search
+import stats
+
+bp = Blueprint("api", __name__, url_prefix="/api")
+
+DEFAULT_LIMIT = 25
+MAX_LIMIT = int(os.getenv("API_MAX_LIMIT", "100"))
+
+# Whitelists: names are interpolated into SQL, so only these are accepted
+ARTICLE_FIELDS = (
+    "pmid", "title", "journal", "publication_date",
+    "ai_score", "base_score", "rank_score", "narrative_score", "ai_confidence",
+    "ai_summary", "why_it_matters", "abstract",
+    "mechanisms", "candidate_interventions", "red_flags", "score_components",
+    "doi", "url", "authors", "keywords", "mesh_terms", "publication_types",
+    "scored_at", "updated_at",
+)
+LIST_FIELDS = (
+    "pmid", "title", "journal", "publication_date",
+    "ai_score", "base_score", "rank_score", "ai_summary", "why_it_matters",
+)
+PAPER_FIELDS = LIST_FIELDS + (
+    "abstract", "mechanisms", "candidate_interventions", "red_flags",
+    "ai_confidence", "narrative_score", "score_components",
+)
+
+INSIGHT_FIELDS = (
+    "id", "agent_name", "window_start", "window_end", "title", "summary",
+    "evidence", "score", "metadata", "created_at",
+)
+INSIGHT_LIST_FIELDS = ("id", "agent_name", "window_start", "window_end", "title", "summary", "score", "created_at")
+
+TRIAL_FIELDS = (
+    "id", "nct_id", "title", "brief_summary", "status", "phase", "study_type",
+    "conditions", "sponsor", "start_date", "completion_date", "url",
+)
+TRIAL_LIST_FIELDS = ("nct_id", "title", "status", "phase", "sponsor", "start_date", "completion_date", "url")
+
+ARTICLE_MODIFIED = "GREATEST(updated_at, scored_at, created_at)"
+
+WEIGHTS_CHANGED = "SELECT max(updated_at) FROM public.rank_weights"
+
+PAPER_VALIDATOR = f"""
+SELECT {ARTICLE_MODIFIED}
+FROM public.articles
+WHERE pmid = %s
+"""
+
+PAPER = """
+SELECT {columns}
+FROM public.articles
+WHERE pmid = %s
+LIMIT 1
+"""
+
+INSIGHTS = """
+SELECT {columns}, created_at AS modified, count(*) OVER () AS total
+FROM insights
+WHERE %(agent)s::text IS NULL OR agent_name = %(agent)s
+ORDER BY created_at DESC, id DESC
+LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+TRIALS = """
+SELECT {columns}, count(*) OVER () AS total
+FROM trials
+WHERE %(statuses)s::text[] IS NULL OR upper(status) = ANY(%(statuses)s)
+ORDER BY completion_date DESC NULLS LAST, id DESC
+LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+
+def get_db():
+    db = os.getenv("DATABASE_URL")
+    if not db:
+        raise RuntimeError("DATABASE_URL not set")
+    return db
+
+
+@bp.errorhandler(HTTPException)
+def json_error(e: HTTPException):
+    return jsonify({"error": e.description}), e.code
+
+
+def parse_fields(allowed: tuple, default: tuple) -> list[str]:
+    raw = request.args.get("fields")
+    if not raw:
+        return list(default)
+    fields = list(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        abort(400, description=f"unknown fields: {', '.join(unknown)}; allowed: {', '.join(allowed)}")
+    if not fields:
+        abort(400, description="fields is empty")
+    return fields
+
+
+def parse_paging() -> tuple[int, int, int]:
+    """
+    (page, limit, offset) from ?page= and ?limit=.
+    """
+    page = max(1, request.args.get("page", 1, type=int))
+    limit = min(max(1, request.args.get("limit", DEFAULT_LIMIT, type=int)), MAX_LIMIT)
+    return page, limit, (page - 1) * limit
+
+
+def jsonable(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def records(fields: list[str], rows) -> list[dict]:
+    return [{f: jsonable(v) for f, v in zip(fields, row)} for row in rows]
+
+
+def make_etag(*parts) -> str:
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+def latest(*stamps) -> datetime | None:
+    stamps = [s for s in stamps if s is not None]
+    return max(stamps) if stamps else None
+
+
+def not_modified(etag: str, last_modified: datetime | None) -> bool:
+    """
+    RFC 9110: If-None-Match wins; If-Modified-Since is only consulted
+    without it (second precision).
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def conditional(etag: str, last_modified: datetime | None, body=None) -> Response:
+    """
+    304 if the client's copy is current, else body() as JSON. Both carry the
+    validators; clients are told to revalidate on every use.
+    """
+    if not_modified(etag, last_modified):
+        resp = Response(status=304)
+    else:
+        resp = jsonify(body())
+    resp.set_etag(etag)
+    if last_modified is not None:
+        resp.last_modified = last_modified
+    resp.cache_control.no_cache = True
+    return resp
+
+
+def weights_changed(cur) -> datetime | None:
+    """
+    When the rank weights last changed; None until a scorer has installed
+    public.rank_weights.
+    """
+    try:
+        cur.execute(WEIGHTS_CHANGED)
+    except psycopg.errors.UndefinedTable:
+        cur.connection.rollback()
+        return None
+    return cur.fetchone()[0]
+
+
+def article_columns(fields: list[str]) -> str:
+    return ", ".join(fields) + f", {ARTICLE_MODIFIED} AS modified"
+
+
+def sort_arg() -> str:
+    sort = (request.args.get("sort") or listing.DEFAULT_SORT).strip().lower()
+    if sort not in listing.SORTS:
+        abort(400, description=f"unknown sort; allowed: {', '.join(listing.SORTS)}")
+    return sort
+
+
+@bp.route("/articles")
+def articles():
+    fields = parse_fields(ARTICLE_FIELDS, LIST_FIELDS)
+    sort = sort_arg()
+    page, limit, _ = parse_paging()
+    after = request.args.get("after")
+    before = request.args.get("before")
+    for name, cursor in (("after", after), ("before", before)):
+        if cursor and listing.decode_cursor(cursor, sort) is None:
+            abort(400, description=f"invalid {name} cursor for sort={sort}")
+    if not after and not before and page > listing.MAX_OFFSET_PAGES:
+        abort(400, description=f"page is capped at {listing.MAX_OFFSET_PAGES}; page on with the next/prev cursors (after/before)")
+
+    with instrumentation.connect(get_db()) as conn:
+        total = stats.get_counts(conn)["total"]
+        with conn.cursor() as cur:
+            rows, next_cursor, prev_cursor = listing.fetch_page(
+                cur, sort, limit, after=after, before=before, page=page, columns=article_columns(fields),
+            )
+            weights_at = weights_changed(cur)
+
+    stamps = [r[-1] for r in rows]
+    etag = make_etag("articles", fields, sort, limit, after, before, page, total, weights_at, rows)
+    return conditional(etag, latest(weights_at, *stamps), lambda: {
+        "items": records(fields, (r[:-1] for r in rows)),
+        "next": next_cursor,
+        "prev": prev_cursor,
+        "total": total,
+    })
+
+
+@bp.route("/search")
+def search_articles():
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        abort(400, description="q is required")
+    fields = parse_fields(ARTICLE_FIELDS, LIST_FIELDS)
+    sort = (request.args.get("sort") or "relevance").strip().lower()
+    if sort != "relevance" and sort not in listing.SORTS:
+        abort(400, description=f"unknown sort; allowed: relevance, {', '.join(listing.SORTS)}")
+    page, limit, offset = parse_paging()
+
+    with instrumentation.connect(get_db()) as conn:
+        with conn.cursor() as cur:
+            rows, total = search.search(
+                cur, q, None if sort == "relevance" else listing.order_by(sort), limit, offset,
+                columns=article_columns(fields),
+            )
+            weights_at = weights_changed(cur)
+
+    stamps = [r[-1] for r in rows]
+    etag = make_etag("search", fields, q, sort, page, limit, total, weights_at, rows)
+    return conditional(etag, latest(weights_at, *stamps), lambda: {
+        "items": records(fields, (r[:-1] for r in rows)),
+        "page": page,
+        "limit": limit,
+        "total": total,
+    })
+
+
+@bp.route("/papers/<int:pmid>")
+def paper(pmid: int):
+    fields = parse_fields(ARTICLE_FIELDS, PAPER_FIELDS)
+
+    with instrumentation.connect(get_db()) as conn:
+        with conn.cursor() as cur:
+            # validators first: a 304 never reads the large columns
+            cur.execute(PAPER_VALIDATOR, (pmid,))
+            found = cur.fetchone()
+            if not found:
+                abort(404, description=f"pmid {pmid} not found")
+            weights_at = weights_changed(cur)
+
+            etag = make_etag("paper", pmid, fields, found[0], weights_at)
+            last_modified = latest(found[0], weights_at)
+            if not_modified(etag, last_modified):
+                return conditional(etag, last_modified)
+
+            cur.execute(PAPER.format(columns=", ".join(fields)), (pmid,))
+            row = cur.fetchone()
+
+    return conditional(etag, last_modified, lambda: records(fields, [row])[0])
+
+
+@bp.route("/insights")
+def insights():
+    fields = parse_fields(INSIGHT_FIELDS, INSIGHT_LIST_FIELDS)
+    page, limit, offset = parse_paging()
+    agent = request.args.get("agent") or None
+
+    with instrumentation.connect(get_db()) as conn:
+        with conn.cursor() as cur:
+            cur.execute(INSIGHTS.format(columns=", ".join(fields)), {
+                "agent": agent, "limit": limit, "offset": offset,
+            })
+            rows = cur.fetchall()
+
+    total = rows[0][-1] if rows else 0
+    stamps = [r[-2] for r in rows]
+    etag = make_etag("insights", fields, agent, page, limit, rows)
+    return conditional(etag, latest(*stamps), lambda: {
+        "items": records(fields, (r[:-2] for r in rows)),
+        "page": page,
+        "limit": limit,
+        "total": total,
+    })
+
+
+@bp.route("/trials")
+def trials():
+    fields = parse_fields(TRIAL_FIELDS, TRIAL_LIST_FIELDS)
+    page, limit, offset = parse_paging()
+    raw = request.args.get("status")
+    statuses = [s.strip().upper() for s in raw.split(",") if s.strip()] if raw else None
+
+    with instrumentation.connect(get_db()) as conn:
+        with conn.cursor() as cur:
+            cur.execute(TRIALS.format(columns=", ".join(fields)), {
+                "statuses": statuses, "limit": limit, "offset": offset,
+            })
+            rows = cur.fetchall()
+
+    total = rows[0][-1] if rows else 0
+    items = records(fields, (r[:-1] for r in rows))
+    # no row timestamps on trials: validate by content
+    etag = make_etag("trials", fields, statuses, page, limit, total, items)
+    return conditional(etag, None, lambda: {
+        "items": items,
+        "page": page,
+        "limit": limit,
+        "total": total,
+    })
@@ -1,13 +1,28 @@
 import os
 import math
-import psycopg
+from psycopg.rows import dict_row
 from dotenv import load_dotenv
-from flask import Flask, render_template, request
+from flask import Flask, jsonify, make_response, redirect, render_template, request, url_for
+
+import aggregates
+import api
+import export
+import instrumentation
+import listing
+import page_cache
+import paper_docs
+import related_papers
+import search
+import stats
 
 load_dotenv()
 
 app = Flask(__name__)
+app.register_blueprint(api.bp)
+app.register_blueprint(export.bp)
+instrumentation.init_app(app)
 PER_PAGE = 25
+INSIGHTS_PER_PAGE = 20
 
 # rough demo estimate for total Parkinson's literature universe
 ESTIMATED_TOTAL_PAPERS = 120000
@@ -23,17 +38,18 @@ def get_db():
 def grade(score):
     if score is None:
         return "U"
-    if score >= 85:
-        return "A"
-    if score >= 70:
-        return "B"
-    if score >= 55:
-        return "C"
-    if score >= 40:
-        return "D"
+    for low, letter in paper_docs.GRADES:
+        if score >= low:
+            return letter
     return "E"
 
 
+def cached_response(html, hit):
+    resp = make_response(html)
+    resp.headers["X-Cache"] = "HIT" if hit else "MISS"
+    return resp
+
+
 @app.route("/")
 def index():
     db = get_db()
@@ -41,91 +57,55 @@ def index():
     sort = (request.args.get("sort", "rank") or "rank").strip().lower()
     q = (request.args.get("q") or "").strip()
 
+    after = request.args.get("after")
+    before = request.args.get("before")
+
     if page < 1:
         page = 1
 
     offset = (page - 1) * PER_PAGE
+    if sort not in listing.SORTS:
+        sort = listing.DEFAULT_SORT
+
+    # bare ?page=N is served by OFFSET only this deep; link to what is shown
+    if not q and not after and not before and page > listing.MAX_OFFSET_PAGES:
+        return redirect(url_for("index", sort=sort, page=listing.MAX_OFFSET_PAGES))
+
+    html, hit = page_cache.cached(
+        ("index", sort, q, page, after, before),
+        lambda: render_index(db, sort, q, page, offset, after, before),
+        page_cache.LIST_TTL,
+        page_cache.list_scope(),
+    )
+    return cached_response(html, hit)
 
-    sort_sql = {
-        "rank": "rank_score DESC NULLS LAST, ai_score DESC NULLS LAST, publication_date DESC NULLS LAST, created_at DESC",
-        "ai": "ai_score DESC NULLS LAST, rank_score DESC NULLS LAST, publication_date DESC NULLS LAST, created_at DESC",
-        "base": "base_score DESC NULLS LAST, rank_score DESC NULLS LAST, publication_date DESC NULLS LAST, created_at DESC",
-        "newest": "publication_date DESC NULLS LAST, created_at DESC",
-        "oldest": "publication_date ASC NULLS LAST, created_at ASC",
-    }.get(sort, "rank_score DESC NULLS LAST, ai_score DESC NULLS LAST, publication_date DESC NULLS LAST, created_at DESC")
 
-    with psycopg.connect(db) as conn:
+def render_index(db, sort, q, page, offset, after, before):
+    with instrumentation.connect(db) as conn:
         with conn.cursor() as cur:
-            # global stats for the hero bars/cards
-            cur.execute("SELECT count(*) FROM public.articles")
-            total_row = cur.fetchone()
-            total = total_row[0] if total_row else 0
-
-            cur.execute("SELECT count(*) FROM public.articles WHERE rank_score IS NOT NULL")
-            scored_row = cur.fetchone()
-            scored_count = scored_row[0] if scored_row else 0
-
-            cur.execute("SELECT count(*) FROM public.articles WHERE ai_score IS NOT NULL")
-            ai_row = cur.fetchone()
-            ai_count = ai_row[0] if ai_row else 0
+            # global stats for the hero bars/cards (trigger-maintained, cached)
+            counts = stats.get_counts(conn)
+            total = counts["total"]
+            scored_count = counts["ranked"]
+            ai_count = counts["ai_scored"]
 
             # filtered results
             if q:
-                like = f"%{q}%"
-
-                cur.execute(f"""
-                    SELECT
-                        pmid,
-                        title,
-                        journal,
-                        publication_date,
-                        ai_score,
-                        base_score,
-                        rank_score,
-                        ai_summary,
-                        why_it_matters
-                    FROM public.articles
-                    WHERE
-                        title ILIKE %s
-                        OR abstract ILIKE %s
-                        OR journal ILIKE %s
-                        OR CAST(pmid AS TEXT) ILIKE %s
-                    ORDER BY {sort_sql}
-                    LIMIT %s OFFSET %s
-                """, (like, like, like, like, PER_PAGE, offset))
-                rows = cur.fetchall()
-
-                cur.execute("""
-                    SELECT count(*)
-                    FROM public.articles
-                    WHERE
-                        title ILIKE %s
-                        OR abstract ILIKE %s
-                        OR journal ILIKE %s
-                        OR CAST(pmid AS TEXT) ILIKE %s
-                """, (like, like, like, like))
-                filtered_total_row = cur.fetchone()
+                # default sort ranks by relevance blended with rank_score
+                rows, filtered_total = search.search(
+                    cur, q, None if sort == "rank" else listing.order_by(sort), PER_PAGE, offset
+                )
+                prev_url = url_for("index", q=q, sort=sort, page=page - 1) if page > 1 else None
+                next_url = url_for("index", q=q, sort=sort, page=page + 1) if offset + PER_PAGE < filtered_total else None
             else:
-                cur.execute(f"""
-                    SELECT
-                        pmid,
-                        title,
-                        journal,
-                        publication_date,
-                        ai_score,
-                        base_score,
-                        rank_score,
-                        ai_summary,
-                        why_it_matters
-                    FROM public.articles
-                    ORDER BY {sort_sql}
-                    LIMIT %s OFFSET %s
-                """, (PER_PAGE, offset))
-                rows = cur.fetchall()
-
-                filtered_total_row = total_row
-
-    filtered_total = filtered_total_row[0] if filtered_total_row else 0
+                # keyset pages; page numbers are approximate (from the cached total)
+                rows, next_cursor, prev_cursor = listing.fetch_page(
+                    cur, sort, PER_PAGE, after=after, before=before, page=page
+                )
+                filtered_total = total
+                prev_url = url_for("index", sort=sort, page=max(1, page - 1), before=prev_cursor) if prev_cursor else None
+                next_url = url_for("index", sort=sort, page=page + 1, after=next_cursor) if next_cursor else None
+
     total_pages = max(1, math.ceil(filtered_total / PER_PAGE))
 
     if page > total_pages:
@@ -163,6 +143,8 @@ def index():
         filtered_total=filtered_total,
         sort=sort,
         q=q,
+        prev_url=prev_url,
+        next_url=next_url,
         coverage=coverage,
         scored_pct=scored_pct,
         ai_pct=ai_pct,
@@ -171,60 +153,136 @@ def index():
     )
 
 
-@app.route("/paper/<pmid>")
+@app.route("/paper/<int:pmid>")
 def paper(pmid):
     db = get_db()
+    html, hit = page_cache.cached(
+        ("paper", pmid),
+        lambda: render_paper(db, pmid),
+        page_cache.PAPER_TTL,
+        page_cache.paper_scope(pmid),
+    )
+    if html is None:
+        return "Not found", 404
+    return cached_response(html, hit)
 
-    with psycopg.connect(db) as conn:
-        with conn.cursor() as cur:
+
+def render_paper(db, pmid):
+    with instrumentation.connect(db) as conn:
+        doc = paper_docs.get(conn, pmid)
+        related = related_papers.neighbors(conn, pmid) if doc is not None else []
+
+    if doc is None:
+        return None
+    return render_template("paper.html", paper=doc, related=related)
+
+
+@app.route("/abandoned")
+def abandoned():
+    db = get_db()
+    q = (request.args.get("q") or "").strip()
+
+    with instrumentation.connect(db) as conn:
+        with conn.cursor(row_factory=dict_row) as cur:
             cur.execute("""
-                SELECT
-                    pmid,
-                    title,
-                    journal,
-                    publication_date,
-                    ai_score,
-                    base_score,
-                    rank_score,
-                    abstract,
-                    ai_summary,
-                    why_it_matters,
-                    mechanisms,
-                    candidate_interventions,
-                    red_flags,
-                    ai_confidence,
-                    narrative_score,
-                    score_components
-                FROM public.articles
-                WHERE pmid = %s
-                LIMIT 1
-            """, (pmid,))
-            row = cur.fetchone()
-
-    if not row:
-        return "Not found", 404
+                SELECT nct_id, title, sponsor, status, phase, url
+                FROM trials
+                WHERE status = ANY(%(statuses)s)
+                  AND (
+                      %(like)s::text IS NULL
+                      OR title ILIKE %(like)s
+                      OR sponsor ILIKE %(like)s
+                      OR nct_id ILIKE %(like)s
+                      OR conditions ILIKE %(like)s
+                  )
+                ORDER BY completion_date DESC NULLS LAST, id DESC
+                LIMIT 200
+            """, {
+                "statuses": list(aggregates.ABANDONED_STATUSES),
+                "like": search.like_pattern(q) if q else None,
+            })
+            trials = cur.fetchall()
+
+    return render_template("abandoned.html", trials=trials, q=q)
+
+
+@app.route("/drugs")
+def drugs():
+    with instrumentation.connect(get_db()) as conn:
+        rows = aggregates.drugs(conn)
+    return render_template("drugs.html", drugs=rows)
+
+
+@app.route("/sponsors")
+def sponsors():
+    with instrumentation.connect(get_db()) as conn:
+        rows = aggregates.sponsors(conn)
+    return render_template("sponsors.html", sponsors=rows)
+
+
+@app.route("/insights")
+def insights():
+    db = get_db()
+    page = max(1, request.args.get("page", 1, type=int))
+
+    with instrumentation.connect(db) as conn:
+        with conn.cursor(row_factory=dict_row) as cur:
+            cur.execute("""
+                SELECT id, agent_name, title, summary, score, created_at,
+                       count(*) OVER () AS total
+                FROM insights
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s OFFSET %s
+            """, (INSIGHTS_PER_PAGE, (page - 1) * INSIGHTS_PER_PAGE))
+            items = cur.fetchall()
 
-    paper_data = {
-        "pmid": row[0],
-        "title": row[1],
-        "journal": row[2],
-        "publication_date": row[3],
-        "ai_score": row[4],
-        "base_score": row[5],
-        "rank_score": row[6],
-        "abstract": row[7] or "",
-        "ai_summary": row[8] or "",
-        "why_it_matters": row[9] or "",
-        "mechanisms": row[10] or [],
-        "candidate_interventions": row[11] or [],
-        "red_flags": row[12] or [],
-        "ai_confidence": row[13],
-        "narrative_score": row[14],
-        "score_components": row[15],
-        "grade": grade(row[6] if row[6] is not None else (row[4] if row[4] is not None else row[5])),
-    }
-
-    return render_template("paper.html", paper=paper_data)
+    total = items[0]["total"] if items else 0
+    total_pages = max(1, math.ceil(total / INSIGHTS_PER_PAGE))
+    return render_template("insights.html", items=items, total=total, page=page, total_pages=total_pages)
+
+
+@app.route("/dashboard")
+def dashboard():
+    db = get_db()
+    tag = (request.args.get("tag") or "").strip().lower() or None
+    q = (request.args.get("q") or "").strip()
+
+    with instrumentation.connect(db) as conn:
+        tag_counts = aggregates.tag_counts(conn)
+        with conn.cursor(row_factory=dict_row) as cur:
+            cur.execute("""
+                SELECT
+                    p.id,
+                    p.external_id AS pmid,
+                    p.title,
+                    p.abstract,
+                    p.journal,
+                    p.publication_date,
+                    COALESCE(ps.total_score, 0) AS score
+                FROM papers p
+                LEFT JOIN paper_scores ps ON ps.paper_id = p.id
+                WHERE (
+                      %(tag)s::text IS NULL
+                      OR EXISTS (
+                          SELECT 1
+                          FROM paper_tags pt
+                          JOIN tags t ON t.id = pt.tag_id
+                          WHERE pt.paper_id = p.id AND t.name = %(tag)s
+                      )
+                  )
+                  AND (%(like)s::text IS NULL OR p.title ILIKE %(like)s OR p.abstract ILIKE %(like)s)
+                ORDER BY score DESC, p.publication_date DESC NULLS LAST, p.id DESC
+                LIMIT 100
+            """, {"tag": tag, "like": search.like_pattern(q) if q else None})
+            papers = cur.fetchall()
+
+    return render_template("dashboard.html", papers=papers, tag_counts=tag_counts, tag=tag, q=q)
+
+
+@app.route("/api/redis-latency")
+def redis_latency():
+    backend, ms = page_cache.ping_ms()
+    return jsonify({"latency_ms": ms, "backend": backend})
 
 
 @app.route("/ping")
@@ -1,5 +1,7 @@
 import re
-from db import execute
+
+import aggregates
+from db import execute, get_conn
 
 # Intervention types we care about (ClinicalTrials uses many; drug/biological are key)
 GOOD_TYPES = {"DRUG", "BIOLOGICAL", "DIETARY_SUPPLEMENT", "OTHER"}
@@ -70,6 +72,10 @@ def main():
 
     print(f"Done. Processed {len(interventions)} interventions. Created/ensured {created} drugs. Linked {linked} trial_drugs.")
 
+    with get_conn() as conn:
+        aggregates.refresh(conn, ["drug_trial_counts"])
+    print("Refreshed drug aggregates.")
+
 if __name__ == "__main__":
     main()
 
@@ -0,0 +1,219 @@
+"""
+export.py
+Streaming export of ranked article sets (Flask blueprint, mounted by app.py).
+
+  GET /api/export?format=csv|ndjson|parquet&q=&sort=&fields=&limit=
+
+q and sort mean what they mean on the home page (app.index): without q the
+whole listing in sort order, with q every search match (sort=rank ranks by
+relevance). fields takes the same whitelist as the JSON API.
+
+Rows come from a server-side (named) cursor EXPORT_FETCH_SIZE at a time and
+are encoded and sent chunk by chunk (no Content-Length, so chunked transfer
+encoding), so a worker holds one chunk in memory however large the export.
+Parquet is written one row group (EXPORT_ROW_GROUP rows) at a time and
+needs the optional pyarrow package.
+"""
+
+import csv
+import io
+import json
+import os
+
+from flask import Blueprint, Response, abort, request
+from werkzeug.exceptions import HTTPException
+
+import api
+import instrumentation
+import listing
+import search
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # parquet export disabled
+    pa = None
+    pq = None
+
+bp = Blueprint("export", __name__, url_prefix="/api")
+bp.register_error_handler(HTTPException, api.json_error)
+
+FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "2000"))
+ROW_GROUP_SIZE = int(os.getenv("EXPORT_ROW_GROUP", "20000"))
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# jsonb columns: nested JSON in NDJSON, JSON text in CSV / Parquet
+JSON_FIELDS = {
+    "mechanisms", "candidate_interventions", "red_flags", "score_components",
+    "authors", "keywords", "mesh_terms", "publication_types",
+}
+FLOAT_FIELDS = {"ai_score", "base_score", "rank_score", "narrative_score", "ai_confidence"}
+TIMESTAMP_FIELDS = {"scored_at", "updated_at"}
+
+
+def row_chunks(q: str, sort: str, fields: list[str], limit: int | None):
+    """
+    Lists of up to FETCH_SIZE rows, straight off a server-side cursor. The
+    connection lives exactly as long as the generator, so a client that
+    disconnects mid-export closes it.
+    """
+    columns = ", ".join(fields)
+    with instrumentation.connect(api.get_db()) as conn:
+        if q:
+            with conn.cursor() as cur:
+                sql, params = search.stream_query(
+                    cur, q, None if sort == "rank" else listing.order_by(sort), columns,
+                )
+        else:
+            sql, params = listing.stream_query(sort, columns), {}
+        if limit:
+            sql += "LIMIT %(export_limit)s\n"
+            params["export_limit"] = limit
+
+        with conn.cursor(name="export") as cur:
+            cur.itersize = FETCH_SIZE
+            cur.execute(sql, params or None)
+            while rows := cur.fetchmany(FETCH_SIZE):
+                yield rows
+
+
+def csv_cell(field: str, value):
+    if value is None:
+        return ""
+    if field in JSON_FIELDS:
+        return json.dumps(value, ensure_ascii=False)
+    return api.jsonable(value)
+
+
+def encode_csv(fields: list[str], chunks):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(fields)
+    for rows in chunks:
+        for row in rows:
+            writer.writerow([csv_cell(f, v) for f, v in zip(fields, row)])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()  # header only: no rows matched
+
+
+def encode_ndjson(fields: list[str], chunks):
+    for rows in chunks:
+        yield "".join(
+            json.dumps({f: api.jsonable(v) for f, v in zip(fields, row)}, ensure_ascii=False) + "\n"
+            for row in rows
+        )
+
+
+class ChunkSink:
+    """
+    Write-only file object for ParquetWriter; drain() hands back what has
+    been written since the last call.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.pos = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.parts.append(data)
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out = b"".join(self.parts)
+        self.parts = []
+        return out
+
+
+def parquet_type(field: str):
+    if field == "pmid":
+        return pa.int64()
+    if field == "publication_date":
+        return pa.date32()
+    if field in FLOAT_FIELDS:
+        return pa.float64()
+    if field in TIMESTAMP_FIELDS:
+        return pa.timestamp("us", tz="UTC")
+    return pa.string()
+
+
+def parquet_column(field: str, values: list):
+    if field in JSON_FIELDS:
+        values = [None if v is None else json.dumps(v, ensure_ascii=False) for v in values]
+    elif field == "pmid":
+        values = [None if v is None else int(v) for v in values]
+    return values
+
+
+def encode_parquet(fields: list[str], chunks):
+    schema = pa.schema([(f, parquet_type(f)) for f in fields])
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+
+    def write(rows):
+        cols = list(zip(*rows))
+        writer.write_table(pa.table(
+            {f: pa.array(parquet_column(f, list(col)), type=schema.field(f).type) for f, col in zip(fields, cols)},
+            schema=schema,
+        ))
+
+    pending = []
+    for rows in chunks:
+        pending.extend(rows)
+        if len(pending) >= ROW_GROUP_SIZE:
+            write(pending)
+            pending = []
+            yield sink.drain()
+    if pending:
+        write(pending)
+    writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson, "parquet": encode_parquet}
+
+
+@bp.route("/export")
+def export():
+    fmt = (request.args.get("format") or "csv").strip().lower()
+    if fmt not in FORMATS:
+        abort(400, description=f"unknown format; allowed: {', '.join(FORMATS)}")
+    if fmt == "parquet" and pa is None:
+        abort(501, description="parquet export needs pyarrow installed")
+
+    fields = api.parse_fields(api.ARTICLE_FIELDS, api.LIST_FIELDS)
+    q = (request.args.get("q") or "").strip()
+    sort = (request.args.get("sort") or listing.DEFAULT_SORT).strip().lower()
+    if sort not in listing.SORTS:
+        sort = listing.DEFAULT_SORT
+    limit = request.args.get("limit", type=int)
+    if limit is not None and limit < 1:
+        abort(400, description="limit must be positive")
+
+    # arguments are read here: the generator runs after the request context is gone
+    body = ENCODERS[fmt](fields, row_chunks(q, sort, fields, limit))
+    resp = Response(body, mimetype=FORMATS[fmt])
+    resp.headers["Content-Disposition"] = f'attachment; filename="articles-{sort}.{fmt}"'
+    resp.headers["X-Accel-Buffering"] = "no"  # let nginx pass chunks through
+    resp.cache_control.no_store = True
+    return resp
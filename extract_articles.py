@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+extract_articles.py
+One LLM call per article with a superset schema, fanned out in one transaction to:
+  - public.articles       (agent_score/summary_1s/tags + ai_score/mechanisms/...)
+  - paper_signals         (same columns agent_pass_signals writes)
+  - article_summaries     (plain / technical / signals, as summarize_new_articles writes)
+
+Replaces running agents.llm, score_articles_ai, agent_pass_signals,
+summarize_new_articles and agent_step4_openai_score separately on the same article.
+
+Requirements:
+  pip install openai psycopg[binary] python-dotenv
+
+Env:
+  DATABASE_URL
+  OPENAI_API_KEY
+  EXTRACT_BATCH (default 25)
+  EXTRACT_WORKERS (default 4; concurrent LLM calls)
+  EXTRACT_MODEL (default OPENAI_MODEL or gpt-4.1-mini)
+
+Rows whose extraction failed (agent_status 'extract_error') are not picked
+up again; after fixing the cause, queue them with:
+  python extract_articles.py --retry-errors
+"""
+
+import os
+import json
+import hashlib
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg
+from psycopg.rows import dict_row
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from agents import schemas
+from agents.llm_cache import Scope, prompt_version
+from agents.prompting import compact_abstract, compact_json
+from agent_pass_signals import UPSERT_SIGNALS
+from score_articles_ai import compute_ai_score
+import llm_gate
+import page_cache
+import paper_docs
+import ranking
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "").strip()  # e.g. mock_llm_server.py
+
+BATCH = int(os.getenv("EXTRACT_BATCH", "25"))
+WORKERS = int(os.getenv("EXTRACT_WORKERS", "4"))
+MODEL = os.getenv("EXTRACT_MODEL", os.getenv("OPENAI_MODEL", "gpt-4.1-mini")).strip()
+AGENT_VERSION = "extract-v1"
+CLAWBOT_NAME = "extract"
+
+if not DATABASE_URL:
+    raise SystemExit("Missing DATABASE_URL")
+if not OPENAI_API_KEY:
+    raise SystemExit("Missing OPENAI_API_KEY")
+
+client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None)
+
+SYSTEM = (
+    "You are Neurocompute, a biomedical research triage agent for Parkinson's and Alzheimer's drug discovery. "
+    "Never invent facts not present in the title/abstract. Be conservative: if unclear, score lower. "
+    "Return ONLY valid JSON that matches the schema exactly. If unknown, use null or an empty list."
+)
+
+CACHE = Scope(MODEL, prompt_version(SYSTEM, json.dumps(schemas.EXTRACTION, sort_keys=True)))
+
+def stable_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
+
+def prompt_for(title: str, abstract: str | None) -> str:
+    abstract = compact_abstract(abstract)
+    return f"""
+Extract everything below from this article for a Parkinson's/Alzheimer's discovery dashboard.
+
+JSON schema (must match exactly):
+{compact_json(schemas.wire_schema(schemas.EXTRACTION))}
+
+Article:
+Title: {title}
+
+Abstract:
+{abstract if abstract else "(no abstract provided)"}
+""".strip()
+
+def extract(title: str, abstract: str | None) -> dict:
+    user_prompt = prompt_for(title, abstract)
+    return CACHE.call(user_prompt, lambda: schemas.complete(
+        client,
+        api="chat",
+        model=MODEL,
+        schema=schemas.EXTRACTION,
+        system=SYSTEM,
+        user=user_prompt,
+        temperature=0.2,
+    ))
+
+# =========================
+# Fan-out
+# =========================
+FETCH = f"""
+SELECT a.id, a.pmid, a.title, a.abstract, a.base_score,
+       a.journal, a.publication_date, a.publication_types, a.gate_released_at
+FROM public.articles a
+LEFT JOIN paper_signals ps ON ps.article_id = a.id
+WHERE {llm_gate.not_gated_sql("a.agent_status")}
+  AND COALESCE(a.agent_status, '') <> 'extract_error'
+  AND (
+       a.ai_score IS NULL
+    OR a.agent_score IS NULL
+    OR ps.article_id IS NULL
+    OR NOT EXISTS (
+        SELECT 1 FROM article_summaries s
+        WHERE s.article_id = a.id AND s.summary_type = 'signals'
+    )
+  )
+ORDER BY a.base_score DESC NULLS LAST, a.publication_date DESC NULLS LAST, a.id DESC
+LIMIT %s
+"""
+
+UPDATE_ARTICLE = """
+UPDATE public.articles
+SET agent_score = %(agent_score)s,
+    summary_1s = %(summary_1s)s,
+    tags = %(tags)s::jsonb,
+    score_components = COALESCE(score_components, '{}'::jsonb) || %(components)s::jsonb,
+    ai_score = %(ai_score)s,
+    ai_confidence = %(ai_confidence)s,
+    ai_summary = %(ai_summary)s,
+    why_it_matters = %(why_it_matters)s,
+    mechanisms = %(mechanisms)s::jsonb,
+    candidate_interventions = %(candidate_interventions)s::jsonb,
+    red_flags = %(red_flags)s::jsonb,
+    ai_model = %(ai_model)s,
+    agent_status = 'done',
+    agent_last_error = NULL,
+    scored_at = NOW(),
+    updated_at = NOW()
+WHERE id = %(id)s
+"""
+
+UPSERT_SUMMARY = """
+INSERT INTO article_summaries (article_id, model, summary_type, summary, metadata)
+VALUES (%s, %s, %s, %s, %s)
+ON CONFLICT (article_id, summary_type) DO UPDATE
+SET summary = EXCLUDED.summary,
+    model = EXCLUDED.model,
+    metadata = EXCLUDED.metadata
+"""
+
+# own status, so other pipelines' failures are neither skipped nor retried here
+MARK_ERROR = """
+UPDATE public.articles
+SET agent_status = 'extract_error',
+    agent_last_error = %s,
+    updated_at = NOW()
+WHERE id = %s
+"""
+
+RETRY_ERRORS = """
+UPDATE public.articles
+SET agent_status = NULL,
+    updated_at = NOW()
+WHERE agent_status = 'extract_error'
+"""
+
+def article_params(row: dict, out: dict) -> dict:
+    article_id = row["id"]
+    scores = out["scores"]
+    ents = out["entities"]
+
+    ai_score = compute_ai_score(scores)
+    return {
+        "id": article_id,
+        "agent_score": scores["agent_score"],
+        "summary_1s": out["summary_1s"],
+        "tags": json.dumps({k: ents[k] for k in ("compounds", "targets", "pathways", "models")}),
+        "components": json.dumps({k: scores[k] for k in ("relevance", "novelty", "evidence", "actionability")}),
+        "ai_score": ai_score,
+        "ai_confidence": scores["confidence"],
+        "ai_summary": out["ai_summary"],
+        "why_it_matters": out["why_it_matters"],
+        "mechanisms": json.dumps(ents["mechanisms"][:5]),
+        "candidate_interventions": json.dumps(ents["candidate_interventions"][:5]),
+        "red_flags": json.dumps(out["red_flags"]),
+        "ai_model": MODEL,
+    }
+
+def signals_params(row: dict, out: dict, phash: str) -> dict:
+    scores = out["scores"]
+    return {
+        "article_id": row["id"],
+        "summary_1_sentence": out["summary_1s"],
+        "mechanism_of_action": out["mechanism_of_action"],
+        "sponsor_name": out["sponsor_name"],
+        "repurpose_flag": out["flags"]["repurpose"],
+        "natural_compound_flag": out["flags"]["natural_compound"],
+        "abandoned_trial_flag": out["flags"]["abandoned_trial"],
+        "novelty_score": scores["mechanistic_novelty"],
+        "neglected_score": scores["neglected_score"],
+        "tags": json.dumps(out["tags"]),
+        "agent_version": AGENT_VERSION,
+        "model_name": MODEL,
+        "prompt_hash": phash,
+        "confidence": round(scores["confidence"] / 100.0, 2),
+    }
+
+def summary_signals(out: dict) -> dict:
+    """
+    The metadata.signals object in the shape summarize_new_articles writes
+    (agent_trendscout reads it).
+    """
+    ents = out["entities"]
+    return {
+        "diseases": ents["diseases"],
+        "study_type": out["study_type"],
+        "models": ents["models"],
+        "mechanisms": ents["mechanisms"],
+        "targets_pathways": ents["targets"] + ents["pathways"],
+        "compounds_interventions": out["compounds_interventions"],
+        "biomarkers": ents["biomarkers"],
+        "outcomes": ents["outcomes"],
+        "trial_phase": out["trial_phase"],
+        "repurposing_signal": out["flags"]["repurpose"],
+        "novelty_signal": out["novelty_signal"],
+        "confidence": round(out["scores"]["confidence"] / 100.0, 2),
+        "notes": out["notes"],
+    }
+
+def write_all(conn, row: dict, out: dict):
+    """
+    articles + paper_signals + article_summaries (and the paper document)
+    for one article, one transaction.
+    """
+    article_id = row["id"]
+    title = row["title"]
+    abstract = row["abstract"]
+    phash = stable_hash(prompt_for(title, abstract))
+
+    signals = summary_signals(out)
+    metadata = json.dumps({"signals": signals})
+    technical = "\n".join(f"- {x}" for x in out["technical_summary"])
+
+    with conn.transaction():
+        conn.execute(UPDATE_ARTICLE, article_params(row, out))
+        conn.execute(UPSERT_SIGNALS, signals_params(row, out, phash))
+        conn.execute(UPSERT_SUMMARY, (article_id, MODEL, "plain", out["plain_summary"], metadata))
+        conn.execute(UPSERT_SUMMARY, (article_id, MODEL, "technical", technical, metadata))
+        conn.execute(UPSERT_SUMMARY, (article_id, MODEL, "signals", json.dumps(signals, ensure_ascii=False, indent=2), metadata))
+        with conn.cursor() as cur:
+            paper_docs.rebuild(cur, ids=[article_id])
+
+def extract_row(row: dict):
+    try:
+        return extract(row["title"] or "", row["abstract"]), None
+    except Exception as e:
+        return None, e
+
+def main():
+    processed = 0
+    failed = 0
+
+    with psycopg.connect(DATABASE_URL, autocommit=True, row_factory=dict_row) as conn:
+        llm_gate.ensure_schema(conn)
+        ranking.ensure_schema(conn)
+        paper_docs.ensure_schema(conn)
+
+        if "--retry-errors" in sys.argv:
+            n = conn.execute(RETRY_ERRORS).rowcount
+            print(f"[extract] {n} failed articles queued again")
+
+        fetched = conn.execute(FETCH, (BATCH,)).fetchall()
+        rows, gated = llm_gate.split(fetched)
+        if gated:
+            with conn.transaction(), conn.cursor() as cur:
+                llm_gate.mark_gated(cur, gated)
+            print(f"[extract] gated {len(gated)} ({llm_gate.summarize(gated)})")
+        if not rows:
+            print("[extract] nothing to extract")
+            return
+
+        print(f"[extract] {len(rows)} articles, model={MODEL}, workers={WORKERS}")
+
+        with ThreadPoolExecutor(max_workers=max(1, WORKERS)) as pool:
+            for row, (out, err) in zip(rows, pool.map(extract_row, rows)):
+                article_id = row["id"]
+                if err is None:
+                    try:
+                        write_all(conn, row, out)
+                        processed += 1
+                        print(f"[extract] article_id={article_id} OK (articles+signals+summaries)")
+                        continue
+                    except Exception as e:
+                        err = e
+                failed += 1
+                print(f"[extract] article_id={article_id} ERROR {type(err).__name__}: {err}", file=sys.stderr)
+                conn.execute(MARK_ERROR, (f"{type(err).__name__}: {err}"[:2000], article_id))
+
+    page_cache.invalidate(row["pmid"] for row in fetched)
+    print(f"[extract] done. processed={processed} failed={failed}")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        print(traceback.format_exc(), file=sys.stderr)
+        raise
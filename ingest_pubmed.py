@@ -24,6 +24,12 @@ import psycopg
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 
+import listing
+import page_cache
+import paper_docs
+import search
+import stats
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
@@ -210,6 +216,11 @@ def parse_pubmed_xml(xml_text: str) -> list[dict]:
             if mh.text:
                 mesh_terms.append(mh.text.strip())
 
+        publication_types = []
+        for pt in article.findall(".//Article/PublicationTypeList/PublicationType"):
+            if pt.text:
+                publication_types.append(pt.text.strip())
+
         out.append({
             "pmid": pmid,
             "doi": doi,
@@ -221,6 +232,7 @@ def parse_pubmed_xml(xml_text: str) -> list[dict]:
             "authors": authors,
             "keywords": keywords,
             "mesh_terms": mesh_terms,
+            "publication_types": publication_types,
         })
 
     return out
@@ -229,12 +241,12 @@ def parse_pubmed_xml(xml_text: str) -> list[dict]:
 UPSERT_SQL = """
 INSERT INTO public.articles
     (pmid, doi, url, title, abstract, journal, publication_date,
-     authors, keywords, mesh_terms,
+     authors, keywords, mesh_terms, publication_types,
      created_at, updated_at,
      agent_status, agent_score, summary_1s, tags, score_components, scored_at)
 VALUES
     (%(pmid)s, %(doi)s, %(url)s, %(title)s, %(abstract)s, %(journal)s, %(publication_date)s,
-     %(authors)s::jsonb, %(keywords)s::jsonb, %(mesh_terms)s::jsonb,
+     %(authors)s::jsonb, %(keywords)s::jsonb, %(mesh_terms)s::jsonb, %(publication_types)s::jsonb,
      now(), now(),
      'pending', NULL, NULL, NULL, NULL, NULL)
 ON CONFLICT (pmid)
@@ -248,6 +260,7 @@ DO UPDATE SET
     authors = CASE WHEN EXCLUDED.authors IS NOT NULL THEN EXCLUDED.authors ELSE public.articles.authors END,
     keywords = CASE WHEN EXCLUDED.keywords IS NOT NULL THEN EXCLUDED.keywords ELSE public.articles.keywords END,
     mesh_terms = CASE WHEN EXCLUDED.mesh_terms IS NOT NULL THEN EXCLUDED.mesh_terms ELSE public.articles.mesh_terms END,
+    publication_types = CASE WHEN EXCLUDED.publication_types IS NOT NULL THEN EXCLUDED.publication_types ELSE public.articles.publication_types END,
 
     agent_status = CASE
         WHEN (COALESCE(NULLIF(EXCLUDED.title,''), public.articles.title) IS DISTINCT FROM public.articles.title)
@@ -303,6 +316,32 @@ def db_preflight(conn: psycopg.Connection):
         if not reg:
             die("public.articles table not found. Wrong DB or schema not applied.")
 
+        # Only check: DDL here would lock public.articles on every run. Each
+        # module installs its own schema once from its entry point.
+        cur.execute("""
+            SELECT
+              EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = 'articles'
+                  AND column_name = 'publication_types'
+              ),
+              to_regclass('public.paper_documents') IS NOT NULL;
+        """)
+        has_types, has_docs = cur.fetchone()
+        if not has_types:
+            # read by llm_gate to skip errata/editorials before any LLM call
+            die("articles.publication_types not found. Run: python llm_gate.py")
+        if not has_docs:
+            die("public.paper_documents not found. Run: python paper_docs.py")
+
+        # search and listing work without their indexes, just slowly
+        missing = search.missing_indexes(cur, [*search.INDEXES, *listing.INDEXES])
+        if missing:
+            print(
+                f"[ingest_pubmed] WARNING: missing indexes {', '.join(missing)}; "
+                "run: python search.py --install && python listing.py"
+            )
+
         # Ensure pmid has a unique constraint or unique index.
         cur.execute("""
             SELECT
@@ -340,6 +379,7 @@ def upsert_articles(rows: list[dict]) -> tuple[int, int, int]:
             "authors": json.dumps(r.get("authors") or []),
             "keywords": json.dumps(r.get("keywords") or []),
             "mesh_terms": json.dumps(r.get("mesh_terms") or []),
+            "publication_types": json.dumps(r.get("publication_types") or []),
         })
 
     inserted = 0
@@ -347,6 +387,7 @@ def upsert_articles(rows: list[dict]) -> tuple[int, int, int]:
 
     with psycopg.connect(DATABASE_URL) as conn:
         db_preflight(conn)
+        stats.ensure_schema(conn)  # home page counters follow every insert from here on
 
         with conn.cursor() as cur:
             # Batch insert/upsert, but still get per-row RETURNING.
@@ -363,8 +404,11 @@ def upsert_articles(rows: list[dict]) -> tuple[int, int, int]:
                     else:
                         updated += 1
 
+            paper_docs.rebuild(cur, pmids=[r["pmid"] for r in rows])
+
         conn.commit()
 
+    page_cache.invalidate(r["pmid"] for r in rows)
     return (seen, inserted, updated)
 
 
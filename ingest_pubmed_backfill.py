@@ -36,6 +36,12 @@ from datetime import datetime
 from dotenv import load_dotenv
 from requests.exceptions import ChunkedEncodingError, ConnectionError, Timeout, HTTPError
 
+import listing
+import page_cache
+import paper_docs
+import search
+import stats
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
@@ -251,6 +257,12 @@ def parse_pubmed_xml(xml_text: str) -> list[dict]:
             if text:
                 mesh_terms.append(text)
 
+        publication_types = []
+        for pt in article.findall(".//Article/PublicationTypeList/PublicationType"):
+            text = "".join(pt.itertext()).strip() if pt is not None else ""
+            if text:
+                publication_types.append(text)
+
         out.append({
             "pmid": pmid,
             "doi": doi,
@@ -262,6 +274,7 @@ def parse_pubmed_xml(xml_text: str) -> list[dict]:
             "authors": json.dumps(authors),
             "keywords": json.dumps(keywords),
             "mesh_terms": json.dumps(mesh_terms),
+            "publication_types": json.dumps(publication_types),
         })
 
     return out
@@ -270,12 +283,12 @@ def parse_pubmed_xml(xml_text: str) -> list[dict]:
 UPSERT_SQL = """
 INSERT INTO public.articles
     (pmid, doi, url, title, abstract, journal, publication_date,
-     authors, keywords, mesh_terms,
+     authors, keywords, mesh_terms, publication_types,
      created_at, updated_at,
      agent_status, ai_score, summary_1s, tags, score_components, scored_at)
 VALUES
     (%(pmid)s, %(doi)s, %(url)s, %(title)s, %(abstract)s, %(journal)s, %(publication_date)s,
-     %(authors)s::jsonb, %(keywords)s::jsonb, %(mesh_terms)s::jsonb,
+     %(authors)s::jsonb, %(keywords)s::jsonb, %(mesh_terms)s::jsonb, %(publication_types)s::jsonb,
      now(), now(),
      'pending', NULL, NULL, NULL, NULL, NULL)
 ON CONFLICT (pmid)
@@ -289,6 +302,7 @@ DO UPDATE SET
     authors = CASE WHEN EXCLUDED.authors IS NOT NULL THEN EXCLUDED.authors ELSE public.articles.authors END,
     keywords = CASE WHEN EXCLUDED.keywords IS NOT NULL THEN EXCLUDED.keywords ELSE public.articles.keywords END,
     mesh_terms = CASE WHEN EXCLUDED.mesh_terms IS NOT NULL THEN EXCLUDED.mesh_terms ELSE public.articles.mesh_terms END,
+    publication_types = CASE WHEN EXCLUDED.publication_types IS NOT NULL THEN EXCLUDED.publication_types ELSE public.articles.publication_types END,
 
     agent_status = CASE
         WHEN (COALESCE(NULLIF(EXCLUDED.title, ''), public.articles.title) IS DISTINCT FROM public.articles.title)
@@ -347,6 +361,32 @@ def db_preflight(conn: psycopg.Connection):
         if not reg:
             die("public.articles table not found.")
 
+        # Only check: DDL here would lock public.articles on every run. Each
+        # module installs its own schema once from its entry point.
+        cur.execute("""
+            SELECT
+              EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = 'articles'
+                  AND column_name = 'publication_types'
+              ),
+              to_regclass('public.paper_documents') IS NOT NULL;
+        """)
+        has_types, has_docs = cur.fetchone()
+        if not has_types:
+            # read by llm_gate to skip errata/editorials before any LLM call
+            die("articles.publication_types not found. Run: python llm_gate.py")
+        if not has_docs:
+            die("public.paper_documents not found. Run: python paper_docs.py")
+
+        # search and listing work without their indexes, just slowly
+        missing = search.missing_indexes(cur, [*search.INDEXES, *listing.INDEXES])
+        if missing:
+            print(
+                f"[ingest_pubmed_backfill] WARNING: missing indexes {', '.join(missing)}; "
+                "run: python search.py --install && python listing.py"
+            )
+
         cur.execute("""
             SELECT EXISTS (
                 SELECT 1
@@ -368,11 +408,14 @@ def upsert_articles(rows: list[dict]) -> int:
 
     with psycopg.connect(DATABASE_URL) as conn:
         db_preflight(conn)
+        stats.ensure_schema(conn)  # home page counters follow every insert from here on
         with conn.cursor() as cur:
             for row in rows:
                 cur.execute(UPSERT_SQL, row)
+            paper_docs.rebuild(cur, pmids=[row["pmid"] for row in rows])
         conn.commit()
 
+    page_cache.invalidate(row["pmid"] for row in rows)
     return len(rows)
 
 
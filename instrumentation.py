@@ -0,0 +1,322 @@
+"""
+instrumentation.py
+Per-request timing for the Flask app: latency, SQL statements, DB time,
+rows fetched and template render time.
+
+- connect() is the app's one way to open Postgres: its cursors (plain and
+  named) time every execute/fetch and attribute them to the current request.
+- init_app(app) installs the request hooks, the render-time signals and
+  GET /metrics (Prometheus text format).
+- Requests slower than SLOW_REQUEST_MS are written to SLOW_LOG (one JSON
+  line each) with their statements, slowest first.
+
+Metrics live in the worker process: with several gunicorn workers each
+scrape sees the worker that served it (series carry a pid label), so sum
+by route when graphing. Time spent streaming a response body after the
+view returns (export) is not included.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+import psycopg
+from flask import Response, before_render_template, g, request, template_rendered
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+SLOW_LOG = os.getenv("SLOW_LOG", "logs/slow_requests.log").strip()
+SLOW_LOG_STATEMENTS = int(os.getenv("SLOW_LOG_STATEMENTS", "10"))
+# distinct statement series kept per worker; later shapes share "other"
+MAX_STATEMENT_SERIES = int(os.getenv("MAX_STATEMENT_SERIES", "500"))
+
+# seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current: ContextVar["RequestStats | None"] = ContextVar("request_stats", default=None)
+
+_WS = re.compile(r"\s+")
+# select lists carry the client's ?fields=, which must not mint new series
+_SELECT_LIST = re.compile(r"\bSELECT\b.*?\bFROM\b", re.IGNORECASE)
+
+# readable prefix in the metric label; statements are told apart by
+# statement_id (a hash of the normalized statement), the slow log keeps it all
+LABEL_CHARS = 120
+
+_statement_ids: set[str] = set()
+_statement_ids_lock = threading.Lock()
+
+
+def one_line(query) -> str:
+    return _WS.sub(" ", str(query)).strip()
+
+
+def normalize(sql: str) -> str:
+    return _SELECT_LIST.sub("SELECT … FROM", sql)
+
+
+def statement_id(sql: str) -> str:
+    return hashlib.sha1(normalize(sql).encode()).hexdigest()[:12]
+
+
+def statement_labels(sql: str) -> tuple:
+    sid = statement_id(sql)
+    with _statement_ids_lock:
+        if sid not in _statement_ids:
+            if len(_statement_ids) >= MAX_STATEMENT_SERIES:
+                return (("statement_id", "other"), ("statement", "other"))
+            _statement_ids.add(sid)
+    return (("statement_id", sid), ("statement", normalize(sql)[:LABEL_CHARS]))
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = []  # [label, seconds, rows]
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.render_seconds = 0.0
+        self.render_started = None
+
+    def statement(self, query, seconds: float) -> list:
+        entry = [one_line(query), seconds, 0]
+        self.statements.append(entry)
+        self.db_seconds += seconds
+        return entry
+
+    def fetched(self, entry: list | None, n: int, seconds: float = 0.0):
+        self.rows += n
+        self.db_seconds += seconds
+        if entry is not None:
+            entry[1] += seconds
+            entry[2] += n
+
+
+class _Timed:
+    """
+    Mixin for psycopg cursors: execute() and fetches are timed and charged
+    to the request in progress (no-op outside requests).
+    """
+
+    _entry = None
+
+    def execute(self, query, params=None, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return super().execute(query, params, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, params, **kwargs)
+        finally:
+            self._entry = stats.statement(query, time.perf_counter() - started)
+
+    def _count(self, rows, started: float):
+        stats = _current.get()
+        if stats is not None:
+            n = len(rows) if isinstance(rows, list) else int(rows is not None)
+            stats.fetched(self._entry, n, time.perf_counter() - started)
+        return rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        return self._count(super().fetchone(), started)
+
+    def fetchmany(self, size: int = 0):
+        started = time.perf_counter()
+        return self._count(super().fetchmany(size), started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        return self._count(super().fetchall(), started)
+
+    def __iter__(self):
+        # the base iterator keeps its batching (itersize on named cursors)
+        stats = _current.get()
+        for row in super().__iter__():
+            if stats is not None:
+                stats.fetched(self._entry, 1)
+            yield row
+
+
+class Cursor(_Timed, psycopg.Cursor):
+    pass
+
+
+class ServerCursor(_Timed, psycopg.ServerCursor):
+    pass
+
+
+def connect(dsn: str, **kwargs) -> psycopg.Connection:
+    conn = psycopg.connect(dsn, cursor_factory=Cursor, **kwargs)
+    conn.server_cursor_factory = ServerCursor
+    return conn
+
+
+class Metrics:
+    """
+    Counters and latency histograms keyed by label tuples, rendered in
+    Prometheus text format.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: dict[tuple, float] = {}
+        self.histograms: dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+
+    def inc(self, name: str, labels: tuple, value: float = 1.0):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, name: str, labels: tuple, value: float):
+        key = (name, labels)
+        with self.lock:
+            h = self.histograms.setdefault(key, [0] * len(BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def render(self) -> str:
+        pid = str(os.getpid())
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{{{_labels(labels + (('pid', pid),))}}} {_number(value)}")
+
+        for (name, labels), h in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            base = labels + (("pid", pid),)
+            for bound, n in zip(BUCKETS, h):
+                lines.append(f"{name}_bucket{{{_labels(base + (('le', f'{bound:g}'),))}}} {n}")
+            lines.append(f"{name}_bucket{{{_labels(base + (('le', '+Inf'),))}}} {h[-1]}")
+            lines.append(f"{name}_sum{{{_labels(base)}}} {_number(h[-2])}")
+            lines.append(f"{name}_count{{{_labels(base)}}} {h[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _number(value) -> str:
+    # exact: whole numbers as ints, anything else round-trips via repr
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(pairs: tuple) -> str:
+    out = []
+    for k, v in pairs:
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        out.append(f'{k}="{v}"')
+    return ",".join(out)
+
+
+METRICS = Metrics()
+_log_lock = threading.Lock()
+
+
+def slow_log(record: dict):
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    if not SLOW_LOG:
+        print(f"[slow] {line}", file=sys.stderr)
+        return
+    try:
+        with _log_lock, open(SLOW_LOG, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"[slow] {line} (SLOW_LOG unwritable: {e})", file=sys.stderr)
+
+
+def _route() -> str:
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def _before_request():
+    g._request_stats_token = _current.set(RequestStats())
+
+
+def _after_request(response):
+    stats = _current.get()
+    if stats is None:
+        return response
+    elapsed = time.perf_counter() - stats.started
+    route = _route()
+    labels = (("route", route),)
+
+    METRICS.inc("http_requests_total", labels + (("method", request.method), ("status", response.status_code)))
+    METRICS.observe("http_request_duration_seconds", labels, elapsed)
+    METRICS.observe("http_request_db_seconds", labels, stats.db_seconds)
+    METRICS.inc("http_request_db_statements_total", labels, len(stats.statements))
+    METRICS.inc("http_request_db_rows_total", labels, stats.rows)
+    METRICS.inc("http_request_render_seconds_total", labels, stats.render_seconds)
+    for sql, seconds, _ in stats.statements:
+        statement = statement_labels(sql)
+        METRICS.inc("db_statement_calls_total", statement)
+        METRICS.inc("db_statement_seconds_total", statement, seconds)
+
+    response.headers["Server-Timing"] = (
+        f"db;dur={stats.db_seconds * 1000:.1f}, render;dur={stats.render_seconds * 1000:.1f}, "
+        f"total;dur={elapsed * 1000:.1f}"
+    )
+
+    if elapsed * 1000 >= SLOW_REQUEST_MS:
+        slowest = sorted(stats.statements, key=lambda s: s[1], reverse=True)[:SLOW_LOG_STATEMENTS]
+        slow_log({
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "route": route,
+            "path": request.full_path.rstrip("?"),
+            "status": response.status_code,
+            "ms": round(elapsed * 1000, 1),
+            "db_ms": round(stats.db_seconds * 1000, 1),
+            "render_ms": round(stats.render_seconds * 1000, 1),
+            "statements": len(stats.statements),
+            "rows": stats.rows,
+            "sql": [
+                {"ms": round(s * 1000, 1), "rows": n, "id": statement_id(sql), "sql": sql}
+                for sql, s, n in slowest
+            ],
+        })
+    return response
+
+
+def _teardown_request(exc):
+    token = g.pop("_request_stats_token", None)
+    if token is not None:
+        _current.reset(token)
+
+
+def _render_started(sender, template, context, **extra):
+    stats = _current.get()
+    if stats is not None:
+        stats.render_started = time.perf_counter()
+
+
+def _render_finished(sender, template, context, **extra):
+    stats = _current.get()
+    if stats is not None and stats.render_started is not None:
+        stats.render_seconds += time.perf_counter() - stats.render_started
+        stats.render_started = None
+
+
+def metrics():
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+    app.add_url_rule("/metrics", "metrics", metrics)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+listing.py
+Keyset (cursor) pagination for the home page article listing.
+
+Each sort is a tuple of key expressions ending in id, so the order is
+total. NULLS LAST is expressed with sentinels (scores are 0-100, so -1 sorts
+after every real score; missing dates sort as -infinity / infinity), which
+lets a single row-value comparison
+
+    (k1, k2, ..., id) < (v1, v2, ..., last_id)
+
+seek straight into a matching expression index: page N costs the same as
+page 1. Cursors are the last (or first) row's key values, base64-encoded.
+
+Install the indexes once (ingest only checks that they are there):
+  python listing.py
+"""
+
+import json
+import os
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date
+
+import psycopg
+from dotenv import load_dotenv
+
+from search import LIST_COLUMNS, create_indexes
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
+
+# OFFSET is still honoured for bare ?page=N links, but only this deep
+MAX_OFFSET_PAGES = int(os.getenv("LIST_MAX_OFFSET_PAGES", "20"))
+
+_RANK = ("COALESCE(rank_score, -1)::double precision", "double precision")
+_AI = ("COALESCE(ai_score, -1)::double precision", "double precision")
+_BASE = ("COALESCE(base_score, -1)::double precision", "double precision")
+_NEWEST = ("COALESCE(publication_date, '-infinity'::date)", "date")
+_OLDEST = ("COALESCE(publication_date, 'infinity'::date)", "date")
+_ID = ("id", "bigint")
+
+SORTS = {
+    "rank": {"keys": (_RANK, _AI, _NEWEST, _ID), "desc": True},
+    "ai": {"keys": (_AI, _RANK, _NEWEST, _ID), "desc": True},
+    "base": {"keys": (_BASE, _RANK, _NEWEST, _ID), "desc": True},
+    "newest": {"keys": (_NEWEST, _ID), "desc": True},
+    "oldest": {"keys": (_OLDEST, _ID), "desc": False},
+}
+DEFAULT_SORT = "rank"
+
+PAGE_SQL = """
+SELECT {columns}, {cursor_keys}
+FROM public.articles
+{where}
+ORDER BY {order}
+LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+# Whole listing in page order, for a server-side cursor (export)
+ALL_SQL = """
+SELECT {columns}
+FROM public.articles
+ORDER BY {order}
+"""
+
+
+def get_sort(sort: str) -> dict:
+    return SORTS.get(sort, SORTS[DEFAULT_SORT])
+
+
+def order_by(sort: str, reverse: bool = False) -> str:
+    """
+    ORDER BY clause for a sort (also used by search for non-relevance sorts).
+    """
+    spec = get_sort(sort)
+    direction = "DESC" if spec["desc"] != reverse else "ASC"
+    return ", ".join(f"{expr} {direction}" for expr, _ in spec["keys"])
+
+
+def index_ddl() -> dict[str, str]:
+    indexes = {}
+    for name, spec in SORTS.items():
+        cols = ", ".join(f"({expr}) {'DESC' if spec['desc'] else 'ASC'}" for expr, _ in spec["keys"])
+        indexes[f"articles_list_{name}_idx"] = f"ON public.articles ({cols})"
+    return indexes
+
+
+INDEXES = index_ddl()
+
+# ranking.py's old ORDER BY index, left behind by installs that predate the
+# keyset listing; articles_list_rank_idx serves the same order
+REPLACED_INDEXES = ("articles_rank_order_idx",)
+
+
+def ensure_schema(conn):
+    create_indexes(conn, INDEXES, replaces=REPLACED_INDEXES)
+
+
+def encode_cursor(values: list[str]) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def parse_key(value: str, sql_type: str):
+    """
+    A cursor key as the Python value bound for sql_type; ValueError if it
+    isn't one, so a tampered cursor never reaches Postgres.
+    """
+    if sql_type == "double precision":
+        return float(value)
+    if sql_type == "bigint":
+        n = int(value)
+        if not -2**63 <= n < 2**63:
+            raise ValueError(f"bigint out of range: {value}")
+        return n
+    if sql_type == "date":
+        return value if value in ("infinity", "-infinity") else date.fromisoformat(value)
+    raise ValueError(f"unknown key type: {sql_type}")
+
+
+def decode_cursor(cursor: str | None, sort: str) -> list | None:
+    """
+    Key values from a cursor, or None if it is missing or doesn't fit the sort.
+    """
+    if not cursor:
+        return None
+    keys = get_sort(sort)["keys"]
+    try:
+        raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(keys):
+            return None
+        if not all(isinstance(v, str) for v in values):
+            return None
+        return [parse_key(v, sql_type) for v, (_, sql_type) in zip(values, keys)]
+    except (ValueError, OverflowError):
+        return None
+
+
+def fetch_page(cur, sort: str, limit: int, after: str | None = None, before: str | None = None,
+               page: int = 1, columns: str = LIST_COLUMNS) -> tuple[list[tuple], str | None, str | None]:
+    """
+    One page of the listing: (rows, next_cursor, prev_cursor). Rows have
+    the layout of columns (trusted SQL, default search.LIST_COLUMNS). Pass
+    the next cursor as `after` and the previous one as `before`; with
+    neither, `page` is served by OFFSET (capped at MAX_OFFSET_PAGES).
+    """
+    spec = get_sort(sort)
+    keys = spec["keys"]
+    after_values = decode_cursor(after, sort)
+    before_values = decode_cursor(before, sort) if after_values is None else None
+    backwards = before_values is not None
+    values = after_values or before_values
+
+    params = {"limit": limit + 1, "offset": 0}
+    where = ""
+    if values is not None:
+        # moving forward in a DESC sort means smaller keys
+        op = "<" if spec["desc"] != backwards else ">"
+        placeholders = []
+        for i, (value, (_, sql_type)) in enumerate(zip(values, keys)):
+            params[f"k{i}"] = value
+            placeholders.append(f"%(k{i})s::{sql_type}")
+        where = f"WHERE ({', '.join(e for e, _ in keys)}) {op} ({', '.join(placeholders)})"
+    else:
+        params["offset"] = (min(max(page, 1), MAX_OFFSET_PAGES) - 1) * limit
+
+    # keys come back as text: '-infinity' dates can't be loaded into Python
+    cursor_keys = ", ".join(f"({expr})::text" for expr, _ in keys)
+    cur.execute(PAGE_SQL.format(
+        columns=columns,
+        cursor_keys=cursor_keys,
+        where=where,
+        order=order_by(sort, reverse=backwards),
+    ), params)
+    fetched = cur.fetchall()
+
+    more = len(fetched) > limit
+    fetched = fetched[:limit]
+    if backwards:
+        fetched.reverse()
+    if not fetched:
+        return [], None, None
+
+    n = len(keys)
+    rows = [r[:-n] for r in fetched]
+    first_key = list(fetched[0][-n:])
+    last_key = list(fetched[-1][-n:])
+
+    if backwards:
+        has_next, has_prev = True, more
+    else:
+        has_next, has_prev = more, values is not None or params["offset"] > 0
+
+    next_cursor = encode_cursor(last_key) if has_next else None
+    prev_cursor = encode_cursor(first_key) if has_prev else None
+    return rows, next_cursor, prev_cursor
+
+
+def stream_query(sort: str, columns: str = LIST_COLUMNS) -> str:
+    """
+    Every article in the listing order of sort; walks the sort's index.
+    """
+    return ALL_SQL.format(columns=columns, order=order_by(sort))
+
+
+if __name__ == "__main__":
+    if not DATABASE_URL:
+        raise SystemExit("Missing DATABASE_URL")
+    with psycopg.connect(DATABASE_URL) as conn:
+        ensure_schema(conn)
+    print("[listing] keyset indexes installed")
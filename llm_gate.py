@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+llm_gate.py
+Rules-based gate in front of the LLM scorers (score_articles_ai,
+agent_step4_openai_score, extract_articles).
+
+An article is not sent to the LLM when:
+  - its publication type is excluded (errata, editorials, comments, ...)
+  - it has no usable abstract
+  - its rules score (score_articles.compute_base_score) is under the threshold
+
+Skipped rows get agent_status 'ai_skipped: <reason>' and keep their rules
+score, so their rank_score (see ranking.py) has no AI component. Rows under the
+threshold get 'ai_deferred: <reason>'; --release stamps gate_released_at on
+them and puts them back in the queue, and released rows skip the threshold
+check from then on. Re-ingesting changed content resets agent_status, which
+also lifts the gate.
+
+Env:
+  LLM_GATE (default 1; 0 sends everything to the LLM)
+  LLM_GATE_MIN_BASE_SCORE (default 20)
+  LLM_GATE_MIN_ABSTRACT (default 100 characters)
+  LLM_GATE_EXCLUDE_TYPES (comma-separated PubMed publication types)
+
+Usage:
+  python llm_gate.py --stats
+  python llm_gate.py --release     # deferred rows back to the scoring queue
+"""
+
+import os
+import re
+import sys
+from collections import Counter
+
+import psycopg
+from dotenv import load_dotenv
+
+from score_articles import compute_base_score
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
+
+LLM_GATE = os.getenv("LLM_GATE", "1") == "1"
+MIN_BASE_SCORE = float(os.getenv("LLM_GATE_MIN_BASE_SCORE", "20"))
+MIN_ABSTRACT = int(os.getenv("LLM_GATE_MIN_ABSTRACT", "100"))
+EXCLUDE_TYPES = {
+    t.strip().lower()
+    for t in os.getenv(
+        "LLM_GATE_EXCLUDE_TYPES",
+        "Published Erratum,Erratum,Editorial,Comment,Letter,News,Newspaper Article,"
+        "Retraction of Publication,Retracted Publication,Expression of Concern,"
+        "Biography,Portrait,Interview,Congress,Corrected and Republished Article",
+    ).split(",")
+    if t.strip()
+}
+
+SKIPPED = "ai_skipped"
+DEFERRED = "ai_deferred"
+
+# Legacy rows ingested before publication_types was stored
+NOTICE_TITLE_RE = re.compile(
+    r"^\s*\[?(erratum|correction|corrigendum|retraction|retracted|expression of concern|withdrawn)\b",
+    re.IGNORECASE,
+)
+
+# ALTER TABLE locks articles even when there is nothing to add, so only run it once
+ENSURE_COLUMNS = """
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'articles' AND column_name = 'gate_released_at'
+    ) THEN
+        ALTER TABLE public.articles ADD COLUMN IF NOT EXISTS publication_types JSONB;
+        ALTER TABLE public.articles ADD COLUMN IF NOT EXISTS gate_released_at TIMESTAMPTZ;
+    END IF;
+END
+$$;
+"""
+
+MARK_GATED = """
+UPDATE public.articles a
+SET agent_status = v.agent_status,
+    base_score = COALESCE(a.base_score, v.base_score),
+    updated_at = NOW()
+FROM unnest(%s::bigint[], %s::text[], %s::float8[])
+    AS v(id, agent_status, base_score)
+WHERE a.id = v.id
+"""
+
+RELEASE_DEFERRED = f"""
+UPDATE public.articles
+SET agent_status = NULL,
+    gate_released_at = NOW(),
+    updated_at = NOW()
+WHERE agent_status LIKE '{DEFERRED}:%%'
+"""
+
+STATS = f"""
+SELECT agent_status, COUNT(*)
+FROM public.articles
+WHERE agent_status LIKE '{SKIPPED}:%%' OR agent_status LIKE '{DEFERRED}:%%'
+GROUP BY agent_status
+ORDER BY COUNT(*) DESC
+"""
+
+
+def not_gated_sql(column: str = "agent_status") -> str:
+    """
+    SQL predicate excluding rows the gate already turned away.
+    """
+    return f"(COALESCE({column}, '') NOT LIKE '{SKIPPED}:%%' AND COALESCE({column}, '') NOT LIKE '{DEFERRED}:%%')"
+
+
+def ensure_schema(conn):
+    with conn.cursor() as cur:
+        cur.execute(ENSURE_COLUMNS)
+    conn.commit()
+
+
+def is_gated(status: str | None) -> bool:
+    return bool(status) and status.startswith((f"{SKIPPED}:", f"{DEFERRED}:"))
+
+
+def decide(row: dict) -> tuple[str | None, float | None]:
+    """
+    (status, base_score) for one article. status is None when the article
+    should go to the LLM; base_score is computed when the row has none, so
+    gated rows still get a rules-only rank. Rows released with --release
+    (gate_released_at set) are not held back by the threshold again.
+    """
+    base_score = row.get("base_score")
+    if not LLM_GATE:
+        return None, base_score
+    if base_score is None:
+        base_score, _ = compute_base_score(row)
+
+    types = row.get("publication_types") or []
+    excluded = [t for t in types if str(t).strip().lower() in EXCLUDE_TYPES]
+    if excluded:
+        return f"{SKIPPED}: pub_type={excluded[0]}", base_score
+    if not types and NOTICE_TITLE_RE.match(row.get("title") or ""):
+        return f"{SKIPPED}: notice_title", base_score
+
+    if len((row.get("abstract") or "").strip()) < MIN_ABSTRACT:
+        return f"{SKIPPED}: no_abstract", base_score
+
+    if float(base_score) < MIN_BASE_SCORE and row.get("gate_released_at") is None:
+        return f"{DEFERRED}: base_score<{MIN_BASE_SCORE:g}", base_score
+
+    return None, base_score
+
+
+def split(rows: list[dict]) -> tuple[list[dict], list[tuple]]:
+    """
+    Partition rows into (to_score, gated) where gated holds
+    (id, status, base_score) tuples ready for mark_gated().
+    """
+    to_score = []
+    gated = []
+    for row in rows:
+        status, base_score = decide(row)
+        if status is None:
+            to_score.append(row)
+            continue
+        gated.append((row["id"], status, base_score))
+    return to_score, gated
+
+
+def mark_gated(cur, gated: list[tuple]):
+    if not gated:
+        return
+    cur.execute(MARK_GATED, [list(c) for c in zip(*gated)])
+
+
+def summarize(gated: list[tuple]) -> str:
+    counts = Counter(status for _, status, _ in gated)
+    return ", ".join(f"{status} x{n}" for status, n in counts.most_common())
+
+
+def main():
+    if not DATABASE_URL:
+        raise SystemExit("Missing DATABASE_URL")
+
+    with psycopg.connect(DATABASE_URL) as conn:
+        ensure_schema(conn)
+        if "--release" in sys.argv:
+            n = conn.execute(RELEASE_DEFERRED).rowcount
+            conn.commit()
+            print(f"[llm_gate] released {n} deferred articles")
+            return
+
+        for status, n in conn.execute(STATS).fetchall():
+            print(f"{n:>8}  {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+mock_llm_server.py
+OpenAI-compatible stand-in for load and regression testing.
+
+Serves POST /v1/chat/completions and POST /v1/responses with deterministic,
+schema-valid JSON: the same request always gets the same answer. The
+schema comes from the request (response_format / text.format json_schema);
+JSON-mode requests are matched against agents.schemas by the field names
+in the prompt. Packed multi-article requests get one result per article key.
+
+Point any scorer at it:
+  OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=mock python score_articles_ai.py
+
+Run:
+  python mock_llm_server.py
+  gunicorn -w 4 -b 127.0.0.1:8089 mock_llm_server:app
+
+Env:
+  MOCK_PORT (default 8089)
+  MOCK_LATENCY_MS (median latency, default 300; 0 = none)
+  MOCK_LATENCY_SIGMA (lognormal spread, default 0.5)
+  MOCK_MS_PER_OUTPUT_TOKEN (default 0; added per generated token)
+  MOCK_429_RATE (fraction of requests answered 429, default 0)
+  MOCK_MALFORMED_RATE (fraction answered with truncated JSON, default 0)
+  MOCK_RPM / MOCK_TPM (limits advertised in x-ratelimit-* headers and
+                       enforced per minute with real 429s, default 0 = unlimited)
+  MOCK_SEED (default 0; seeds output and fault injection)
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+
+from flask import Flask, jsonify, request
+
+from agents import schemas
+from agents.prompting import count_tokens
+
+MOCK_PORT = int(os.getenv("MOCK_PORT", "8089"))
+LATENCY_MS = float(os.getenv("MOCK_LATENCY_MS", "300"))
+LATENCY_SIGMA = float(os.getenv("MOCK_LATENCY_SIGMA", "0.5"))
+MS_PER_OUTPUT_TOKEN = float(os.getenv("MOCK_MS_PER_OUTPUT_TOKEN", "0"))
+RATE_429 = float(os.getenv("MOCK_429_RATE", "0"))
+RATE_MALFORMED = float(os.getenv("MOCK_MALFORMED_RATE", "0"))
+RPM = int(os.getenv("MOCK_RPM", "0"))
+TPM = int(os.getenv("MOCK_TPM", "0"))
+SEED = int(os.getenv("MOCK_SEED", "0"))
+
+# Schemas tried for JSON-mode requests, most specific first
+KNOWN_SCHEMAS = (
+    schemas.EXTRACTION,
+    schemas.SUMMARY,
+    schemas.AI_SCORE,
+    schemas.SIGNALS,
+    schemas.AGENT_SCORE,
+    schemas.STEP4_SCORE,
+)
+
+WORDS = (
+    "alpha-synuclein", "microglia", "lysosome", "mitophagy", "tau", "amyloid",
+    "dopamine", "neuroinflammation", "GBA1", "LRRK2", "autophagy", "biomarker",
+)
+
+app = Flask(__name__)
+
+_lock = threading.Lock()
+_fault_rng = random.Random(SEED)
+_window = {"start": time.time(), "requests": 0, "tokens": 0}
+_stats = {"requests": 0, "ok": 0, "injected_429": 0, "limited_429": 0, "malformed": 0, "output_tokens": 0}
+
+
+# =========================
+# Deterministic generation
+# =========================
+def rng_for(payload: dict) -> random.Random:
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    digest = hashlib.sha256(f"{SEED}\x1f{raw}".encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+def generate(spec: dict, rng: random.Random, name: str = "value"):
+    types = spec.get("type")
+    types = [t for t in (types if isinstance(types, list) else [types]) if t != "null"]
+    kind = types[0] if types else "string"
+
+    if kind == "object":
+        return {k: generate(sub, rng, k) for k, sub in (spec.get("properties") or {}).items()}
+    if kind == "array":
+        n = rng.randint(1, min(3, spec.get("maxItems", 3)))
+        return [generate(spec.get("items") or {"type": "string"}, rng, name) for _ in range(n)]
+    if "enum" in spec:
+        return rng.choice(spec["enum"])
+    if kind == "integer":
+        return rng.randint(int(spec.get("minimum", 0)), int(spec.get("maximum", 100)))
+    if kind == "number":
+        return round(rng.uniform(spec.get("minimum", 0.0), spec.get("maximum", 1.0)), 2)
+    if kind == "boolean":
+        return rng.random() < 0.3
+    text = f"mock {name.replace('_', ' ')}: {' '.join(rng.sample(WORDS, 3))}"
+    return text[:spec["maxLength"]] if "maxLength" in spec else text
+
+def article_keys(prompt: str) -> list[str]:
+    """
+    Keys of a packed multi-article prompt (agents.batching.batch_user_prompt).
+    """
+    start = prompt.find('{"articles"')
+    if start == -1:
+        return []
+    try:
+        data, _ = json.JSONDecoder().raw_decode(prompt[start:])
+    except ValueError:
+        return []
+    return [str(a.get("key")) for a in data.get("articles") or [] if isinstance(a, dict)]
+
+def guess_schema(prompt: str) -> dict | None:
+    for schema in KNOWN_SCHEMAS:
+        if all(f'"{k}"' in prompt or f"{k}:" in prompt or f"- {k}" in prompt for k in schema["properties"]):
+            return schema
+    return None
+
+def answer(schema: dict | None, prompt: str, payload: dict) -> str:
+    rng = rng_for(payload)
+    keys = article_keys(prompt)
+
+    if schema is None:
+        schema = guess_schema(prompt)
+        if schema is not None and keys:
+            schema = schemas.batch_schema(schema)
+    if schema is None:
+        return json.dumps({"mock": True, "text": generate({"type": "string"}, rng, "reply")})
+
+    props = schema.get("properties") or {}
+    results = props.get("results") or {}
+    if keys and "key" in ((results.get("items") or {}).get("properties") or {}):
+        out = {"results": []}
+        for k in keys:
+            item = generate(results["items"], rng)
+            item["key"] = k
+            out["results"].append(item)
+        return json.dumps(out)
+    return json.dumps(generate(schema, rng))
+
+def prompt_text(messages) -> str:
+    if isinstance(messages, str):
+        return messages
+    parts = []
+    for m in messages or []:
+        content = m.get("content") if isinstance(m, dict) else None
+        if isinstance(content, list):
+            parts.extend(str(c.get("text", "")) for c in content if isinstance(c, dict))
+        elif content:
+            parts.append(str(content))
+    return "\n".join(parts)
+
+
+# =========================
+# Latency / faults / limits
+# =========================
+def sleep_for(output_tokens: int):
+    delay = 0.0
+    if LATENCY_MS > 0:
+        with _lock:
+            delay = _fault_rng.lognormvariate(math.log(LATENCY_MS), LATENCY_SIGMA)
+    delay += MS_PER_OUTPUT_TOKEN * output_tokens
+    if delay > 0:
+        time.sleep(delay / 1000.0)
+
+def roll(rate: float) -> bool:
+    if rate <= 0:
+        return False
+    with _lock:
+        return _fault_rng.random() < rate
+
+def take_budget(tokens: int) -> tuple[bool, dict]:
+    """
+    Count the request against the per-minute window. Returns (allowed, headers).
+    """
+    with _lock:
+        now = time.time()
+        if now - _window["start"] >= 60:
+            _window.update(start=now, requests=0, tokens=0)
+        reset = max(0.0, 60 - (now - _window["start"]))
+
+        allowed = (not RPM or _window["requests"] < RPM) and (not TPM or _window["tokens"] + tokens <= TPM)
+        if allowed:
+            _window["requests"] += 1
+            _window["tokens"] += tokens
+
+        headers = {}
+        if RPM:
+            headers.update({
+                "x-ratelimit-limit-requests": str(RPM),
+                "x-ratelimit-remaining-requests": str(max(0, RPM - _window["requests"])),
+                "x-ratelimit-reset-requests": f"{reset:.3f}s",
+            })
+        if TPM:
+            headers.update({
+                "x-ratelimit-limit-tokens": str(TPM),
+                "x-ratelimit-remaining-tokens": str(max(0, TPM - _window["tokens"])),
+                "x-ratelimit-reset-tokens": f"{reset:.3f}s",
+            })
+        if not allowed:
+            headers["retry-after"] = str(max(1, math.ceil(reset)))
+        return allowed, headers
+
+def rate_limited(headers: dict, injected: bool):
+    with _lock:
+        _stats["injected_429" if injected else "limited_429"] += 1
+    if injected:
+        headers = {**headers, "retry-after": headers.get("retry-after", "1")}
+    body = {"error": {
+        "message": "Rate limit reached (mock)",
+        "type": "requests",
+        "param": None,
+        "code": "rate_limit_exceeded",
+    }}
+    return jsonify(body), 429, headers
+
+def handle(payload: dict, messages, fmt: dict | None, build):
+    with _lock:
+        _stats["requests"] += 1
+
+    prompt = prompt_text(messages)
+    input_tokens = count_tokens(prompt)
+
+    allowed, headers = take_budget(input_tokens)
+    if not allowed:
+        return rate_limited(headers, injected=False)
+    if roll(RATE_429):
+        return rate_limited(headers, injected=True)
+
+    schema = (fmt or {}).get("schema") if (fmt or {}).get("type") == "json_schema" else None
+    text = answer(schema, prompt, payload)
+    if roll(RATE_MALFORMED):
+        text = text[: max(1, len(text) // 2)]
+        with _lock:
+            _stats["malformed"] += 1
+
+    output_tokens = count_tokens(text)
+    sleep_for(output_tokens)
+    with _lock:
+        _stats["ok"] += 1
+        _stats["output_tokens"] += output_tokens
+
+    return jsonify(build(text, input_tokens, output_tokens)), 200, headers
+
+
+# =========================
+# Routes
+# =========================
+@app.post("/v1/chat/completions")
+def chat_completions():
+    payload = request.get_json(force=True) or {}
+    model = payload.get("model", "mock")
+    rid = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+    fmt = payload.get("response_format") or {}
+    if fmt.get("type") == "json_schema":
+        fmt = {"type": "json_schema", "schema": (fmt.get("json_schema") or {}).get("schema")}
+
+    def build(text, input_tokens, output_tokens):
+        return {
+            "id": f"chatcmpl-mock-{rid}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text, "refusal": None},
+                "logprobs": None,
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": input_tokens,
+                "completion_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        }
+
+    return handle(payload, payload.get("messages"), fmt, build)
+
+
+@app.post("/v1/responses")
+def responses():
+    payload = request.get_json(force=True) or {}
+    model = payload.get("model", "mock")
+    rid = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+    fmt = (payload.get("text") or {}).get("format") or {}
+
+    def build(text, input_tokens, output_tokens):
+        return {
+            "id": f"resp_mock_{rid}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": model,
+            "status": "completed",
+            "error": None,
+            "incomplete_details": None,
+            "instructions": None,
+            "metadata": {},
+            "parallel_tool_calls": False,
+            "temperature": payload.get("temperature"),
+            "tool_choice": "auto",
+            "tools": [],
+            "top_p": None,
+            "output": [{
+                "type": "message",
+                "id": f"msg_mock_{rid}",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "usage": {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        }
+
+    return handle(payload, payload.get("input"), fmt, build)
+
+
+@app.get("/v1/models")
+def models():
+    return jsonify({"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+
+
+@app.get("/mock/stats")
+def stats():
+    with _lock:
+        return jsonify(dict(_stats))
+
+
+if __name__ == "__main__":
+    # threaded so concurrent scorers actually overlap their (simulated) latency
+    app.run(host="127.0.0.1", port=MOCK_PORT, threaded=True)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+page_cache.py
+Rendered-page cache for the Flask app, in Redis with an in-process fallback.
+
+Entries are keyed by route + normalized arguments (sort, query, page,
+cursor) and carry a TTL. Invalidation is generational: every key embeds the
+current generation of what it depends on, and writers bump a generation
+instead of deleting keys.
+
+- gen:all           every page (weight changes, bulk rescoring)
+- gen:list          listing / search pages (any score or new article)
+- gen:paper:<pmid>  one paper page
+
+Scoring jobs call invalidate(pmids) after they commit. Large batches
+collapse to a gen:all bump (PAGE_CACHE_MAX_PMIDS).
+
+Without a reachable Redis (REDIS_URL empty or down) pages are cached in
+process memory. Jobs run in other processes and can't bump those
+generations, so staleness is then bounded by the TTLs only. Redis is
+retried every PAGE_CACHE_RETRY seconds.
+
+Usage:
+  python page_cache.py            # backend + ping latency
+  python page_cache.py --flush    # bump gen:all
+"""
+
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0").strip()
+PREFIX = os.getenv("PAGE_CACHE_PREFIX", "neurocompute:").strip()
+
+# seconds; 0 disables caching for that kind of page
+LIST_TTL = int(os.getenv("PAGE_CACHE_TTL", "120"))
+PAPER_TTL = int(os.getenv("PAGE_CACHE_PAPER_TTL", "900"))
+
+MAX_PMIDS = int(os.getenv("PAGE_CACHE_MAX_PMIDS", "500"))
+MAX_ENTRIES = int(os.getenv("PAGE_CACHE_MAX_ENTRIES", "1000"))
+RETRY_SECONDS = float(os.getenv("PAGE_CACHE_RETRY", "30"))
+SOCKET_TIMEOUT = float(os.getenv("PAGE_CACHE_SOCKET_TIMEOUT", "0.25"))
+
+GEN_ALL = "gen:all"
+GEN_LIST = "gen:list"
+
+# paper generations expire once no page cached under the old value can be alive
+PAPER_GEN_TTL = 2 * PAPER_TTL + 60
+
+
+class MemoryBackend:
+    """
+    Bounded LRU dict with per-entry expiry; same get/set surface as Redis.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.data: OrderedDict[str, tuple[float | None, str]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _get(self, key: str) -> str | None:
+        item = self.data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires is not None and expires <= time.monotonic():
+            del self.data[key]
+            return None
+        self.data.move_to_end(key)
+        return value
+
+    def mget(self, keys: list[str]) -> list[str | None]:
+        with self.lock:
+            return [self._get(k) for k in keys]
+
+    def get(self, key: str) -> str | None:
+        with self.lock:
+            return self._get(key)
+
+    def set(self, key: str, value: str, ex: int | None = None):
+        with self.lock:
+            self.data[key] = (time.monotonic() + ex if ex else None, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def ping(self) -> bool:
+        return True
+
+
+_memory = MemoryBackend()
+_redis: redis.Redis | None = None
+_redis_down_until = 0.0
+_state_lock = threading.Lock()
+
+
+def _backend():
+    """
+    The Redis client while it answers, else the in-process backend.
+    """
+    global _redis
+    if not REDIS_URL or time.monotonic() < _redis_down_until:
+        return _memory
+    if _redis is None:
+        with _state_lock:
+            if _redis is None:
+                _redis = redis.Redis.from_url(
+                    REDIS_URL,
+                    decode_responses=True,
+                    socket_connect_timeout=SOCKET_TIMEOUT,
+                    socket_timeout=SOCKET_TIMEOUT,
+                )
+    return _redis
+
+
+def _mark_down(e: Exception):
+    global _redis_down_until
+    if time.monotonic() >= _redis_down_until:
+        print(f"[page_cache] redis unavailable ({type(e).__name__}: {e}); "
+              f"using in-process cache for {RETRY_SECONDS:g}s", file=sys.stderr)
+    _redis_down_until = time.monotonic() + RETRY_SECONDS
+
+
+def _call(method: str, *args, **kwargs):
+    backend = _backend()
+    try:
+        return getattr(backend, method)(*args, **kwargs)
+    except redis.RedisError as e:
+        _mark_down(e)
+        return getattr(_memory, method)(*args, **kwargs)
+
+
+def _paper_gen(pmid) -> str:
+    return f"gen:paper:{pmid}"
+
+
+def page_key(scope: list[str], parts: tuple) -> str:
+    """
+    Cache key for one page: the scope's current generations + a digest of
+    the normalized request parts.
+    """
+    gens = _call("mget", [PREFIX + g for g in scope])
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+    return f"{PREFIX}page:{parts[0]}:{'.'.join(g or '0' for g in gens)}:{digest}"
+
+
+def cached(parts: tuple, render, ttl: int, scope: list[str]) -> tuple[str | None, bool]:
+    """
+    (html, hit). render() runs on a miss; a None result (e.g. not found) is
+    returned but not stored.
+    """
+    if ttl <= 0:
+        return render(), False
+
+    key = page_key(scope, parts)
+    html = _call("get", key)
+    if html is not None:
+        return html, True
+
+    html = render()
+    if html is not None:
+        _call("set", key, html, ex=ttl)
+    return html, False
+
+
+def list_scope() -> list[str]:
+    return [GEN_ALL, GEN_LIST]
+
+
+def paper_scope(pmid) -> list[str]:
+    return [GEN_ALL, _paper_gen(pmid)]
+
+
+def invalidate(pmids=None):
+    """
+    Call after committing article writes. pmids=None drops every page; an
+    iterable drops listing pages plus those papers' pages (an empty one
+    drops listing pages only, e.g. after inserting new articles).
+    """
+    # time-based values never repeat, so an expired generation can't revive old pages
+    stamp = str(time.time_ns())
+    pmids = None if pmids is None else {str(p) for p in pmids}
+    if pmids is not None and len(pmids) > MAX_PMIDS:
+        pmids = None
+
+    backend = _backend()
+    if backend is not _memory:
+        try:
+            with backend.pipeline(transaction=False) as pipe:
+                if pmids is None:
+                    pipe.set(PREFIX + GEN_ALL, stamp)
+                else:
+                    pipe.set(PREFIX + GEN_LIST, stamp)
+                    for pmid in pmids:
+                        pipe.set(PREFIX + _paper_gen(pmid), stamp, ex=PAPER_GEN_TTL)
+                pipe.execute()
+            return
+        except redis.RedisError as e:
+            _mark_down(e)
+
+    if pmids is None:
+        _memory.set(PREFIX + GEN_ALL, stamp)
+    else:
+        _memory.set(PREFIX + GEN_LIST, stamp)
+        for pmid in pmids:
+            _memory.set(PREFIX + _paper_gen(pmid), stamp, ex=PAPER_GEN_TTL)
+
+
+def ping_ms() -> tuple[str, float]:
+    """
+    (backend name, round-trip of one PING in milliseconds).
+    """
+    backend = _backend()
+    started = time.perf_counter()
+    try:
+        backend.ping()
+    except redis.RedisError as e:
+        _mark_down(e)
+        backend = _memory
+        started = time.perf_counter()
+        backend.ping()
+    elapsed = (time.perf_counter() - started) * 1000.0
+    return ("memory" if backend is _memory else "redis"), elapsed
+
+
+def main():
+    if "--flush" in sys.argv:
+        invalidate()
+        print("[page_cache] bumped gen:all")
+    name, ms = ping_ms()
+    print(f"[page_cache] backend={name} ping={ms:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
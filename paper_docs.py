@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+paper_docs.py
+Ready-to-render documents for the paper page (/paper/<pmid>).
+
+public.paper_documents holds one JSONB document per PMID that merges
+public.articles, paper_signals and article_summaries, with defaults and
+the grade already applied, so the page is one primary-key read.
+
+Documents are built in SQL, from one place (BUILD). Every job that changes
+an article, its signals or its summaries calls rebuild() with the rows it
+touched, in the same transaction as its own writes:
+
+- ingest_pubmed.py, ingest_pubmed_backfill.py   upserted pmids
+- score_articles.py, score_articles_ai.py       scored rows
+- extract_articles.py                           articles + signals + summaries
+- agent_pass_signals.py                         signals
+- summarize_new_articles.py                     summaries
+- agent_step4_openai_score.py, agents/db.py    scored rows
+- ranking.py                                    every row (weights changed)
+
+Writers outside that list are picked up by --stale (cron). A PMID with no
+document yet is built on the fly by get() and served the same way.
+
+Usage:
+  python paper_docs.py              # install + show counts
+  python paper_docs.py --stale      # rebuild missing / outdated documents
+  python paper_docs.py --rebuild    # rebuild every document
+"""
+
+import os
+import sys
+
+import psycopg
+from dotenv import load_dotenv
+from psycopg.rows import dict_row, tuple_row
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
+
+# (minimum score, grade) from the top; below the last is "E", no score is "U"
+GRADES = ((85, "A"), (70, "B"), (55, "C"), (40, "D"))
+
+# the score a grade is given for: rank, else ai, else base
+GRADE_SCORE = "COALESCE(a.rank_score, a.ai_score, a.base_score)"
+
+ENSURE_SCHEMA = """
+SELECT pg_advisory_xact_lock(hashtext('paper_docs.ensure_schema'));
+
+CREATE TABLE IF NOT EXISTS public.paper_documents (
+    pmid BIGINT PRIMARY KEY,
+    article_id BIGINT NOT NULL,
+    doc JSONB NOT NULL,
+    built_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS paper_documents_article_id_idx
+    ON public.paper_documents (article_id);
+"""
+
+
+def grade_sql(score: str) -> str:
+    whens = "\n".join(f"        WHEN {score} >= {low} THEN '{g}'" for low, g in GRADES)
+    return f"CASE\n        WHEN {score} IS NULL THEN 'U'\n{whens}\n        ELSE 'E'\n    END"
+
+
+BUILD = f"""
+SELECT a.pmid, a.id AS article_id, jsonb_build_object(
+    'pmid', a.pmid,
+    'title', a.title,
+    'journal', a.journal,
+    'publication_date', a.publication_date,
+    'doi', a.doi,
+    'url', a.url,
+    'authors', COALESCE(a.authors, '[]'::jsonb),
+    'ai_score', a.ai_score,
+    'base_score', a.base_score,
+    'rank_score', a.rank_score,
+    'grade', {grade_sql(GRADE_SCORE)},
+    'abstract', COALESCE(a.abstract, ''),
+    'summary_1s', COALESCE(a.summary_1s, ps.summary_1_sentence, ''),
+    'ai_summary', COALESCE(a.ai_summary, ''),
+    'why_it_matters', COALESCE(a.why_it_matters, ''),
+    'mechanisms', COALESCE(a.mechanisms, '[]'::jsonb),
+    'candidate_interventions', COALESCE(a.candidate_interventions, '[]'::jsonb),
+    'red_flags', COALESCE(a.red_flags, '[]'::jsonb),
+    'ai_confidence', a.ai_confidence,
+    'narrative_score', a.narrative_score,
+    'score_components', a.score_components,
+    'tags', a.tags,
+    'signals', to_jsonb(ps) - 'article_id' - 'prompt_hash',
+    'summaries', COALESCE((
+        SELECT jsonb_object_agg(s.summary_type, jsonb_build_object(
+            'summary', s.summary,
+            'model', s.model,
+            'metadata', s.metadata
+        ))
+        FROM article_summaries s
+        WHERE s.article_id = a.id
+    ), jsonb_build_object())
+) AS doc
+FROM public.articles a
+LEFT JOIN paper_signals ps ON ps.article_id = a.id
+WHERE {{where}}
+"""
+
+UPSERT = """
+INSERT INTO public.paper_documents (pmid, article_id, doc, built_at)
+SELECT pmid, article_id, doc, NOW()
+FROM ({build}) d
+ON CONFLICT (pmid) DO UPDATE
+SET article_id = EXCLUDED.article_id,
+    doc = EXCLUDED.doc,
+    built_at = EXCLUDED.built_at
+{tail}
+"""
+
+# full rebuilds leave unchanged documents alone (a weight change moves few grades)
+UNCHANGED = "WHERE paper_documents.doc IS DISTINCT FROM EXCLUDED.doc"
+
+# built before the article's or its signals' last write (summaries carry no timestamp)
+STALE = """
+NOT EXISTS (
+    SELECT 1 FROM public.paper_documents pd
+    WHERE pd.pmid = a.pmid
+      AND pd.built_at >= GREATEST(a.updated_at, a.scored_at, a.created_at)
+      AND (ps.updated_at IS NULL OR pd.built_at >= ps.updated_at)
+)
+"""
+
+PRUNE = """
+DELETE FROM public.paper_documents pd
+WHERE NOT EXISTS (SELECT 1 FROM public.articles a WHERE a.pmid = pd.pmid)
+"""
+
+GET = "SELECT doc FROM public.paper_documents WHERE pmid = %s"
+
+
+def ensure_schema(conn):
+    """
+    Create the documents table if missing. Safe to call from every job on
+    startup.
+    """
+    with conn.cursor() as cur:
+        cur.execute(ENSURE_SCHEMA)
+    conn.commit()
+
+
+def rebuild(cur, ids=None, pmids=None) -> list[int]:
+    """
+    Rebuild the documents of these articles (by articles.id and/or pmid).
+    Runs in the caller's transaction; returns the pmids rebuilt.
+    """
+    ids = [int(i) for i in ids or ()]
+    pmids = [int(p) for p in pmids or ()]
+    if not ids and not pmids:
+        return []
+    sql = UPSERT.format(
+        build=BUILD.format(where="(a.id = ANY(%(ids)s) OR a.pmid = ANY(%(pmids)s))"),
+        tail="RETURNING pmid",
+    )
+    # own cursor on the same connection: the caller's may use any row factory
+    with cur.connection.cursor(row_factory=tuple_row) as c:
+        c.execute(sql, {"ids": ids, "pmids": pmids})
+        return [row[0] for row in c.fetchall()]
+
+
+def rebuild_all(cur, stale_only: bool = False) -> int:
+    """
+    Rebuild every document (or only missing / outdated ones) and drop
+    those of deleted articles. Returns the number of documents written.
+    """
+    if stale_only:
+        sql = UPSERT.format(build=BUILD.format(where=STALE), tail="")
+    else:
+        sql = UPSERT.format(build=BUILD.format(where="TRUE"), tail=UNCHANGED)
+    cur.execute(sql)
+    n = cur.rowcount
+    cur.execute(PRUNE)
+    return n
+
+
+def get(conn, pmid: int) -> dict | None:
+    """
+    The document for one pmid; built on the fly (not stored) if it is
+    missing or the table was never installed. None if no such article.
+    """
+    try:
+        with conn.cursor() as cur:
+            cur.execute(GET, (pmid,))
+            row = cur.fetchone()
+    except psycopg.errors.UndefinedTable:
+        conn.rollback()
+        row = None
+    if row:
+        return row[0]
+
+    with conn.cursor(row_factory=dict_row) as cur:
+        cur.execute(BUILD.format(where="a.pmid = %s"), (pmid,))
+        row = cur.fetchone()
+    return row["doc"] if row else None
+
+
+def main():
+    if not DATABASE_URL:
+        raise SystemExit("Missing DATABASE_URL")
+
+    with psycopg.connect(DATABASE_URL) as conn:
+        ensure_schema(conn)
+
+        if "--rebuild" in sys.argv or "--stale" in sys.argv:
+            with conn.cursor() as cur:
+                n = rebuild_all(cur, stale_only="--rebuild" not in sys.argv)
+            conn.commit()
+            print(f"[paper_docs] rebuilt {n} documents")
+
+        docs = conn.execute("SELECT count(*) FROM public.paper_documents").fetchone()[0]
+        articles = conn.execute("SELECT count(*) FROM public.articles").fetchone()[0]
+        print(f"[paper_docs] {docs} documents for {articles} articles")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+ranking.py
+rank_score is computed in the database, from one place.
+
+- public.rank_weights holds the weight of each component (base, ai,
+  narrative).
+- public.compute_rank_score(base, ai, narrative) is the weighted mean of
+  the components that are present, rounded to 2 places (NULL if none are).
+- A BEFORE INSERT / UPDATE OF base_score, ai_score, narrative_score trigger
+  on public.articles keeps rank_score current whichever job writes a
+  component, so writers never set rank_score themselves.
+
+Changing weights updates rank_weights and re-ranks the whole table in one
+statement, in the same transaction (paper documents included, see
+paper_docs.py).
+
+Usage:
+  python ranking.py                                # install / show weights
+  python ranking.py --set base=0.5 ai=0.4 narrative=0.1
+  python ranking.py --rerank
+"""
+
+import os
+import sys
+
+import psycopg
+from dotenv import load_dotenv
+
+import page_cache
+import paper_docs
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
+
+DEFAULT_WEIGHTS = {"base": 0.55, "ai": 0.35, "narrative": 0.10}
+
+ENSURE_SCHEMA = """
+SELECT pg_advisory_xact_lock(hashtext('ranking.ensure_schema'));
+
+CREATE TABLE IF NOT EXISTS public.rank_weights (
+    component TEXT PRIMARY KEY,
+    weight DOUBLE PRECISION NOT NULL CHECK (weight >= 0),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION public.compute_rank_score(
+    base DOUBLE PRECISION,
+    ai DOUBLE PRECISION,
+    narrative DOUBLE PRECISION
+) RETURNS DOUBLE PRECISION
+LANGUAGE sql STABLE AS $$
+    SELECT CASE WHEN total > 0 THEN round((weighted / total)::numeric, 2)::double precision END
+    FROM (
+        SELECT
+            COALESCE(base * wb, 0) + COALESCE(ai * wa, 0) + COALESCE(narrative * wn, 0) AS weighted,
+            CASE WHEN base IS NOT NULL THEN wb ELSE 0 END
+              + CASE WHEN ai IS NOT NULL THEN wa ELSE 0 END
+              + CASE WHEN narrative IS NOT NULL THEN wn ELSE 0 END AS total
+        FROM (
+            SELECT
+                COALESCE(MAX(weight) FILTER (WHERE component = 'base'), 0) AS wb,
+                COALESCE(MAX(weight) FILTER (WHERE component = 'ai'), 0) AS wa,
+                COALESCE(MAX(weight) FILTER (WHERE component = 'narrative'), 0) AS wn
+            FROM public.rank_weights
+        ) w
+    ) t
+$$;
+
+CREATE OR REPLACE FUNCTION public.articles_set_rank_score() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.rank_score := public.compute_rank_score(NEW.base_score, NEW.ai_score, NEW.narrative_score);
+    RETURN NEW;
+END
+$$;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgname = 'articles_rank_score' AND tgrelid = 'public.articles'::regclass
+    ) THEN
+        CREATE TRIGGER articles_rank_score
+        BEFORE INSERT OR UPDATE OF base_score, ai_score, narrative_score ON public.articles
+        FOR EACH ROW EXECUTE FUNCTION public.articles_set_rank_score();
+    END IF;
+END
+$$;
+"""
+
+SEED_WEIGHT = """
+INSERT INTO public.rank_weights (component, weight)
+VALUES (%s, %s)
+ON CONFLICT (component) DO NOTHING
+"""
+
+SET_WEIGHT = """
+INSERT INTO public.rank_weights (component, weight)
+VALUES (%s, %s)
+ON CONFLICT (component) DO UPDATE
+SET weight = EXCLUDED.weight,
+    updated_at = NOW()
+"""
+
+RERANK_ALL = """
+UPDATE public.articles
+SET rank_score = public.compute_rank_score(base_score, ai_score, narrative_score)
+WHERE rank_score IS DISTINCT FROM public.compute_rank_score(base_score, ai_score, narrative_score)
+"""
+
+SELECT_WEIGHTS = "SELECT component, weight FROM public.rank_weights ORDER BY component"
+
+
+def ensure_schema(conn):
+    """
+    Create the weights table, SQL function and trigger if missing.
+    Safe to call from every job on startup.
+    """
+    with conn.cursor() as cur:
+        cur.execute(ENSURE_SCHEMA)
+        for component, weight in DEFAULT_WEIGHTS.items():
+            cur.execute(SEED_WEIGHT, (component, weight))
+    conn.commit()
+
+
+def rerank_all(cur) -> int:
+    """
+    Recompute rank_score for every row whose stored value is stale, then
+    the paper documents (rank and grade) that changed with it.
+    """
+    cur.execute(RERANK_ALL)
+    n = cur.rowcount
+    if n:
+        paper_docs.rebuild_all(cur)
+    return n
+
+
+def set_weights(conn, weights: dict[str, float]) -> int:
+    """
+    Store new weights and re-rank the table in one transaction.
+    """
+    unknown = set(weights) - set(DEFAULT_WEIGHTS)
+    if unknown:
+        raise ValueError(f"unknown rank components: {', '.join(sorted(unknown))}")
+    with conn.cursor() as cur:
+        for component, weight in weights.items():
+            cur.execute(SET_WEIGHT, (component, float(weight)))
+        n = rerank_all(cur)
+    conn.commit()
+    page_cache.invalidate()
+    return n
+
+
+def get_weights(conn) -> dict[str, float]:
+    return dict(conn.execute(SELECT_WEIGHTS).fetchall())
+
+
+def parse_weights(args: list[str]) -> dict[str, float]:
+    weights = {}
+    for arg in args:
+        component, sep, value = arg.partition("=")
+        if not sep:
+            raise SystemExit(f"expected component=weight, got {arg!r}")
+        weights[component.strip()] = float(value)
+    return weights
+
+
+def main():
+    if not DATABASE_URL:
+        raise SystemExit("Missing DATABASE_URL")
+
+    with psycopg.connect(DATABASE_URL) as conn:
+        ensure_schema(conn)
+        paper_docs.ensure_schema(conn)
+
+        if "--set" in sys.argv:
+            weights = parse_weights(sys.argv[sys.argv.index("--set") + 1:])
+            n = set_weights(conn, weights)
+            print(f"[ranking] weights updated, re-ranked {n} articles")
+        elif "--rerank" in sys.argv:
+            with conn.cursor() as cur:
+                n = rerank_all(cur)
+            conn.commit()
+            page_cache.invalidate()
+            print(f"[ranking] re-ranked {n} articles")
+
+        for component, weight in get_weights(conn).items():
+            print(f"{component:<10} {weight:g}")
+
+
+if __name__ == "__main__":
+    main()
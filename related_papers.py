@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+related_papers.py
+Precomputed "related papers" for the paper page.
+
+Each article is a set of terms: MeSH terms, keywords, LLM tags (articles
+and paper_signals) and mechanisms, lowercased and prefixed by source
+(mesh:, kw:, tag:, mech:). The corpus becomes a sparse TF-IDF matrix
+(SciPy CSR, rows L2-normalized) and neighbours are the top RELATED_K
+cosine scores, computed RELATED_CHUNK rows at a time as sparse products.
+Terms in fewer than RELATED_MIN_DF or more than RELATED_MAX_DF of the
+articles are dropped: they link nothing, or everything (e.g. "humans").
+
+public.article_neighbors holds one row per article (neighbour ids and
+scores, best first), so the paper route reads its list with one indexed
+lookup (neighbors()).
+
+Runs are incremental: only articles that are new or whose terms changed
+(features_hash) are scored against the whole corpus, and existing lists
+are merged with the new scores in both directions. Scores of untouched
+pairs keep the IDF of the run that wrote them; --full recomputes
+everything and drops deleted articles. Run after ingest (cron).
+
+Requirements:
+  pip install numpy scipy
+
+Usage:
+  python related_papers.py           # new / changed articles
+  python related_papers.py --full    # every article
+"""
+
+import hashlib
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+
+import psycopg
+from dotenv import load_dotenv
+from psycopg.rows import dict_row
+
+import page_cache
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # building disabled; neighbors() still works
+    np = None
+    sparse = None
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
+
+K = int(os.getenv("RELATED_K", "10"))
+MIN_SCORE = float(os.getenv("RELATED_MIN_SCORE", "0.1"))
+MIN_DF = int(os.getenv("RELATED_MIN_DF", "2"))
+MAX_DF = float(os.getenv("RELATED_MAX_DF", "0.2"))  # fraction of articles
+CHUNK = int(os.getenv("RELATED_CHUNK", "1000"))  # rows per sparse product
+FETCH_SIZE = 5000  # rows per round trip from the server-side cursor
+
+# (prefix, column of CORPUS)
+FIELDS = (
+    ("mesh", "mesh_terms"),
+    ("kw", "keywords"),
+    ("tag", "tags"),
+    ("tag", "signal_tags"),
+    ("mech", "mechanisms"),
+)
+
+ENSURE_SCHEMA = """
+SELECT pg_advisory_xact_lock(hashtext('related_papers.ensure_schema'));
+
+CREATE TABLE IF NOT EXISTS public.article_neighbors (
+    article_id BIGINT PRIMARY KEY,
+    pmid BIGINT NOT NULL,
+    neighbor_ids BIGINT[] NOT NULL DEFAULT '{}',
+    scores REAL[] NOT NULL DEFAULT '{}',
+    features_hash TEXT NOT NULL,
+    built_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS article_neighbors_pmid_key
+    ON public.article_neighbors (pmid);
+CREATE INDEX IF NOT EXISTS article_neighbors_neighbor_ids_idx
+    ON public.article_neighbors USING gin (neighbor_ids);
+"""
+
+CORPUS = """
+SELECT a.id, a.pmid, a.mesh_terms, a.keywords, a.tags, a.mechanisms, ps.tags AS signal_tags
+FROM public.articles a
+LEFT JOIN paper_signals ps ON ps.article_id = a.id
+ORDER BY a.id
+"""
+
+STORED_HASHES = "SELECT article_id, features_hash FROM public.article_neighbors"
+
+# lists gaining scores from, or pointing at, articles rescored or deleted
+STORED_LISTS = """
+SELECT article_id, neighbor_ids, scores
+FROM public.article_neighbors
+WHERE article_id = ANY(%(gaining)s::bigint[]) OR neighbor_ids && %(stale)s::bigint[]
+"""
+
+PRUNE = """
+DELETE FROM public.article_neighbors n
+WHERE NOT EXISTS (SELECT 1 FROM public.articles a WHERE a.id = n.article_id)
+"""
+
+CREATE_STAGING = """
+CREATE TEMP TABLE IF NOT EXISTS neighbor_rows (
+    article_id BIGINT PRIMARY KEY,
+    pmid BIGINT,
+    neighbor_ids BIGINT[],
+    scores REAL[],
+    features_hash TEXT
+) ON COMMIT DELETE ROWS
+"""
+
+COPY_STAGING = "COPY neighbor_rows (article_id, pmid, neighbor_ids, scores, features_hash) FROM STDIN"
+
+APPLY_STAGING = """
+INSERT INTO public.article_neighbors (article_id, pmid, neighbor_ids, scores, features_hash, built_at)
+SELECT article_id, pmid, neighbor_ids, scores, features_hash, NOW()
+FROM neighbor_rows
+ON CONFLICT (article_id) DO UPDATE
+SET pmid = EXCLUDED.pmid,
+    neighbor_ids = EXCLUDED.neighbor_ids,
+    scores = EXCLUDED.scores,
+    features_hash = EXCLUDED.features_hash,
+    built_at = EXCLUDED.built_at
+WHERE article_neighbors.neighbor_ids IS DISTINCT FROM EXCLUDED.neighbor_ids
+   OR article_neighbors.scores IS DISTINCT FROM EXCLUDED.scores
+   OR article_neighbors.features_hash IS DISTINCT FROM EXCLUDED.features_hash
+RETURNING pmid
+"""
+
+NEIGHBORS = """
+SELECT a.pmid, a.title, a.journal, a.publication_date, u.score
+FROM public.article_neighbors n
+CROSS JOIN LATERAL unnest(n.neighbor_ids, n.scores) WITH ORDINALITY AS u(article_id, score, ord)
+JOIN public.articles a ON a.id = u.article_id
+WHERE n.pmid = %s
+ORDER BY u.ord
+LIMIT %s
+"""
+
+_WS = re.compile(r"\s+")
+
+
+def ensure_schema(conn):
+    with conn.cursor() as cur:
+        cur.execute(ENSURE_SCHEMA)
+    conn.commit()
+
+
+def _flatten(value):
+    """
+    Strings out of a jsonb value: a list, a {category: [...]} object or
+    a bare string.
+    """
+    if value is None:
+        return
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _flatten(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _flatten(v)
+
+
+def terms(row: dict) -> list[str]:
+    out = set()
+    for prefix, column in FIELDS:
+        for term in _flatten(row[column]):
+            term = _WS.sub(" ", term).strip().lower()
+            if term:
+                out.add(f"{prefix}:{term}")
+    return sorted(out)
+
+
+def features_hash(term_list: list[str]) -> str:
+    return hashlib.sha1("\n".join(term_list).encode("utf-8")).hexdigest()
+
+
+def load_corpus(conn) -> tuple[list[int], list[int], list[list[str]]]:
+    """
+    (article ids, pmids, term lists), in id order.
+    """
+    ids, pmids, term_lists = [], [], []
+    with conn.cursor(name="related_corpus", row_factory=dict_row) as cur:
+        cur.itersize = FETCH_SIZE
+        cur.execute(CORPUS)
+        for row in cur:
+            ids.append(row["id"])
+            pmids.append(row["pmid"])
+            term_lists.append(terms(row))
+    return ids, pmids, term_lists
+
+
+def tfidf(term_lists: list[list[str]]):
+    """
+    CSR matrix, one L2-normalized row per term list (all-zero rows for
+    articles left with no terms after the document-frequency cut).
+    """
+    vocab = {}
+    indptr = [0]
+    indices = []
+    for term_list in term_lists:
+        for t in term_list:
+            indices.append(vocab.setdefault(t, len(vocab)))
+        indptr.append(len(indices))
+
+    n = len(term_lists)
+    indices = np.asarray(indices, dtype=np.int32)
+    df = np.bincount(indices, minlength=len(vocab))
+    keep = (df >= MIN_DF) & (df <= max(MIN_DF, MAX_DF * n))
+    idf = np.log((1.0 + n) / (1.0 + df)) + 1.0
+    data = np.where(keep[indices], idf[indices], 0.0)
+
+    X = sparse.csr_matrix((data, indices, np.asarray(indptr)), shape=(n, len(vocab)))
+    X.eliminate_zeros()
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms).dot(X).tocsr()
+
+
+def similarity_chunks(X, rows):
+    """
+    (chunk of row numbers, CSR cosine scores of those rows vs every row).
+    """
+    XT = X.T.tocsr()
+    for start in range(0, len(rows), CHUNK):
+        chunk = rows[start:start + CHUNK]
+        yield chunk, (X[chunk] @ XT).tocsr()
+
+
+def top_k(S, i: int, row: int):
+    """
+    Best K (row numbers, scores) of S's i-th row, excluding itself.
+    """
+    lo, hi = S.indptr[i], S.indptr[i + 1]
+    cols, vals = S.indices[lo:hi], S.data[lo:hi]
+    mask = (cols != row) & (vals >= MIN_SCORE)
+    cols, vals = cols[mask], vals[mask]
+    if len(vals) > K:
+        part = np.argpartition(-vals, K)[:K]
+        cols, vals = cols[part], vals[part]
+    order = np.lexsort((cols, -vals))
+    return cols[order], vals[order]
+
+
+def build(conn, full: bool = False) -> tuple[int, int, list[int]]:
+    """
+    Recompute neighbour lists in one transaction. Returns (articles
+    rescored, lists written, pmids of the lists written).
+    """
+    ids, pmids, term_lists = load_corpus(conn)
+    hashes = [features_hash(t) for t in term_lists]
+    row_of = {article_id: r for r, article_id in enumerate(ids)}
+
+    if full:
+        rescore = list(range(len(ids)))
+        deleted = []
+    else:
+        stored = dict(conn.execute(STORED_HASHES).fetchall())
+        rescore = [r for r, article_id in enumerate(ids) if stored.get(article_id) != hashes[r]]
+        deleted = [article_id for article_id in stored if article_id not in row_of]
+    if not rescore and not deleted:
+        return 0, 0, []
+
+    X = tfidf(term_lists)
+    rescored = np.zeros(len(ids), dtype=bool)
+    rescored[rescore] = True
+
+    lists = {}  # row -> [(article_id, score)], best first
+    incoming = defaultdict(list)  # untouched row -> [(article_id, score)] from rescored rows
+    for chunk, S in similarity_chunks(X, np.asarray(rescore)):
+        for i, row in enumerate(chunk):
+            cols, vals = top_k(S, i, row)
+            lists[row] = [(ids[c], float(v)) for c, v in zip(cols, vals)]
+        if not full:
+            coo = S.tocoo()
+            mask = (coo.data >= MIN_SCORE) & ~rescored[coo.col]
+            for i, c, v in zip(coo.row[mask], coo.col[mask], coo.data[mask]):
+                incoming[int(c)].append((ids[chunk[i]], float(v)))
+
+    if not full:
+        # untouched articles: drop entries for rescored / deleted ones, merge the new scores
+        params = {"gaining": [ids[r] for r in incoming], "stale": [ids[r] for r in rescore] + deleted}
+        for article_id, neighbor_ids, scores in conn.execute(STORED_LISTS, params).fetchall():
+            row = row_of.get(article_id)
+            if row is None or rescored[row]:
+                continue
+            entries = {
+                n: s for n, s in zip(neighbor_ids, scores)
+                if n in row_of and not rescored[row_of[n]]
+            }
+            entries.update(incoming.pop(row, []))
+            lists[row] = sorted(entries.items(), key=lambda e: (-e[1], e[0]))[:K]
+
+    with conn.cursor() as cur:
+        cur.execute(PRUNE)
+        cur.execute(CREATE_STAGING)
+        cur.execute("TRUNCATE neighbor_rows")
+        with cur.copy(COPY_STAGING) as copy:
+            copy.set_types(["bigint", "bigint", "bigint[]", "real[]", "text"])
+            for row, entries in lists.items():
+                copy.write_row((
+                    ids[row],
+                    pmids[row],
+                    [n for n, _ in entries],
+                    [round(s, 4) for _, s in entries],
+                    hashes[row],
+                ))
+        cur.execute(APPLY_STAGING)
+        written = [r[0] for r in cur.fetchall()]
+    conn.commit()
+    return len(rescore), len(written), written
+
+
+def neighbors(conn, pmid, limit: int = K) -> list[dict]:
+    """
+    Related papers for one pmid, best first; [] if none were computed
+    (or the job never ran).
+    """
+    try:
+        with conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(NEIGHBORS, (pmid, limit))
+            return cur.fetchall()
+    except psycopg.errors.UndefinedTable:
+        conn.rollback()
+        return []
+
+
+def main():
+    if not DATABASE_URL:
+        raise SystemExit("Missing DATABASE_URL")
+    if np is None:
+        raise SystemExit("related_papers needs numpy and scipy: pip install numpy scipy")
+
+    full = "--full" in sys.argv
+    started = time.time()
+    with psycopg.connect(DATABASE_URL) as conn:
+        ensure_schema(conn)
+        rescored, n, pmids = build(conn, full=full)
+
+    page_cache.invalidate(None if full else pmids)
+    print(f"[related] rescored {rescored} articles, wrote {n} lists "
+          f"({'full' if full else 'incremental'}, {time.time() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,56 @@
 #!/usr/bin/env python3
+"""
+score_articles.py
+Rules-based base_score for articles.
+
+Rows are scored a batch at a time (all term lists go through one
+TermMatcher) and written back with one COPY into a temp staging table plus
+a single UPDATE ... FROM, instead of one UPDATE per row. Each row records
+the RULES_VERSION that scored it; bump it whenever the rules change.
+
+Usage:
+  python score_articles.py              # rows with no base_score yet
+  python score_articles.py --rescore    # rows scored by an older RULES_VERSION
+  python score_articles.py --rescore --force   # every row
+
+--rescore splits the stale rows into SCORE_WORKERS disjoint id ranges and
+scores them in parallel processes. Each worker walks its range in keyset
+chunks of SCORE_BATCH_SIZE, streaming rows through a server-side cursor and
+committing per chunk, so memory stays bounded and an interrupted run
+resumes where it stopped. Rescoring keeps agent_status and any AI
+score_components; rank_score follows base_score via the ranking trigger.
+
+Optional: pip install pyahocorasick (single-pass term matching).
+"""
 
 import os
+import sys
 import json
 import re
+import time
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
 import psycopg
+from psycopg.rows import dict_row
 from dotenv import load_dotenv
 
+import page_cache
+import paper_docs
+import ranking
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
-BATCH_SIZE = int(os.getenv("SCORE_BATCH_SIZE", "500"))
+BATCH_SIZE = int(os.getenv("SCORE_BATCH_SIZE", "5000"))
+SCORE_WORKERS = int(os.getenv("SCORE_WORKERS", "4"))
+FETCH_SIZE = 1000  # rows per round trip from the server-side cursor
+
+RULES_VERSION = "rules_v1"
 
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL is not set")
@@ -19,14 +60,76 @@ def clamp(value, low=0, high=100):
     return max(low, min(high, value))
 
 
-def contains_any(text: str, terms: list[str]) -> bool:
-    t = text.lower()
-    return any(term in t for term in terms)
-
-
-def count_any(text: str, terms: list[str]) -> int:
-    t = text.lower()
-    return sum(1 for term in terms if term in t)
+# Rule term lists; matched as substrings of the lower-cased title + abstract
+THERAPY_TERMS = [
+    "therapy", "therapeutic", "treatment", "treated", "intervention",
+    "drug", "compound", "small molecule", "repurpos", "neuroprotect",
+    "disease-modifying", "disease modifying", "ameliorat", "improv"
+]
+
+CLINICAL_TERMS = [
+    "clinical trial", "randomized", "randomised", "double-blind",
+    "double blind", "placebo", "phase ii", "phase iii", "phase 2",
+    "phase 3", "patient", "patients", "cohort", "human study", "humans"
+]
+
+MECHANISM_TERMS = [
+    "alpha-synuclein", "synuclein", "mitochondria", "mitochondrial",
+    "inflammation", "neuroinflammation", "microglia", "dopamine",
+    "oxidative stress", "lysosome", "autophagy", "protein aggregation",
+    "gut microbiota", "mitophagy"
+]
+
+REVIEW_TERMS = [
+    "review", "systematic review", "meta-analysis", "meta analysis",
+    "bibliometric", "protocol"
+]
+
+PRECLINICAL_TERMS = [
+    "mouse", "mice", "murine", "rat", "zebrafish", "drosophila",
+    "cell line", "sh-sy5y", "in vitro", "animal model"
+]
+
+DISEASE_TERMS = ["parkinson", "alzheimer"]
+
+JOURNAL_TERMS = ["neurology", "movement disorders", "jama", "lancet", "nature", "brain"]
+
+
+class TermMatcher:
+    """
+    Every rule term behind one matcher. found() returns the set of terms
+    occurring in a text, with the same substring semantics as `term in text`
+    (overlapping and nested terms all count).
+
+    Uses an Aho-Corasick automaton (one pass over the text) when
+    pyahocorasick is installed, otherwise one substring check per distinct
+    term.
+    """
+    def __init__(self, terms: list[str]):
+        self.terms = sorted(set(terms))
+        self._automaton = None
+        if ahocorasick is not None:
+            automaton = ahocorasick.Automaton()
+            for term in self.terms:
+                automaton.add_word(term, term)
+            automaton.make_automaton()
+            self._automaton = automaton
+
+    def found(self, text: str) -> set[str]:
+        if self._automaton is not None:
+            return {term for _, term in self._automaton.iter(text)}
+        return {term for term in self.terms if term in text}
+
+
+MATCHER = TermMatcher(
+    THERAPY_TERMS + CLINICAL_TERMS + MECHANISM_TERMS + REVIEW_TERMS + PRECLINICAL_TERMS + DISEASE_TERMS
+)
+
+_THERAPY = frozenset(THERAPY_TERMS)
+_CLINICAL = frozenset(CLINICAL_TERMS)
+_MECHANISM = frozenset(MECHANISM_TERMS)
+_REVIEW = frozenset(REVIEW_TERMS)
+_PRECLINICAL = frozenset(PRECLINICAL_TERMS)
 
 
 def compute_base_score(row: dict) -> tuple[float, dict]:
@@ -34,70 +137,42 @@ def compute_base_score(row: dict) -> tuple[float, dict]:
     abstract = row.get("abstract") or ""
     journal = row.get("journal") or ""
     combined = f"{title}\n{abstract}".lower()
+    found = MATCHER.found(combined)
 
     score = 0.0
     reasons = []
 
-    positive_therapy_terms = [
-        "therapy", "therapeutic", "treatment", "treated", "intervention",
-        "drug", "compound", "small molecule", "repurpos", "neuroprotect",
-        "disease-modifying", "disease modifying", "ameliorat", "improv"
-    ]
-
-    clinical_terms = [
-        "clinical trial", "randomized", "randomised", "double-blind",
-        "double blind", "placebo", "phase ii", "phase iii", "phase 2",
-        "phase 3", "patient", "patients", "cohort", "human study", "humans"
-    ]
-
-    mechanism_terms = [
-        "alpha-synuclein", "synuclein", "mitochondria", "mitochondrial",
-        "inflammation", "neuroinflammation", "microglia", "dopamine",
-        "oxidative stress", "lysosome", "autophagy", "protein aggregation",
-        "gut microbiota", "mitophagy"
-    ]
-
-    weak_or_non_therapeutic_terms = [
-        "review", "systematic review", "meta-analysis", "meta analysis",
-        "bibliometric", "protocol"
-    ]
-
-    preclinical_terms = [
-        "mouse", "mice", "murine", "rat", "zebrafish", "drosophila",
-        "cell line", "sh-sy5y", "in vitro", "animal model"
-    ]
-
-    strong_positive_hits = count_any(combined, positive_therapy_terms)
+    strong_positive_hits = len(found & _THERAPY)
     if strong_positive_hits:
         add = min(30, strong_positive_hits * 8)
         score += add
         reasons.append({"factor": "therapy_terms", "delta": add})
 
-    clinical_hits = count_any(combined, clinical_terms)
+    clinical_hits = len(found & _CLINICAL)
     if clinical_hits:
         add = min(25, clinical_hits * 10)
         score += add
         reasons.append({"factor": "clinical_terms", "delta": add})
 
-    mechanism_hits = count_any(combined, mechanism_terms)
+    mechanism_hits = len(found & _MECHANISM)
     if mechanism_hits:
         add = min(15, mechanism_hits * 3)
         score += add
         reasons.append({"factor": "mechanism_terms", "delta": add})
 
-    if "parkinson" in combined:
+    if "parkinson" in found:
         score += 15
         reasons.append({"factor": "parkinson_direct_match", "delta": 15})
 
-    if "alzheimer" in combined and "parkinson" in combined:
+    if "alzheimer" in found and "parkinson" in found:
         score += 4
         reasons.append({"factor": "multi_neuro_context", "delta": 4})
 
-    if contains_any(combined, weak_or_non_therapeutic_terms):
+    if found & _REVIEW:
         score -= 12
         reasons.append({"factor": "review_or_meta_penalty", "delta": -12})
 
-    preclinical_hits = count_any(combined, preclinical_terms)
+    preclinical_hits = len(found & _PRECLINICAL)
     if preclinical_hits:
         penalty = min(12, preclinical_hits * 4)
         score -= penalty
@@ -105,7 +180,7 @@ def compute_base_score(row: dict) -> tuple[float, dict]:
 
     if journal:
         j = journal.lower()
-        if any(x in j for x in ["neurology", "movement disorders", "jama", "lancet", "nature", "brain"]):
+        if any(x in j for x in JOURNAL_TERMS):
             score += 6
             reasons.append({"factor": "journal_bonus", "delta": 6})
 
@@ -132,7 +207,7 @@ def compute_base_score(row: dict) -> tuple[float, dict]:
     final_score = round(clamp(score), 2)
 
     components = {
-        "method": "rules_v1",
+        "method": RULES_VERSION,
         "base_score_raw": score,
         "base_score_final": final_score,
         "reasons": reasons,
@@ -143,89 +218,196 @@ def compute_base_score(row: dict) -> tuple[float, dict]:
     return final_score, components
 
 
-def compute_rank_score(base_score, ai_score, narrative_score=None):
-    parts = []
-    weights = []
-
-    if base_score is not None:
-        parts.append(float(base_score))
-        weights.append(0.55)
-
-    if ai_score is not None:
-        parts.append(float(ai_score))
-        weights.append(0.35)
+FETCH_UNSCORED = """
+SELECT
+    id,
+    pmid,
+    title,
+    abstract,
+    journal,
+    publication_date
+FROM public.articles
+WHERE base_score IS NULL
+ORDER BY publication_date DESC NULLS LAST, created_at DESC
+LIMIT %s
+"""
+
+ENSURE_COLUMNS = """
+ALTER TABLE public.articles ADD COLUMN IF NOT EXISTS rules_version TEXT;
+"""
+
+# ntile over the stale ids gives balanced, disjoint ranges even when ids are sparse
+STALE_RANGES = """
+SELECT MIN(id), MAX(id), COUNT(*)
+FROM (
+    SELECT id, ntile(%(workers)s) OVER (ORDER BY id) AS bucket
+    FROM public.articles
+    WHERE %(force)s OR rules_version IS DISTINCT FROM %(version)s
+) t
+GROUP BY bucket
+ORDER BY bucket
+"""
+
+FETCH_RANGE = """
+SELECT
+    id,
+    title,
+    abstract,
+    journal,
+    publication_date
+FROM public.articles
+WHERE id > %(after)s
+  AND id <= %(hi)s
+  AND (%(force)s OR rules_version IS DISTINCT FROM %(version)s)
+ORDER BY id
+LIMIT %(limit)s
+"""
+
+CREATE_STAGING = """
+CREATE TEMP TABLE IF NOT EXISTS rules_scores (
+    id BIGINT PRIMARY KEY,
+    base_score DOUBLE PRECISION,
+    score_components JSONB
+) ON COMMIT DELETE ROWS
+"""
+
+COPY_STAGING = "COPY rules_scores (id, base_score, score_components) FROM STDIN"
+
+APPLY_STAGING = """
+UPDATE public.articles a
+SET
+    base_score = s.base_score,
+    score_components = COALESCE(a.score_components, '{}'::jsonb) || s.score_components,
+    rules_version = %(version)s,
+    agent_status = COALESCE(%(status)s, a.agent_status),
+    scored_at = NOW()
+FROM rules_scores s
+WHERE a.id = s.id
+"""
+
+
+def score_batch(rows: Iterable[dict]) -> list[tuple]:
+    """
+    (id, base_score, score_components) for each row. rows may be a
+    server-side cursor; only the scores are kept.
+    """
+    out = []
+    for row in rows:
+        base_score, components = compute_base_score(row)
+        out.append((row["id"], base_score, components))
+    return out
+
+
+def ensure_schema(conn):
+    with conn.cursor() as cur:
+        cur.execute(ENSURE_COLUMNS)
+    conn.commit()
+
+
+def write_scores(cur, scored: list[tuple], status: str | None = "scored_rules_v1") -> int:
+    """
+    Bulk write score_batch() output: COPY into the staging table, then one
+    UPDATE joined on id, and the paper documents of those rows.
+    status=None leaves agent_status alone (rescoring). Returns the number
+    of articles updated.
+    """
+    if not scored:
+        return 0
+    cur.execute(CREATE_STAGING)
+    cur.execute("TRUNCATE rules_scores")
+    with cur.copy(COPY_STAGING) as copy:
+        for article_id, base_score, components in scored:
+            copy.write_row((article_id, base_score, json.dumps(components)))
+    cur.execute(APPLY_STAGING, {"version": RULES_VERSION, "status": status})
+    written = cur.rowcount
+    paper_docs.rebuild(cur, ids=[article_id for article_id, _, _ in scored])
+    return written
+
+
+def score_pending() -> int:
+    """
+    Drain rows with no base_score yet, one transaction per chunk.
+    """
+    processed = 0
+    with psycopg.connect(DATABASE_URL) as conn:
+        with conn.cursor(row_factory=dict_row) as cur:
+            while True:
+                cur.execute(FETCH_UNSCORED, (BATCH_SIZE,))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+
+                written = write_scores(cur, score_batch(rows))
+                conn.commit()
+                page_cache.invalidate(r["pmid"] for r in rows)
+                processed += written
+                if written < len(rows):
+                    break
+    return processed
+
+
+def rescore_range(lo: int, hi: int, force: bool = False) -> int:
+    """
+    Rescore stale rows with lo <= id <= hi. Runs in a worker process.
+    """
+    processed = 0
+    after = lo - 1
+    params = {"hi": hi, "force": force, "version": RULES_VERSION, "limit": BATCH_SIZE}
 
-    if narrative_score is not None:
-        parts.append(float(narrative_score))
-        weights.append(0.10)
+    with psycopg.connect(DATABASE_URL) as conn:
+        while True:
+            # server-side cursor: the chunk's abstracts are streamed, not held
+            with conn.cursor(name=f"rescore_{lo}", row_factory=dict_row) as scur:
+                scur.itersize = FETCH_SIZE
+                scur.execute(FETCH_RANGE, {**params, "after": after})
+                scored = score_batch(scur)
+            if not scored:
+                break
+
+            with conn.cursor() as cur:
+                processed += write_scores(cur, scored, status=None)
+            conn.commit()
+            page_cache.invalidate()
+            after = scored[-1][0]
+            print(f"[rescore {lo}-{hi}] {processed} rows (at id {after})", flush=True)
+    return processed
+
+
+def rescore(force: bool = False, workers: int = SCORE_WORKERS) -> int:
+    with psycopg.connect(DATABASE_URL) as conn:
+        ranges = conn.execute(
+            STALE_RANGES, {"workers": max(1, workers), "force": force, "version": RULES_VERSION}
+        ).fetchall()
+    if not ranges:
+        return 0
 
-    if not parts:
-        return None
+    total = sum(n for _, _, n in ranges)
+    print(f"[rescore] {total} rows to {RULES_VERSION} over {len(ranges)} workers")
+    if len(ranges) == 1:
+        return rescore_range(ranges[0][0], ranges[0][1], force)
 
-    total_weight = sum(weights)
-    weighted = sum(v * w for v, w in zip(parts, weights)) / total_weight
-    return round(weighted, 2)
+    with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        futures = [pool.submit(rescore_range, lo, hi, force) for lo, hi, _ in ranges]
+        return sum(f.result() for f in futures)
 
 
 def main():
-    processed = 0
+    started = time.time()
 
     with psycopg.connect(DATABASE_URL) as conn:
-        with conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
-            cur.execute(
-                """
-                SELECT
-                    pmid,
-                    title,
-                    abstract,
-                    journal,
-                    publication_date,
-                    base_score,
-                    ai_score,
-                    narrative_score
-                FROM public.articles
-                WHERE base_score IS NULL
-                ORDER BY publication_date DESC NULLS LAST, created_at DESC
-                LIMIT %s
-                """,
-                (BATCH_SIZE,)
-            )
-            rows = cur.fetchall()
-
-            for row in rows:
-                base_score, components = compute_base_score(row)
-                rank_score = compute_rank_score(
-                    base_score=base_score,
-                    ai_score=row.get("ai_score"),
-                    narrative_score=row.get("narrative_score"),
-                )
-
-                cur.execute(
-                    """
-                    UPDATE public.articles
-                    SET
-                        base_score = %s,
-                        rank_score = %s,
-                        score_components = %s::jsonb,
-                        agent_status = %s,
-                        scored_at = NOW()
-                    WHERE pmid = %s
-                    """,
-                    (
-                        base_score,
-                        rank_score,
-                        json.dumps(components),
-                        "scored_rules_v1",
-                        row["pmid"],
-                    ),
-                )
-                processed += 1
-
-        conn.commit()
-
-    print(f"Scored {processed} articles with rules_v1")
+        ensure_schema(conn)
+        ranking.ensure_schema(conn)
+        paper_docs.ensure_schema(conn)
+
+    if "--rescore" in sys.argv:
+        processed = rescore(force="--force" in sys.argv)
+    else:
+        processed = score_pending()
+
+    elapsed = time.time() - started
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"Scored {processed} articles with {RULES_VERSION} in {elapsed:.1f}s ({rate:.0f}/s)")
 
 
 if __name__ == "__main__":
     main()
-    
\ No newline at end of file
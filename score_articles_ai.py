@@ -2,24 +2,35 @@
 
 import json
 import os
-import time
 import psycopg
 from dotenv import load_dotenv
 from openai import OpenAI
 
+from agents import batch_api, schemas
+from agents.batching import PROMPT_BATCH_MAX, run_batched
+from agents.llm_cache import Scope, prompt_version
+from agents.prompting import compact_abstract
+import llm_gate
+import page_cache
+import paper_docs
+import ranking
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "").strip()  # e.g. mock_llm_server.py
 AI_BATCH_SIZE = int(os.getenv("AI_SCORE_BATCH_SIZE", "500"))
 AI_MODEL = os.getenv("AI_SCORE_MODEL", "gpt-5-mini")
+AI_SCORE_MODE = os.getenv("AI_SCORE_MODE", "sync").strip()  # sync | batch (OpenAI Batch API)
+AI_PROMPT_BATCH = int(os.getenv("AI_PROMPT_BATCH", str(PROMPT_BATCH_MAX)))  # articles per request
 
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL is not set")
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY is not set")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None)
 
 
 SYSTEM_PROMPT = """
@@ -45,6 +56,9 @@ Be careful, evidence-based, and avoid hype.
 """
 
 
+CACHE = Scope(AI_MODEL, prompt_version(SYSTEM_PROMPT, json.dumps(schemas.AI_SCORE, sort_keys=True)))
+
+
 def clamp(value, low=0, high=100):
     return max(low, min(high, value))
 
@@ -68,30 +82,12 @@ def compute_ai_score(payload: dict) -> float:
     return round(clamp(score), 2)
 
 
-def compute_rank_score(base_score, ai_score, narrative_score=None):
-    parts = []
-    weights = []
-
-    if base_score is not None:
-        parts.append(float(base_score))
-        weights.append(0.55)
-    if ai_score is not None:
-        parts.append(float(ai_score))
-        weights.append(0.35)
-    if narrative_score is not None:
-        parts.append(float(narrative_score))
-        weights.append(0.10)
-
-    if not parts:
-        return None
+def validate_ai_payload(payload: dict) -> dict:
+    return schemas.validate(schemas.AI_SCORE, payload)
 
-    total_weight = sum(weights)
-    weighted = sum(v * w for v, w in zip(parts, weights)) / total_weight
-    return round(weighted, 2)
 
-
-def ask_ai(title: str, abstract: str, journal: str, publication_date):
-    user_prompt = f"""
+def user_prompt_for(title: str, abstract: str, journal: str, publication_date) -> str:
+    return f"""
 TITLE:
 {title or ""}
 
@@ -102,23 +98,202 @@ PUBLICATION_DATE:
 {publication_date or ""}
 
 ABSTRACT:
-{abstract or ""}
+{compact_abstract(abstract)}
 
 Analyze this paper for Parkinson's-related therapeutic discovery signals.
 Return only valid JSON.
 """
 
-    response = client.responses.create(
+
+def messages_for(user_prompt: str) -> list[dict]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def request_body(user_prompt: str) -> dict:
+    return schemas.request_body("responses", AI_MODEL, messages_for(user_prompt), schemas.AI_SCORE)
+
+
+def ask_ai(title: str, abstract: str, journal: str, publication_date):
+    user_prompt = user_prompt_for(title, abstract, journal, publication_date)
+    return CACHE.call(user_prompt, lambda: schemas.complete(
+        client,
+        api="responses",
         model=AI_MODEL,
-        input=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ],
-        text={"format": {"type": "text"}},
+        schema=schemas.AI_SCORE,
+        system=SYSTEM_PROMPT,
+        user=user_prompt,
+    ))
+
+
+def _call_batch_text(user_prompt: str) -> str:
+    body = schemas.request_body(
+        "responses", AI_MODEL, messages_for(user_prompt), schemas.batch_schema(schemas.AI_SCORE),
+    )
+    return schemas.send(client, "responses", body)
+
+
+def ask_ai_batch(rows: list[dict]) -> tuple[dict, dict]:
+    """
+    Score several rows per request. Returns (payloads, errors) keyed by str(pmid).
+    """
+    def render(row):
+        return {
+            "title": row.get("title") or "",
+            "journal": row.get("journal") or "",
+            "publication_date": str(row.get("publication_date") or ""),
+            "abstract": compact_abstract(row.get("abstract")),
+        }
+
+    def single(row):
+        return ask_ai(
+            title=row.get("title"),
+            abstract=row.get("abstract"),
+            journal=row.get("journal"),
+            publication_date=row.get("publication_date"),
+        )
+
+    return run_batched(
+        rows,
+        key=lambda row: str(row["pmid"]),
+        render=render,
+        call=_call_batch_text,
+        validate=validate_ai_payload,
+        single=single,
+        header="Analyze each paper for Parkinson's-related therapeutic discovery signals.",
+        max_items=AI_PROMPT_BATCH,
+        cache=CACHE,
+        cache_text=lambda row: user_prompt_for(
+            row.get("title"), row.get("abstract"), row.get("journal"), row.get("publication_date"),
+        ),
     )
 
-    text = response.output_text.strip()
-    return json.loads(text)
+
+def write_ai_result(cur, row: dict, payload: dict):
+    ai_score = compute_ai_score(payload)
+
+    cur.execute(
+        """
+        UPDATE public.articles
+        SET
+            ai_score = %s,
+            ai_confidence = %s,
+            ai_summary = %s,
+            why_it_matters = %s,
+            mechanisms = %s::jsonb,
+            candidate_interventions = %s::jsonb,
+            red_flags = %s::jsonb,
+            ai_model = %s,
+            agent_status = %s,
+            scored_at = NOW()
+        WHERE pmid = %s
+        """,
+        (
+            ai_score,
+            payload.get("confidence"),
+            payload.get("ai_summary"),
+            payload.get("why_it_matters"),
+            json.dumps(payload.get("primary_mechanisms", [])),
+            json.dumps(payload.get("candidate_interventions", [])),
+            json.dumps(payload.get("red_flags", [])),
+            AI_MODEL,
+            "scored_ai_v1",
+            row["pmid"],
+        ),
+    )
+    paper_docs.rebuild(cur, pmids=[row["pmid"]])
+
+
+def write_ai_error(cur, pmid, e: Exception):
+    cur.execute(
+        """
+        UPDATE public.articles
+        SET agent_status = %s
+        WHERE pmid = %s
+        """,
+        (f"ai_error: {str(e)[:180]}", pmid),
+    )
+
+
+BATCH_KIND = "ai_score"
+
+
+def ingest_batch_result(cur, custom_id: str, text: str):
+    """
+    Write one Batch API result. Safe to repeat: the UPDATE is keyed by pmid
+    and fully determined by the payload.
+    """
+    payload = validate_ai_payload(schemas.parse_json(text))
+    cur.execute(
+        "SELECT pmid FROM public.articles WHERE pmid = %s",
+        (int(custom_id),),
+    )
+    row = cur.fetchone()
+    if not row:
+        raise LookupError(f"pmid {custom_id} no longer exists")
+    write_ai_result(cur, {"pmid": row[0]}, payload)
+
+
+def main_batch():
+    """
+    Ingest finished Batch API jobs, then queue the next backlog slice.
+    Run from cron; results land on a later run once the job completes.
+    """
+    backend = batch_api.get_backend(client)
+
+    with psycopg.connect(DATABASE_URL) as conn:
+        llm_gate.ensure_schema(conn)
+        ranking.ensure_schema(conn)
+        paper_docs.ensure_schema(conn)
+
+        def build_requests():
+            with conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+                cur.execute(
+                    f"""
+                    SELECT id, pmid, title, abstract, journal, publication_date,
+                           publication_types, gate_released_at, base_score, ai_score, narrative_score
+                    FROM public.articles
+                    WHERE ai_score IS NULL
+                      AND {llm_gate.not_gated_sql()}
+                      AND {batch_api.in_flight_sql("pmid")}
+                    ORDER BY base_score DESC NULLS LAST, publication_date DESC NULLS LAST
+                    LIMIT %s
+                    """,
+                    (BATCH_KIND, AI_BATCH_SIZE),
+                )
+                rows, gated = llm_gate.split(cur.fetchall())
+                llm_gate.mark_gated(cur, gated)
+            conn.commit()
+            if gated:
+                print(f"AI batch: gated {len(gated)} ({llm_gate.summarize(gated)})")
+            return [
+                (
+                    str(row["pmid"]),
+                    request_body(user_prompt_for(
+                        row.get("title"), row.get("abstract"), row.get("journal"), row.get("publication_date"),
+                    )),
+                )
+                for row in rows
+            ]
+
+        ingested = []
+
+        def ingest(cur, custom_id: str, text: str):
+            ingest_batch_result(cur, custom_id, text)
+            ingested.append(custom_id)
+
+        counts = batch_api.run_cycle(
+            conn, backend, BATCH_KIND, "/v1/responses", ingest, build_requests,
+        )
+    page_cache.invalidate(ingested)
+
+    print(
+        f"AI batch: ingested {counts['ingested']}, failed {counts['failed']}, "
+        f"open jobs {counts['open']}, submitted {counts['submitted']} "
+        f"(batch_id={counts['batch_id']}), model={AI_MODEL}"
+    )
 
 
 def main():
@@ -126,93 +301,73 @@ def main():
     failed = 0
 
     with psycopg.connect(DATABASE_URL) as conn:
+        llm_gate.ensure_schema(conn)
+        ranking.ensure_schema(conn)
+        paper_docs.ensure_schema(conn)
+
         with conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
             cur.execute(
-                """
+                f"""
                 SELECT
+                    id,
                     pmid,
                     title,
                     abstract,
                     journal,
                     publication_date,
+                    publication_types,
+                    gate_released_at,
                     base_score,
                     ai_score,
                     narrative_score
                 FROM public.articles
                 WHERE ai_score IS NULL
+                  AND {llm_gate.not_gated_sql()}
                 ORDER BY base_score DESC NULLS LAST, publication_date DESC NULLS LAST
                 LIMIT %s
                 """,
                 (AI_BATCH_SIZE,),
             )
-            rows = cur.fetchall()
-
-            for row in rows:
-                try:
-                    payload = ask_ai(
-                        title=row.get("title"),
-                        abstract=row.get("abstract"),
-                        journal=row.get("journal"),
-                        publication_date=row.get("publication_date"),
-                    )
-
-                    ai_score = compute_ai_score(payload)
-                    rank_score = compute_rank_score(
-                        base_score=row.get("base_score"),
-                        ai_score=ai_score,
-                        narrative_score=row.get("narrative_score"),
-                    )
-
-                    cur.execute(
-                        """
-                        UPDATE public.articles
-                        SET
-                            ai_score = %s,
-                            ai_confidence = %s,
-                            ai_summary = %s,
-                            why_it_matters = %s,
-                            mechanisms = %s::jsonb,
-                            candidate_interventions = %s::jsonb,
-                            red_flags = %s::jsonb,
-                            ai_model = %s,
-                            rank_score = %s,
-                            agent_status = %s,
-                            scored_at = NOW()
-                        WHERE pmid = %s
-                        """,
-                        (
-                            ai_score,
-                            payload.get("confidence"),
-                            payload.get("ai_summary"),
-                            payload.get("why_it_matters"),
-                            json.dumps(payload.get("primary_mechanisms", [])),
-                            json.dumps(payload.get("candidate_interventions", [])),
-                            json.dumps(payload.get("red_flags", [])),
-                            AI_MODEL,
-                            rank_score,
-                            "scored_ai_v1",
-                            row["pmid"],
-                        ),
-                    )
-                    processed += 1
-                    time.sleep(0.2)
-
-                except Exception as e:
-                    cur.execute(
-                        """
-                        UPDATE public.articles
-                        SET agent_status = %s
-                        WHERE pmid = %s
-                        """,
-                        (f"ai_error: {str(e)[:180]}", row["pmid"]),
-                    )
-                    failed += 1
+            fetched = cur.fetchall()
+            rows, gated = llm_gate.split(fetched)
+            llm_gate.mark_gated(cur, gated)
+
+            if AI_PROMPT_BATCH > 1:
+                payloads, errors = ask_ai_batch(rows)
+                for row in rows:
+                    key = str(row["pmid"])
+                    if key in payloads:
+                        write_ai_result(cur, row, payloads[key])
+                        processed += 1
+                    else:
+                        write_ai_error(cur, row["pmid"], errors.get(key, RuntimeError("no result")))
+                        failed += 1
+            else:
+                for row in rows:
+                    try:
+                        payload = ask_ai(
+                            title=row.get("title"),
+                            abstract=row.get("abstract"),
+                            journal=row.get("journal"),
+                            publication_date=row.get("publication_date"),
+                        )
+                        write_ai_result(cur, row, payload)
+                        processed += 1
+
+                    except Exception as e:
+                        write_ai_error(cur, row["pmid"], e)
+                        failed += 1
 
         conn.commit()
+    page_cache.invalidate(row["pmid"] for row in fetched)
 
-    print(f"AI scored {processed} articles, failed {failed}, model={AI_MODEL}")
+    print(f"AI scored {processed} articles, failed {failed}, gated {len(gated)}, model={AI_MODEL}")
+    if gated:
+        print(f"Gated: {llm_gate.summarize(gated)}")
 
 
 if __name__ == "__main__":
-    main()
-
+    if AI_SCORE_MODE == "batch":
+        main_batch()
+    else:
+        main()
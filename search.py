@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+search.py
+Indexed article search for the app.py search box.
+
+- search_vector: stored tsvector generated from title (weight A), abstract
+  (B) and journal (C), GIN-indexed; queried with websearch_to_tsquery, so
+  quotes, OR and -exclusions work as users expect.
+- Trigram GIN indexes on title and journal serve substring (ILIKE) matches
+  for partial words.
+- All-digit queries try an exact PMID lookup first.
+- One query returns the page and the total (count(*) OVER ()).
+
+With the default "rank" sort, results are ordered by text relevance blended
+with rank_score (SEARCH_RELEVANCE_WEIGHT, default 0.6 relevance).
+
+Install the schema once (ingest only checks that it is there):
+  python search.py --install
+  python search.py "lrrk2 inhibitor"
+"""
+
+import os
+import sys
+
+import psycopg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
+RELEVANCE_WEIGHT = float(os.getenv("SEARCH_RELEVANCE_WEIGHT", "0.6"))
+MIN_SUBSTRING = 3  # trigram indexes can't serve shorter patterns
+
+# the ALTER rewrites public.articles, so it only runs while the column is missing
+ENSURE_SCHEMA = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'articles' AND column_name = 'search_vector'
+    ) THEN
+        ALTER TABLE public.articles ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', COALESCE(title, '')), 'A')
+            || setweight(to_tsvector('english', COALESCE(abstract, '')), 'B')
+            || setweight(to_tsvector('simple', COALESCE(journal, '')), 'C')
+        ) STORED;
+    END IF;
+END
+$$;
+"""
+
+INDEXES = {
+    "articles_search_vector_idx": "ON public.articles USING gin (search_vector)",
+    "articles_title_trgm_idx": "ON public.articles USING gin (title gin_trgm_ops)",
+    "articles_journal_trgm_idx": "ON public.articles USING gin (journal gin_trgm_ops)",
+}
+
+# a failed CONCURRENTLY build leaves an invalid index that IF NOT EXISTS would keep
+INVALID_INDEXES = """
+SELECT c.relname
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+WHERE NOT i.indisvalid AND c.relname = ANY(%s)
+"""
+
+MISSING_INDEXES = """
+SELECT name
+FROM unnest(%s::text[]) AS name
+WHERE to_regclass('public.' || name) IS NULL
+"""
+
+# Columns the list views render, in this order
+LIST_COLUMNS = """
+    pmid,
+    title,
+    journal,
+    publication_date,
+    ai_score,
+    base_score,
+    rank_score,
+    ai_summary,
+    why_it_matters
+"""
+
+BY_PMID = """
+SELECT {columns}, count(*) OVER () AS total
+FROM public.articles
+WHERE pmid = %(pmid)s
+"""
+
+# {match} and {order} are filled from fixed fragments below, never user input
+BY_TEXT = """
+SELECT {columns}, count(*) OVER () AS total
+FROM public.articles a,
+     websearch_to_tsquery('english', %(q)s) AS query
+WHERE {match}
+ORDER BY {order}
+LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+# Same match without the window count or paging, for streaming every match
+ALL_BY_TEXT = """
+SELECT {columns}
+FROM public.articles a,
+     websearch_to_tsquery('english', %(q)s) AS query
+WHERE {match}
+ORDER BY {order}
+"""
+
+ALL_BY_PMID = """
+SELECT {columns}
+FROM public.articles
+WHERE pmid = %(pmid)s
+"""
+
+MATCH_FTS = "a.search_vector @@ query"
+MATCH_FTS_OR_SUBSTRING = "(a.search_vector @@ query OR a.title ILIKE %(like)s OR a.journal ILIKE %(like)s)"
+
+RELEVANCE_ORDER = """
+    (%(w)s * 100 * ts_rank_cd(a.search_vector, query, 32)
+     + (1 - %(w)s) * COALESCE(a.rank_score, 0)) DESC,
+    rank_score DESC NULLS LAST,
+    publication_date DESC NULLS LAST,
+    created_at DESC
+"""
+
+
+def create_indexes(conn, indexes: dict[str, str], replaces: tuple = ()):
+    """
+    CREATE INDEX CONCURRENTLY each {name: definition}, so writers and
+    readers keep going while they build, then drop the indexes they
+    replace (also concurrently). CONCURRENTLY can't run inside a
+    transaction: the connection is switched to autocommit meanwhile.
+    """
+    conn.commit()
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        for (name,) in conn.execute(INVALID_INDEXES, (list(indexes),)).fetchall():
+            conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS public.{name}")
+        for name, definition in indexes.items():
+            conn.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+        for name in replaces:
+            conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS public.{name}")
+    finally:
+        conn.autocommit = autocommit
+
+
+def missing_indexes(cur, names) -> list[str]:
+    cur.execute(MISSING_INDEXES, (list(names),))
+    return [row[0] for row in cur.fetchall()]
+
+
+def ensure_schema(conn):
+    """
+    Adding the generated column rewrites public.articles once; run it
+    from a batch job or --install, not a web request.
+    """
+    with conn.cursor() as cur:
+        cur.execute(ENSURE_SCHEMA)
+    create_indexes(conn, INDEXES)
+
+
+def like_pattern(q: str) -> str:
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def search(cur, q: str, order_by: str | None, limit: int, offset: int,
+           columns: str = LIST_COLUMNS) -> tuple[list[tuple], int]:
+    """
+    One page of matches for q plus the total match count. Rows have the
+    layout of columns (trusted SQL, default LIST_COLUMNS). order_by is a
+    trusted ORDER BY clause; None ranks by relevance blended with rank_score.
+    """
+    q = q.strip()
+    if not q:
+        return [], 0
+
+    if q.isdigit():
+        cur.execute(BY_PMID.format(columns=columns), {"pmid": int(q)})
+        rows = cur.fetchall()
+        if rows:
+            return [r[:-1] for r in rows][offset:offset + limit], rows[0][-1]
+
+    match = MATCH_FTS_OR_SUBSTRING if len(q) >= MIN_SUBSTRING else MATCH_FTS
+    sql = BY_TEXT.format(columns=columns, match=match, order=order_by or RELEVANCE_ORDER)
+    cur.execute(sql, {
+        "q": q,
+        "like": like_pattern(q),
+        "w": RELEVANCE_WEIGHT,
+        "limit": limit,
+        "offset": offset,
+    })
+    rows = cur.fetchall()
+    total = rows[0][-1] if rows else 0
+    return [r[:-1] for r in rows], total
+
+
+def stream_query(cur, q: str, order_by: str | None, columns: str = LIST_COLUMNS) -> tuple[str, dict]:
+    """
+    (sql, params) selecting every match for q in search() order, for a
+    server-side cursor. cur is only used for the exact-PMID probe.
+    """
+    q = q.strip()
+    if q.isdigit():
+        cur.execute("SELECT 1 FROM public.articles WHERE pmid = %s", (int(q),))
+        if cur.fetchone():
+            return ALL_BY_PMID.format(columns=columns), {"pmid": int(q)}
+
+    match = MATCH_FTS_OR_SUBSTRING if len(q) >= MIN_SUBSTRING else MATCH_FTS
+    sql = ALL_BY_TEXT.format(columns=columns, match=match, order=order_by or RELEVANCE_ORDER)
+    return sql, {"q": q, "like": like_pattern(q), "w": RELEVANCE_WEIGHT}
+
+
+def main():
+    if not DATABASE_URL:
+        raise SystemExit("Missing DATABASE_URL")
+
+    with psycopg.connect(DATABASE_URL) as conn:
+        if "--install" in sys.argv:
+            ensure_schema(conn)
+            print("[search] schema installed")
+            return
+
+        q = " ".join(a for a in sys.argv[1:] if not a.startswith("--"))
+        with conn.cursor() as cur:
+            rows, total = search(cur, q, None, 10, 0)
+        print(f"{total} matches for {q!r}")
+        for r in rows:
+            print(f"{r[0]:>10}  {r[6] if r[6] is not None else '-':>6}  {(r[1] or '')[:90]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+stats.py
+Maintained article counters for the home page hero panel.
+
+public.article_stats holds total / ranked / ai_scored base counts.
+Statement-level triggers on public.articles append the net change of each
+INSERT, UPDATE, DELETE (via transition tables) to
+public.article_stats_deltas and reset on TRUNCATE, so the counters stay
+exact without any job recounting. Writers only ever insert delta rows, so
+concurrent jobs never wait on each other's counter locks (a long LLM batch
+holding a shared counter row used to block, and deadlock, other writers).
+Reads add the pending deltas to the base; compact() folds them in and runs
+from ensure_schema() (every ingest) or --compact.
+
+get_counts() reads the three rows through an in-process TTL cache
+(STATS_TTL seconds, default 30): most page views run no stats query at all.
+
+Usage:
+  python stats.py --install    # triggers (+ exact count on first install)
+  python stats.py --refresh    # exact recount (repairs drift)
+  python stats.py --compact    # fold pending deltas into the base counts
+  python stats.py
+"""
+
+import os
+import sys
+import threading
+import time
+
+import psycopg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
+STATS_TTL = float(os.getenv("STATS_TTL", "30"))
+
+KEYS = ("total", "ranked", "ai_scored")
+
+ENSURE_SCHEMA = """
+SELECT pg_advisory_xact_lock(hashtext('stats.ensure_schema'));
+
+CREATE TABLE IF NOT EXISTS public.article_stats (
+    key TEXT PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS public.article_stats_deltas (
+    id BIGSERIAL PRIMARY KEY,
+    d_total BIGINT NOT NULL,
+    d_ranked BIGINT NOT NULL,
+    d_ai BIGINT NOT NULL,
+    at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- append-only: no writer ever updates a shared row
+CREATE OR REPLACE FUNCTION public.article_stats_bump(d_total BIGINT, d_ranked BIGINT, d_ai BIGINT)
+RETURNS void LANGUAGE plpgsql AS $$
+BEGIN
+    IF d_total <> 0 OR d_ranked <> 0 OR d_ai <> 0 THEN
+        INSERT INTO public.article_stats_deltas (d_total, d_ranked, d_ai) VALUES (d_total, d_ranked, d_ai);
+    END IF;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.article_stats_on_change() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    n_total BIGINT := 0; n_ranked BIGINT := 0; n_ai BIGINT := 0;
+    o_total BIGINT := 0; o_ranked BIGINT := 0; o_ai BIGINT := 0;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM public.article_stats_deltas;
+        UPDATE public.article_stats SET value = 0, updated_at = NOW();
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT count(*), count(rank_score), count(ai_score) INTO n_total, n_ranked, n_ai FROM new_rows;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT count(*), count(rank_score), count(ai_score) INTO o_total, o_ranked, o_ai FROM old_rows;
+    END IF;
+    PERFORM public.article_stats_bump(n_total - o_total, n_ranked - o_ranked, n_ai - o_ai);
+    RETURN NULL;
+END
+$$;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'article_stats_insert' AND tgrelid = 'public.articles'::regclass) THEN
+        CREATE TRIGGER article_stats_insert AFTER INSERT ON public.articles
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION public.article_stats_on_change();
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'article_stats_update' AND tgrelid = 'public.articles'::regclass) THEN
+        CREATE TRIGGER article_stats_update AFTER UPDATE ON public.articles
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION public.article_stats_on_change();
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'article_stats_delete' AND tgrelid = 'public.articles'::regclass) THEN
+        CREATE TRIGGER article_stats_delete AFTER DELETE ON public.articles
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION public.article_stats_on_change();
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'article_stats_truncate' AND tgrelid = 'public.articles'::regclass) THEN
+        CREATE TRIGGER article_stats_truncate AFTER TRUNCATE ON public.articles
+        FOR EACH STATEMENT EXECUTE FUNCTION public.article_stats_on_change();
+    END IF;
+END
+$$;
+"""
+
+# Writers are blocked for the duration of the recount, so every delta is
+# committed and covered by the count
+REFRESH = """
+LOCK TABLE public.articles IN SHARE MODE;
+
+DELETE FROM public.article_stats_deltas;
+
+INSERT INTO public.article_stats (key, value)
+SELECT k, v
+FROM (
+    SELECT count(*) AS total, count(rank_score) AS ranked, count(ai_score) AS ai_scored
+    FROM public.articles
+) c,
+LATERAL (VALUES ('total', c.total), ('ranked', c.ranked), ('ai_scored', c.ai_scored)) AS x(k, v)
+ON CONFLICT (key) DO UPDATE
+SET value = EXCLUDED.value,
+    updated_at = NOW();
+"""
+
+SELECT_COUNTS = """
+SELECT s.key, s.value + COALESCE(CASE s.key WHEN 'total' THEN d.t WHEN 'ranked' THEN d.r ELSE d.a END, 0)
+FROM public.article_stats s
+CROSS JOIN (
+    SELECT sum(d_total) AS t, sum(d_ranked) AS r, sum(d_ai) AS a
+    FROM public.article_stats_deltas
+) d
+"""
+
+# concurrent compactions are safe: a delta row is deleted (and counted) once
+COMPACT = """
+WITH moved AS (
+    DELETE FROM public.article_stats_deltas
+    RETURNING d_total, d_ranked, d_ai
+), d AS (
+    SELECT COALESCE(sum(d_total), 0) AS t, COALESCE(sum(d_ranked), 0) AS r, COALESCE(sum(d_ai), 0) AS a
+    FROM moved
+)
+UPDATE public.article_stats s
+SET value = s.value + CASE s.key WHEN 'total' THEN d.t WHEN 'ranked' THEN d.r ELSE d.a END,
+    updated_at = NOW()
+FROM d
+WHERE d.t <> 0 OR d.r <> 0 OR d.a <> 0
+"""
+
+LIVE_COUNTS = """
+SELECT count(*), count(rank_score), count(ai_score)
+FROM public.articles
+"""
+
+_lock = threading.Lock()
+_cache: tuple[float, dict] | None = None
+
+
+def ensure_schema(conn):
+    """
+    Install the counters and triggers; the first install also seeds them
+    with an exact count, later calls compact the deltas.
+    """
+    with conn.cursor() as cur:
+        cur.execute(ENSURE_SCHEMA)
+        cur.execute("SELECT count(*) FROM public.article_stats")
+        if cur.fetchone()[0] < len(KEYS):
+            cur.execute(REFRESH)
+        else:
+            cur.execute(COMPACT)
+    conn.commit()
+
+
+def compact(conn):
+    with conn.cursor() as cur:
+        cur.execute(COMPACT)
+    conn.commit()
+
+
+def refresh(conn):
+    with conn.cursor() as cur:
+        cur.execute(REFRESH)
+    conn.commit()
+
+
+def read_counts(conn) -> dict[str, int]:
+    """
+    Counters straight from the database. Falls back to one live count if
+    the counters were never installed.
+    """
+    try:
+        counts = dict(conn.execute(SELECT_COUNTS).fetchall())
+    except psycopg.errors.UndefinedTable:
+        conn.rollback()
+        counts = {}
+    if not all(k in counts for k in KEYS):
+        counts = dict(zip(KEYS, conn.execute(LIVE_COUNTS).fetchone()))
+    return {k: int(counts[k]) for k in KEYS}
+
+
+def get_counts(conn) -> dict[str, int]:
+    """
+    read_counts() behind a process-wide TTL cache.
+    """
+    global _cache
+    now = time.monotonic()
+    cached = _cache
+    if cached and cached[0] > now:
+        return cached[1]
+
+    with _lock:
+        cached = _cache
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        counts = read_counts(conn)
+        _cache = (time.monotonic() + STATS_TTL, counts)
+        return counts
+
+
+def main():
+    if not DATABASE_URL:
+        raise SystemExit("Missing DATABASE_URL")
+
+    with psycopg.connect(DATABASE_URL) as conn:
+        if "--install" in sys.argv:
+            ensure_schema(conn)
+            print("[stats] counters installed")
+        elif "--refresh" in sys.argv:
+            refresh(conn)
+            print("[stats] counters refreshed")
+        elif "--compact" in sys.argv:
+            compact(conn)
+            print("[stats] deltas compacted")
+
+        for key, value in read_counts(conn).items():
+            print(f"{key:<10} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,18 @@
 #!/usr/bin/env python3
 import os
 import json
-import time
 import traceback
-from typing import Any, Dict, Optional
+from typing import Any, Dict
 
 from dotenv import load_dotenv
 from openai import OpenAI
 
 from db import get_conn
+from agents import schemas
+from agents.llm_cache import Scope, prompt_version
+from agents.prompting import compact_abstract
+import page_cache
+import paper_docs
 
 # =========================
 # Debug Controls
@@ -34,13 +38,13 @@ load_dotenv()
 
 MODEL = os.environ.get("OPENAI_MODEL", "gpt-4.1-mini")
 BATCH = int(os.environ.get("SUMMARY_BATCH", "5"))
-SLEEP_SECS = float(os.environ.get("SUMMARY_SLEEP", "0.4"))
 
 API_KEY = os.environ.get("OPENAI_API_KEY", "")
+BASE_URL = os.environ.get("OPENAI_BASE_URL", "").strip()  # e.g. mock_llm_server.py
 if not API_KEY:
     raise RuntimeError("OPENAI_API_KEY not found in environment. Put it in .env or export it.")
 
-client = OpenAI(api_key=API_KEY)
+client = OpenAI(api_key=API_KEY, base_url=BASE_URL or None)
 
 # =========================
 # Prompting
@@ -62,31 +66,7 @@ Return STRICT JSON ONLY as a single object that starts with "{{" and ends with "
 No markdown, no commentary.
 
 Schema:
-{{
-  "plain_summary": "string",
-  "technical_summary": ["string", "..."],
-  "signals": {{
-    "diseases": ["Parkinson's", "Alzheimer's"],
-    "study_type": "basic|preclinical|clinical|review|other",
-    "models": ["mouse", "cell culture", "human cohort"],
-    "mechanisms": ["string"],
-    "targets_pathways": ["string"],
-    "compounds_interventions": [
-      {{
-        "name": "string",
-        "type": "drug|natural|device|behavioral|other",
-        "notes": "string"
-      }}
-    ],
-    "biomarkers": ["string"],
-    "outcomes": ["string"],
-    "trial_phase": "preclinical|phase1|phase2|phase3|phase4|na",
-    "repurposing_signal": true,
-    "novelty_signal": "low|medium|high",
-    "confidence": 0.0,
-    "notes": "string"
-  }}
-}}
+{{"plain_summary":"string","technical_summary":["string","..."],"signals":{{"diseases":["Parkinson's","Alzheimer's"],"study_type":"basic|preclinical|clinical|review|other","models":["mouse","cell culture","human cohort"],"mechanisms":["string"],"targets_pathways":["string"],"compounds_interventions":[{{"name":"string","type":"drug|natural|device|behavioral|other","notes":"string"}}],"biomarkers":["string"],"outcomes":["string"],"trial_phase":"preclinical|phase1|phase2|phase3|phase4|na","repurposing_signal":true,"novelty_signal":"low|medium|high","confidence":0.0,"notes":"string"}}}}
 
 Title: {title}
 
@@ -95,92 +75,24 @@ Abstract:
 """
 
 
-# =========================
-# JSON repair (fallback only)
-# =========================
-def repair_json(text: str) -> str:
-    s = (text or "").strip()
-
-    # Strip code fences if present
-    if s.startswith("```"):
-        # remove fences crudely
-        s = s.strip()
-        s = s.strip("`").strip()
-        if "\n" in s:
-            first, rest = s.split("\n", 1)
-            if first.strip().lower().startswith("json"):
-                s = rest.strip()
-
-    s = s.strip()
-
-    # If model returned a fragment missing braces, wrap it
-    if s.startswith('"plain_summary"') or s.startswith("'plain_summary'"):
-        s = "{\n" + s + "\n}"
-
-    # If there are braces somewhere, slice to outermost
-    if "{" in s and "}" in s:
-        start = s.find("{")
-        end = s.rfind("}")
-        if start != -1 and end != -1 and end > start:
-            s = s[start : end + 1]
-
-    return s
+CACHE = Scope(MODEL, prompt_version(SYSTEM, PROMPT, json.dumps(schemas.SUMMARY, sort_keys=True)))
 
-# =========================
-# Response parsing helpers
-# =========================
-def try_extract_structured_json(resp) -> Optional[Dict[str, Any]]:
-    """
-    Tries to extract a parsed JSON object from OpenAI Responses API result.
-    We prefer structured access; if SDK shape changes, we gracefully return None.
-    """
-    try:
-        out = getattr(resp, "output", None)
-        if not out:
-            return None
-
-        for item in out:
-            content = getattr(item, "content", None)
-            if not content:
-                continue
-
-            for part in content:
-                ptype = getattr(part, "type", None)
-
-                # Newer SDKs typically provide JSON parts like output_json
-                if ptype in ("output_json", "json", "response_json"):
-                    pj = getattr(part, "json", None)
-                    if isinstance(pj, dict):
-                        return pj
-
-                # Sometimes part.json exists even if type differs
-                pj = getattr(part, "json", None)
-                if isinstance(pj, dict):
-                    return pj
-
-        return None
-    except Exception:
-        return None
 
 def call_llm(title: str, abstract: str) -> dict:
     text = PROMPT.format(
         title=title.strip(),
-        abstract=(abstract or "").strip()
+        abstract=compact_abstract(abstract)
     )
-
-    resp = client.chat.completions.create(
+    # validated against schemas.SUMMARY; only invalid fields are re-asked
+    return CACHE.call(text, lambda: schemas.complete(
+        client,
+        api="chat",
         model=MODEL,
-        messages=[
-            {"role": "system", "content": SYSTEM},
-            {"role": "user", "content": text},
-        ],
+        schema=schemas.SUMMARY,
+        system=SYSTEM,
+        user=text,
         temperature=0.2,
-        response_format={"type": "json_object"},
-    )
-
-    # This content is guaranteed to be valid JSON text
-    content = resp.choices[0].message.content
-    return json.loads(content)
+    ))
 
 
 # =========================
@@ -210,6 +122,7 @@ def main():
 
     # Fetch articles missing signals summary
     with get_conn() as conn:
+        paper_docs.ensure_schema(conn)
         with conn.cursor() as cur:
             cur.execute(
                 """
@@ -231,6 +144,7 @@ def main():
         return
 
     processed = 0
+    pmids = []
 
     for article_id, title, abstract in rows:
         print(f"[summaries] working on article_id={article_id}")
@@ -238,17 +152,10 @@ def main():
         # IMPORTANT: do not swallow errors during debugging
         data = call_llm(title, abstract or "")
 
-        # Validate schema keys early (crash if missing)
-        plain = (data.get("plain_summary") or "").strip()
-        technical_list = data.get("technical_summary") or []
-        signals = data.get("signals") or {}
-
-        if not isinstance(technical_list, list):
-            raise RuntimeError("technical_summary is not a list")
-        if not isinstance(signals, dict):
-            raise RuntimeError("signals is not an object")
+        plain = data["plain_summary"]
+        signals = data["signals"]
 
-        technical = "\n".join([f"- {str(x).strip()}" for x in technical_list if str(x).strip()])
+        technical = "\n".join(f"- {x}" for x in data["technical_summary"])
         metadata = {"signals": signals}
         signals_text = json.dumps(signals, ensure_ascii=False, indent=2)
 
@@ -257,12 +164,13 @@ def main():
                 upsert_summary(cur2, article_id, "plain", plain, metadata)
                 upsert_summary(cur2, article_id, "technical", technical, metadata)
                 upsert_summary(cur2, article_id, "signals", signals_text, metadata)
+                pmids += paper_docs.rebuild(cur2, ids=[article_id])
             conn2.commit()
 
         processed += 1
         print(f"[summaries] article_id={article_id} OK (plain+technical+signals)")
-        time.sleep(SLEEP_SECS)
 
+    page_cache.invalidate(pmids)
     print(f"[summaries] done. processed={processed}")
 
 if __name__ == "__main__":
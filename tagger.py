@@ -1,5 +1,7 @@
 import re
-from db import execute
+
+import aggregates
+from db import execute, get_conn
 
 NATURAL_RE = re.compile(r"\b(plant|herbal|herb|extract|phytochemical|polyphenol|flavonoid|natural product|botanical|ayurvedic|traditional medicine)\b", re.I)
 REPURPOSE_RE = re.compile(r"\b(repurpose|reposition|drug reposition|off-label|discontinued|terminated|withdrawn|failed trial|suspended)\b", re.I)
@@ -56,6 +58,10 @@ def main():
 
     print(f"Tagged {updated} papers.")
 
+    with get_conn() as conn:
+        aggregates.refresh(conn, ["tag_counts"])
+    print("Refreshed tag aggregates.")
+
 if __name__ == "__main__":
     main()
 